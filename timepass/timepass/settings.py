@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'users.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,6 +67,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'users.context_processors.appointments',
             ],
         },
     },
@@ -75,12 +78,44 @@ WSGI_APPLICATION = 'timepass.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgres for production; the SQLite file suits small deployments.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'timepass'),
+            'USER': os.environ.get('POSTGRES_USER', 'timepass'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Keep connections open across requests and check them before reuse
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # Server-side cursors don't survive pgbouncer's transaction pooling
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('POSTGRES_PGBOUNCER', '') == '1',
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
     }
-}
+
+# Applied to every new SQLite connection: WAL lets readers run alongside the
+# writer, NORMAL sync is safe under WAL, and writers wait for the lock
+# instead of failing with "database is locked". SQLITE_TUNED=0 keeps the
+# SQLite defaults.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 128 * 1024 * 1024)),
+} if os.environ.get('SQLITE_TUNED', '1') == '1' else {}
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -100,6 +135,76 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# https://docs.djangoproject.com/en/5.0/topics/auth/passwords/
+# PASSWORD_HASHER picks the hasher for new passwords: scrypt, argon2 (needs
+# argon2-cffi) or pbkdf2. The others stay listed so existing hashes still
+# verify; they are re-encoded with the preferred hasher on the next login.
+
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'scrypt')
+PASSWORD_HASHER_CHOICES = {
+    'scrypt': 'users.hashers.TunedScryptPasswordHasher',
+    'argon2': 'users.hashers.TunedArgon2PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [PASSWORD_HASHER_CHOICES[PASSWORD_HASHER]] + [
+    hasher for name, hasher in PASSWORD_HASHER_CHOICES.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14))
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.environ.get('PASSWORD_SCRYPT_BLOCK_SIZE', 8))
+PASSWORD_SCRYPT_PARALLELISM = int(os.environ.get('PASSWORD_SCRYPT_PARALLELISM', 1))
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 19456))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', 1))
+# Threads that run password hashing; defaults to one per CPU
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 0))
+
+AUTHENTICATION_BACKENDS = ['users.backends.PooledModelBackend']
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+# A cache shared by all processes, e.g. Redis or a compatible stand-in
+if os.environ.get('SHARED_CACHE_URL'):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['SHARED_CACHE_URL'],
+    }
+
+# Sessions: 'cached_db' reads from the cache and writes through to the
+# database only when the session changed; 'signed_cookies' keeps the session
+# in the cookie and never touches the database; 'db' is Django's default.
+# 'cached_db' needs the shared cache: with a cache per process, a session
+# flushed by one process would stay valid in the others.
+SESSION_STORE = os.environ.get('SESSION_STORE', 'cached_db' if 'shared' in CACHES else 'db')
+if SESSION_STORE == 'cached_db' and 'shared' not in CACHES:
+    raise ImproperlyConfigured("SESSION_STORE 'cached_db' requires SHARED_CACHE_URL")
+SESSION_ENGINE = {
+    'cached_db': 'users.sessions',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'db': 'django.contrib.sessions.backends.db',
+}[SESSION_STORE]
+SESSION_CACHE_ALIAS = 'shared' if 'shared' in CACHES else 'default'
+
+# Sliding-window limits on login and password reset attempts, as
+# (attempts, seconds) per client IP, per account, and per account from each
+# client IP. The per-account limit is higher, so attempts from elsewhere
+# lock the owner out only at volumes that look like a distributed attack.
+# 'local' counts in each process; 'cache' counts in RATELIMIT_CACHE so all
+# processes share limits.
+RATELIMIT_BACKEND = os.environ.get('RATELIMIT_BACKEND', 'cache' if 'shared' in CACHES else 'local')
+RATELIMIT_CACHE = 'shared' if 'shared' in CACHES else 'default'
+# e.g. HTTP_X_FORWARDED_FOR behind proxies, with the number of proxies that append to it
+RATELIMIT_IP_HEADER = os.environ.get('RATELIMIT_IP_HEADER', 'REMOTE_ADDR')
+RATELIMIT_TRUSTED_PROXIES = int(os.environ.get('RATELIMIT_TRUSTED_PROXIES', 1))
+# Only for load tests and local runs; never turn limits off in production
+RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', '1') == '1'
+RATELIMITS = {
+    'login': {'ip': (30, 300), 'account': (50, 900), 'account_ip': (10, 900)},
+    'password_reset': {'ip': (10, 3600), 'account': (6, 3600), 'account_ip': (3, 3600)},
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -120,6 +225,82 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles_build', 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Renditions are content addressed, so browsers may cache them for a year
+MEDIA_IMMUTABLE_MAX_AGE = 31536000
+
+# Public feed: keyset page size and lifetime of the cached first page per category
+FEED_PAGE_SIZE = int(os.environ.get('FEED_PAGE_SIZE', 24))
+FEED_CACHE_TIMEOUT = int(os.environ.get('FEED_CACHE_TIMEOUT', 300))
+
+# Full-text tweet search: results per page, how deep pages go, words per
+# query and how many of the newest matches are ranked
+SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', 24))
+SEARCH_MAX_PAGES = 20
+SEARCH_RANK_WINDOW = int(os.environ.get('SEARCH_RANK_WINDOW', 1000))
+SEARCH_MAX_TERMS = 8
+
+# Uploaded images are resized off the request path by `manage.py process_image_jobs`
+IMAGE_RENDITION_FORMATS = os.environ.get('IMAGE_RENDITION_FORMATS', 'avif,webp').split(',')
+IMAGE_RENDITION_QUALITY = int(os.environ.get('IMAGE_RENDITION_QUALITY', 80))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 4))
+IMAGE_JOB_MAX_ATTEMPTS = 3
+IMAGE_JOB_STALE_AFTER = 600
+
+# Appointment availability for doctors without their own WorkingHours
+DEFAULT_WORKING_HOURS = ('09:00', '17:00')
+DEFAULT_WORKING_DAYS = [0, 1, 2, 3, 4]
+DEFAULT_SLOT_MINUTES = 30
+AVAILABILITY_MAX_DAYS = 31
+# How long a reserved slot is held for a patient before it is released
+SLOT_HOLD_SECONDS = int(os.environ.get('SLOT_HOLD_SECONDS', 120))
+# Each user's next appointment dates, shown on every page; invalidated on
+# appointment changes, which only reach other processes through a shared cache
+NEXT_APPOINTMENT_CACHE = 'shared' if 'shared' in CACHES else 'default'
+NEXT_APPOINTMENT_CACHE_SECONDS = int(os.environ.get('NEXT_APPOINTMENT_CACHE_SECONDS', 300))
+
+DOCTOR_DIRECTORY_PAGE_SIZE = 50
+# How long each process serves its copy of the speciality list before reloading it
+SPECIALITIES_CACHE_SECONDS = int(os.environ.get('SPECIALITIES_CACHE_SECONDS', 60))
+
+# Request instrumentation: every request feeds the /metrics aggregates, a
+# sample of them (and every slow one) is logged as structured JSON
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_LOG_SAMPLE_RATE = float(os.environ.get('METRICS_LOG_SAMPLE_RATE', 0.01))
+METRICS_SLOW_REQUEST_MS = int(os.environ.get('METRICS_SLOW_REQUEST_MS', 500))
+METRICS_WINDOW = 1000
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'users.instrumentation.JsonFormatter'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'loggers': {
+        'timepass': {'handlers': ['console'], 'level': os.environ.get('LOG_LEVEL', 'INFO'), 'propagate': False},
+        'users': {'handlers': ['console'], 'level': os.environ.get('LOG_LEVEL', 'INFO'), 'propagate': False},
+    },
+}
+
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '') == '1'
+EMAIL_TIMEOUT = 10
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
+
+# Emails are queued in OutboundEmail and sent by `manage.py send_emails --loop`,
+# retried with exponential backoff and kept as dead after OUTBOX_MAX_ATTEMPTS
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_RETRY_BASE = 30
+OUTBOX_RETRY_MAX = 3600
+OUTBOX_STALE_AFTER = 600
+APPOINTMENT_REMINDER_HOURS = int(os.environ.get('APPOINTMENT_REMINDER_HOURS', 24))
 
 LOGIN_REDIRECT_URL = '/'
 LOGIN_URL = 'login'
@@ -131,5 +312,34 @@ OAUTH2_PROVIDER = {
     'CLIENT_SECRET': os.environ.get('CLIENT_SECRET'),
 }
 
-GOOGLE_TOKEN_FILE = os.path.join(BASE_DIR, 'token.json')
 GOOGLE_CLIENT_SECRET_FILE = os.path.join(BASE_DIR, 'credentials.json')
+GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID', '')
+GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET', '')
+GOOGLE_TOKEN_URI = os.environ.get('GOOGLE_TOKEN_URI', 'https://oauth2.googleapis.com/token')
+GOOGLE_CALENDAR_SCOPES = [
+    'https://www.googleapis.com/auth/calendar.readonly',
+    'https://www.googleapis.com/auth/calendar.events.readonly',
+    'https://www.googleapis.com/auth/calendar.events',
+]
+
+# Doctors' calendars are mirrored into CalendarEvent by `manage.py sync_calendars`.
+# Point GOOGLE_CALENDAR_API_URL at `manage.py fake_calendar_api` to run it locally.
+GOOGLE_CALENDAR_API_URL = os.environ.get('GOOGLE_CALENDAR_API_URL', 'https://www.googleapis.com')
+GOOGLE_CALENDAR_TIMEOUT = 10
+GOOGLE_CALENDAR_PAGE_SIZE = 250
+GOOGLE_CALENDAR_BATCH_SIZE = 50
+
+# Per-user OAuth tokens are stored encrypted (users.tokens). Comma separated
+# Fernet keys, newest first; without any, a key is derived from SECRET_KEY.
+TOKEN_ENCRYPTION_KEYS = [key for key in os.environ.get('TOKEN_ENCRYPTION_KEYS', '').split(',') if key]
+# Access tokens are renewed this many seconds before they expire, by a thread
+# in each process when TOKEN_BACKGROUND_REFRESH=1 or by `manage.py refresh_oauth_tokens --loop`
+TOKEN_BACKGROUND_REFRESH = os.environ.get('TOKEN_BACKGROUND_REFRESH', '') == '1'
+TOKEN_REFRESH_MARGIN = 300
+TOKEN_REFRESH_INTERVAL = 60
+TOKEN_MAX_REFRESH_FAILURES = 5
+# In-memory copies are re-read from the database this close to expiry
+TOKEN_RELOAD_MARGIN = 60
+# How long one process may hold the refresh of a token, longer than the token
+# request can take; the others wait for it and read the renewed token
+TOKEN_REFRESH_LEASE = 30
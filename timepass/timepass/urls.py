@@ -1,11 +1,13 @@
+import re
+
 from django.contrib import admin
 
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
 from django.contrib.auth import views as auth_views
-from users.views import CustomLoginView, ResetPasswordView, ChangePasswordView
+from users.views import CustomLoginView, ResetPasswordView, ChangePasswordView, serve_media
 
 from users.forms import LoginForm
 
@@ -29,4 +31,6 @@ urlpatterns = [
 
     path('password-change/', ChangePasswordView.as_view(), name='password_change'),
 
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT) + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+
+] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -2,4 +2,41 @@ from django.contrib import admin
 from .models import *
 
 admin.site.register(Tweet)
-admin.site.register(Appointment)
\ No newline at end of file
+admin.site.register(Appointment)
+admin.site.register(WorkingHours)
+admin.site.register(Speciality)
+
+
+@admin.register(BookingStats)
+class BookingStatsAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'bookings', 'conflicts', 'expired_holds')
+    ordering = ('-conflicts',)
+
+
+@admin.register(CategoryStats)
+class CategoryStatsAdmin(admin.ModelAdmin):
+    list_display = ('category', 'published')
+
+
+@admin.register(AuthorStats)
+class AuthorStatsAdmin(admin.ModelAdmin):
+    list_display = ('author', 'published')
+    ordering = ('-published',)
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('source_name', 'field_name', 'status', 'attempts', 'updated_at')
+    list_filter = ('status',)
+
+
+@admin.register(CalendarSync)
+class CalendarSyncAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'calendar_id', 'synced_at', 'last_error')
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to', 'subject')
@@ -6,4 +6,5 @@ class UserConfig(AppConfig):
     name = 'users'
 
     def ready(self):
+        import users.checks  # noqa
         import users.signals  # noqa
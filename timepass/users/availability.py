@@ -0,0 +1,123 @@
+import datetime
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .models import Appointment, SlotHold, WorkingHours
+
+
+class IntervalIndex:
+    """
+    Booked [start, end) intervals grouped by key, answering "does anything
+    overlap this range?" in O(log n) with a bisect over the sorted starts
+    and a running maximum of the ends.
+    """
+
+    def __init__(self):
+        self._intervals = defaultdict(list)
+        self._index = {}
+
+    def add(self, key, start, end):
+        self._intervals[key].append((start, end))
+        self._index.pop(key, None)
+
+    def _build(self, key):
+        intervals = sorted(self._intervals.get(key, ()))
+        starts = [start for start, _ in intervals]
+        max_ends = []
+        for _, end in intervals:
+            max_ends.append(max(end, max_ends[-1]) if max_ends else end)
+        self._index[key] = (starts, max_ends)
+        return starts, max_ends
+
+    def overlaps(self, key, start, end):
+        starts, max_ends = self._index.get(key) or self._build(key)
+        # Intervals starting before `end` are candidates; one of them overlaps
+        # iff the furthest any of them reaches is past `start`.
+        position = bisect_left(starts, end)
+        return position > 0 and max_ends[position - 1] > start
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _as_time(minutes):
+    return datetime.time(minutes // 60, minutes % 60)
+
+
+def default_working_hours():
+    """
+    Weekly template used for doctors that haven't configured their own hours.
+    """
+    start, end = (datetime.time.fromisoformat(t) for t in settings.DEFAULT_WORKING_HOURS)
+    return {
+        weekday: [(_minutes(start), _minutes(end), settings.DEFAULT_SLOT_MINUTES)]
+        for weekday in settings.DEFAULT_WORKING_DAYS
+    }
+
+
+def find_free_slots(speciality, start_date, end_date, doctor_id=None, now=None):
+    """
+    Free appointment slots for every doctor of ``speciality`` (a Speciality
+    or its id) between
+    ``start_date`` and ``end_date`` inclusive.
+
+    Runs a fixed four queries however many doctors match: the doctors,
+    their working-hour templates, and the appointments and live holds
+    already taking slots in the range. Returns a list of ``{'id', 'name', 'slots': {date: [time, ...]}}``.
+    """
+    now = timezone.localtime(now or timezone.now())
+    doctors = User.objects.filter(profile__user_type='doctor', profile__speciality=speciality)
+    if doctor_id:
+        doctors = doctors.filter(pk=doctor_id)
+    doctors = list(doctors.order_by('first_name', 'last_name', 'pk').only('id', 'first_name', 'last_name', 'username'))
+    if not doctors:
+        return []
+    doctor_ids = [doctor.pk for doctor in doctors]
+
+    templates = defaultdict(lambda: defaultdict(list))
+    for hours in WorkingHours.objects.filter(doctor_id__in=doctor_ids):
+        templates[hours.doctor_id][hours.weekday].append(
+            (_minutes(hours.start_time), _minutes(hours.end_time), hours.slot_minutes)
+        )
+    fallback = default_working_hours()
+
+    def slot_length(doctor_id, day, minute):
+        for block_start, block_end, length in templates.get(doctor_id, fallback).get(day.weekday(), ()):
+            if block_start <= minute < block_end:
+                return length
+        return settings.DEFAULT_SLOT_MINUTES
+
+    booked = IntervalIndex()
+    appointments = Appointment.objects.filter(
+        doctor_id__in=doctor_ids, date__range=(start_date, end_date)
+    ).values_list('doctor_id', 'date', 'time')
+    holds = SlotHold.objects.filter(
+        doctor_id__in=doctor_ids, date__range=(start_date, end_date), expires_at__gt=now
+    ).values_list('doctor_id', 'date', 'time')
+    for doctor_id, day, time in [*appointments, *holds]:
+        minute = _minutes(time)
+        booked.add((doctor_id, day), minute, minute + slot_length(doctor_id, day, minute))
+
+    results = []
+    days = [start_date + datetime.timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+    for doctor in doctors:
+        week = templates.get(doctor.pk, fallback)
+        free = {}
+        for day in days:
+            if day < now.date():
+                continue
+            earliest = _minutes(now.time()) + 1 if day == now.date() else 0
+            slots = []
+            for block_start, block_end, length in sorted(week.get(day.weekday(), ())):
+                for minute in range(block_start, block_end - length + 1, length):
+                    if minute >= earliest and not booked.overlaps((doctor.pk, day), minute, minute + length):
+                        slots.append(_as_time(minute).strftime('%H:%M'))
+            if slots:
+                free[day.isoformat()] = slots
+        results.append({'id': doctor.pk, 'name': doctor.get_full_name() or doctor.username, 'slots': free})
+    return results
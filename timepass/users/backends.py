@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from .hashers import check_password_pooled, make_password_pooled
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend that verifies passwords on the bounded hashing pool and
+    upgrades hashes made with an outdated hasher or cost on login.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash anyway so unknown usernames take as long as wrong passwords.
+            make_password_pooled(password)
+            return None
+
+        is_correct, must_update = check_password_pooled(password, user.password)
+        if not is_correct or not self.user_can_authenticate(user):
+            return None
+        if must_update:
+            user.password = make_password_pooled(password)
+            # Only the password column, so the profile signals aren't triggered.
+            UserModel._default_manager.filter(pk=user.pk).update(password=user.password)
+        return user
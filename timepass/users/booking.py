@@ -0,0 +1,153 @@
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .availability import find_free_slots
+from .models import Appointment, BookingStats, SlotHold
+
+
+class SlotUnavailable(Exception):
+    """
+    The requested slot is booked or held by another patient. ``alternative``
+    is the doctor's next free (date, time) slot, or None.
+    """
+
+    def __init__(self, doctor, date, time, alternative=None):
+        self.doctor = doctor
+        self.date = date
+        self.time = time
+        self.alternative = alternative
+        message = 'This slot has just been taken.'
+        if alternative:
+            message += f' The next free slot is {alternative[0]:%Y-%m-%d} at {alternative[1]:%H:%M}.'
+        super().__init__(message)
+
+
+class HoldExpired(Exception):
+    pass
+
+
+def record_stat(doctor_id, field, amount=1):
+    """
+    Increment one of the BookingStats counters for a doctor.
+    """
+    if not BookingStats.objects.filter(doctor_id=doctor_id).update(**{field: F(field) + amount}):
+        try:
+            with transaction.atomic():
+                BookingStats.objects.create(doctor_id=doctor_id, **{field: amount})
+        except IntegrityError:
+            BookingStats.objects.filter(doctor_id=doctor_id).update(**{field: F(field) + amount})
+
+
+def suggest_alternative(doctor, date, time):
+    """
+    The doctor's earliest free slot after the requested one within the next week.
+    """
+    requested = time.strftime('%H:%M')
+    days = find_free_slots(
+        doctor.profile.speciality_id, date, date + datetime.timedelta(days=7), doctor_id=doctor.pk
+    )
+    for day, slots in (days[0]['slots'].items() if days else ()):
+        for slot in slots:
+            if day != date.isoformat() or slot > requested:
+                return datetime.date.fromisoformat(day), datetime.time.fromisoformat(slot)
+    return None
+
+
+def _conflict(doctor, date, time):
+    record_stat(doctor.pk, 'conflicts')
+    return SlotUnavailable(doctor, date, time, suggest_alternative(doctor, date, time))
+
+
+def expire_holds(now=None, **filters):
+    """
+    Delete holds that have run out and count them against their doctor.
+    """
+    now = now or timezone.now()
+    per_doctor = {}
+    for pk, doctor_id in SlotHold.objects.filter(expires_at__lte=now, **filters).values_list('pk', 'doctor_id'):
+        per_doctor.setdefault(doctor_id, []).append(pk)
+    expired = 0
+    for doctor_id, pks in per_doctor.items():
+        # Re-check expiry so a hold another worker already removed isn't counted twice.
+        deleted, _ = SlotHold.objects.filter(pk__in=pks, expires_at__lte=now).delete()
+        if deleted:
+            record_stat(doctor_id, 'expired_holds', deleted)
+            expired += deleted
+    return expired
+
+
+def reserve_slot(patient, doctor, date, time, check_booked=True):
+    """
+    Hold a slot for ``patient`` for SLOT_HOLD_SECONDS. Raises SlotUnavailable
+    if the slot is booked or held by someone else. Callers that have already
+    validated the slot against existing appointments can skip that check.
+    """
+    expires_at = timezone.now() + datetime.timedelta(seconds=settings.SLOT_HOLD_SECONDS)
+    expire_holds(doctor=doctor, date=date, time=time)
+    if check_booked and Appointment.objects.filter(doctor=doctor, date=date, time=time).exists():
+        raise _conflict(doctor, date, time)
+
+    if SlotHold.objects.filter(doctor=doctor, date=date, time=time, patient=patient).update(expires_at=expires_at):
+        return SlotHold.objects.get(doctor=doctor, date=date, time=time)
+    try:
+        with transaction.atomic():
+            return SlotHold.objects.create(doctor=doctor, patient=patient, date=date, time=time, expires_at=expires_at)
+    except IntegrityError:
+        raise _conflict(doctor, date, time)
+
+
+def confirm_hold(hold_id, patient):
+    """
+    Turn a live hold into an Appointment. Raises HoldExpired if the hold is
+    gone or has run out.
+    """
+    hold = None
+    try:
+        with transaction.atomic():
+            hold = (
+                SlotHold.objects.select_for_update()
+                .select_related('doctor__profile')
+                .filter(pk=hold_id, patient=patient, expires_at__gt=timezone.now())
+                .first()
+            )
+            if hold is None:
+                raise HoldExpired('Your hold on this slot has expired.')
+            appointment = Appointment(
+                patient=patient,
+                doctor=hold.doctor,
+                date=hold.date,
+                time=hold.time,
+                speciality_id=hold.doctor.profile.speciality_id,
+            )
+            appointment.save()
+            hold.delete()
+    except IntegrityError:
+        SlotHold.objects.filter(pk=hold.pk).delete()
+        raise _conflict(hold.doctor, hold.date, hold.time)
+    record_stat(hold.doctor_id, 'bookings')
+    return appointment
+
+
+def book(appointment):
+    """
+    Reserve and confirm in one step for an unsaved Appointment. Exactly one
+    of several concurrent requests for the same slot succeeds; the others
+    get SlotUnavailable with an alternative slot.
+    """
+    doctor, date, time = appointment.doctor, appointment.date, appointment.time
+    # The unique constraint on Appointment still catches a slot booked in the meantime.
+    hold = reserve_slot(appointment.patient, doctor, date, time, check_booked=False)
+    try:
+        with transaction.atomic():
+            appointment.save()
+            hold.delete()
+    except IntegrityError:
+        # Booked outside the hold path, e.g. through the admin.
+        hold.delete()
+        raise _conflict(doctor, date, time)
+    record_stat(doctor.pk, 'bookings')
+    return appointment
@@ -0,0 +1,288 @@
+import datetime
+import email.parser
+import email.policy
+import json
+import logging
+import uuid
+from urllib.parse import quote
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Appointment, CalendarEvent, WorkingHours
+
+logger = logging.getLogger(__name__)
+
+# Events pushed for appointments get a client-chosen id (Google allows the
+# characters a-v and 0-9), so a retried insert can't create a duplicate and
+# synced events can be matched back to their appointment.
+APPOINTMENT_EVENT_PREFIX = 'timepass'
+
+EVENT_FIELDS = ['status', 'summary', 'description', 'start', 'end', 'all_day', 'etag', 'updated']
+
+
+class CalendarAPIError(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        super().__init__(f'{status}: {message}')
+
+
+class SyncTokenExpired(CalendarAPIError):
+    """
+    Google answered 410 Gone: the sync token is no longer valid and the
+    calendar has to be listed in full again.
+    """
+
+
+class CalendarClient:
+    """
+    Minimal Google Calendar v3 client over one keep-alive HTTP session.
+    ``base_url`` can point at a local fake API (see ``fake_calendar_api``).
+    """
+
+    def __init__(self, access_token, base_url=None, session=None, timeout=None):
+        self.base_url = (base_url or settings.GOOGLE_CALENDAR_API_URL).rstrip('/')
+        self.timeout = timeout or settings.GOOGLE_CALENDAR_TIMEOUT
+        # Sessions may be shared between the clients of several doctors.
+        self.session = session or requests.Session()
+        self.headers = {'Authorization': f'Bearer {access_token}'}
+
+    def events_path(self, calendar_id, event_id=None):
+        path = f'/calendar/v3/calendars/{quote(calendar_id, safe="")}/events'
+        return f'{path}/{quote(event_id, safe="")}' if event_id else path
+
+    def list_events(self, calendar_id, **params):
+        """
+        One page of events.list. Raises SyncTokenExpired on 410.
+        """
+        response = self.session.get(
+            self.base_url + self.events_path(calendar_id), params=params, headers=self.headers, timeout=self.timeout
+        )
+        if response.status_code == 410:
+            raise SyncTokenExpired(410, response.text)
+        if response.status_code != 200:
+            raise CalendarAPIError(response.status_code, response.text)
+        return response.json()
+
+    def batch(self, requests_):
+        """
+        Send [(method, path, body)] as one multipart batch request and return
+        [(status, body)] in the same order.
+        """
+        boundary = f'batch_{uuid.uuid4().hex}'
+        parts = []
+        for i, (method, path, body) in enumerate(requests_):
+            payload = json.dumps(body) if body is not None else ''
+            parts.append(
+                f'--{boundary}\r\n'
+                f'Content-Type: application/http\r\n'
+                f'Content-ID: <item{i}>\r\n\r\n'
+                f'{method} {path}\r\n'
+                f'Content-Type: application/json\r\n\r\n'
+                f'{payload}\r\n'
+            )
+        data = ''.join(parts) + f'--{boundary}--\r\n'
+        response = self.session.post(
+            f'{self.base_url}/batch/calendar/v3', data=data.encode(), timeout=self.timeout,
+            headers={**self.headers, 'Content-Type': f'multipart/mixed; boundary={boundary}'},
+        )
+        if response.status_code != 200:
+            raise CalendarAPIError(response.status_code, response.text)
+        return parse_batch_response(response.headers['Content-Type'], response.content, len(requests_))
+
+
+def parse_batch_response(content_type, content, count):
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode() + content
+    )
+    results = [(500, None)] * count
+    for part in message.iter_parts():
+        index = int(part['Content-ID'].strip('<>').rsplit('item', 1)[-1])
+        head, _, body = part.get_payload(decode=True).decode().partition('\r\n\r\n')
+        status = int(head.split(' ', 2)[1])
+        results[index] = (status, json.loads(body) if body.strip() else None)
+    return results
+
+
+def _parse_when(when):
+    if not when:
+        return None, False
+    if 'dateTime' in when:
+        return parse_datetime(when['dateTime']), False
+    day = parse_date(when['date'])
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time()), datetime.timezone.utc), True
+
+
+def event_row(doctor_id, calendar_id, item):
+    start, all_day = _parse_when(item.get('start'))
+    end, _ = _parse_when(item.get('end'))
+    appointment_id = None
+    if item['id'].startswith(APPOINTMENT_EVENT_PREFIX) and item['id'][len(APPOINTMENT_EVENT_PREFIX):].isdigit():
+        appointment_id = int(item['id'][len(APPOINTMENT_EVENT_PREFIX):])
+    return CalendarEvent(
+        doctor_id=doctor_id,
+        calendar_id=calendar_id,
+        event_id=item['id'],
+        appointment_id=appointment_id,
+        status=item.get('status', 'confirmed'),
+        summary=item.get('summary', '')[:255],
+        description=item.get('description', ''),
+        start=start,
+        end=end,
+        all_day=all_day,
+        etag=item.get('etag', '').strip('"')[:64],
+        updated=parse_datetime(item['updated']) if item.get('updated') else None,
+    )
+
+
+def apply_page(sync, items):
+    """
+    Upsert the changed events of one page in a single statement and delete
+    the cancelled ones. Returns (upserted, deleted).
+    """
+    cancelled = [item['id'] for item in items if item.get('status') == 'cancelled']
+    rows = [event_row(sync.doctor_id, sync.calendar_id, item) for item in items if item.get('status') != 'cancelled']
+    existing = set(Appointment.objects.filter(
+        pk__in=[row.appointment_id for row in rows if row.appointment_id]
+    ).values_list('pk', flat=True))
+    for row in rows:
+        if row.appointment_id not in existing:
+            row.appointment_id = None
+    deleted = 0
+    with transaction.atomic():
+        if cancelled:
+            deleted, _ = CalendarEvent.objects.filter(
+                doctor_id=sync.doctor_id, calendar_id=sync.calendar_id, event_id__in=cancelled
+            ).delete()
+        if rows:
+            CalendarEvent.objects.bulk_create(
+                rows, update_conflicts=True,
+                unique_fields=['doctor', 'calendar_id', 'event_id'],
+                update_fields=EVENT_FIELDS + ['appointment'],
+            )
+    return len(rows), deleted
+
+
+def sync_calendar(client, sync):
+    """
+    Bring the local mirror of one calendar up to date. With a sync token only
+    the events changed since the last sync are fetched; without one (first
+    run, or after Google expired the token) the calendar is listed in full
+    and local events that no longer exist are removed.
+    """
+    full = not sync.sync_token
+    params = {'maxResults': settings.GOOGLE_CALENDAR_PAGE_SIZE, 'singleEvents': 'true'}
+    if not full:
+        params['syncToken'] = sync.sync_token
+
+    seen = set()
+    upserted = deleted = 0
+    page_token = None
+    try:
+        while True:
+            page = client.list_events(sync.calendar_id, **params, **({'pageToken': page_token} if page_token else {}))
+            items = page.get('items', [])
+            changed, removed = apply_page(sync, items)
+            upserted += changed
+            deleted += removed
+            if full:
+                seen.update(item['id'] for item in items)
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                break
+    except SyncTokenExpired:
+        logger.info('Sync token of %s expired, listing in full', sync)
+        sync.sync_token = ''
+        return sync_calendar(client, sync)
+
+    if full:
+        stale = CalendarEvent.objects.filter(doctor_id=sync.doctor_id, calendar_id=sync.calendar_id).exclude(event_id__in=seen)
+        deleted += stale.delete()[0]
+    sync.sync_token = page.get('nextSyncToken', '')
+    sync.synced_at = timezone.now()
+    sync.last_error = ''
+    sync.save(update_fields=['sync_token', 'synced_at', 'last_error'])
+    return {'full': full, 'upserted': upserted, 'deleted': deleted}
+
+
+def appointment_event(appointment, slot_minutes):
+    tz = timezone.get_default_timezone()
+    start = timezone.make_aware(datetime.datetime.combine(appointment.date, appointment.time), tz)
+    end = start + datetime.timedelta(minutes=slot_minutes)
+    return {
+        'id': f'{APPOINTMENT_EVENT_PREFIX}{appointment.pk}',
+        'summary': f'Appointment with {appointment.patient.get_full_name() or appointment.patient.username}',
+        'description': f'{appointment.speciality} appointment booked through timepass.',
+        'start': {'dateTime': start.isoformat(), 'timeZone': settings.TIME_ZONE},
+        'end': {'dateTime': end.isoformat(), 'timeZone': settings.TIME_ZONE},
+    }
+
+
+def _slot_minutes(doctor_id):
+    blocks = list(WorkingHours.objects.filter(doctor_id=doctor_id))
+
+    def length(appointment):
+        for block in blocks:
+            if block.weekday == appointment.date.weekday() and block.start_time <= appointment.time < block.end_time:
+                return block.slot_minutes
+        return settings.DEFAULT_SLOT_MINUTES
+    return length
+
+
+def push_appointments(client, sync):
+    """
+    Create calendar events for the doctor's upcoming appointments that have
+    none yet and delete the events of cancelled appointments, batching up to
+    GOOGLE_CALENDAR_BATCH_SIZE API calls per HTTP request.
+    """
+    path = client.events_path(sync.calendar_id)
+    length = _slot_minutes(sync.doctor_id)
+    pending = list(
+        Appointment.objects.filter(doctor_id=sync.doctor_id, date__gte=timezone.localdate(), calendar_event__isnull=True)
+        .select_related('patient', 'speciality')
+        .order_by('date', 'time')
+    )
+    orphaned = list(
+        CalendarEvent.objects.filter(
+            doctor_id=sync.doctor_id, calendar_id=sync.calendar_id,
+            event_id__startswith=APPOINTMENT_EVENT_PREFIX, appointment__isnull=True,
+        ).values_list('event_id', flat=True)
+    )
+    calls = [('POST', path, appointment_event(appointment, length(appointment)), appointment) for appointment in pending]
+    calls += [('DELETE', client.events_path(sync.calendar_id, event_id), None, event_id) for event_id in orphaned]
+
+    created = removed = failed = 0
+    size = settings.GOOGLE_CALENDAR_BATCH_SIZE
+    for start in range(0, len(calls), size):
+        chunk = calls[start:start + size]
+        results = client.batch([(method, path_, body) for method, path_, body, _ in chunk])
+        rows, gone = [], []
+        for (method, _, body, target), (status, result) in zip(chunk, results):
+            if method == 'POST' and (status == 200 or status == 409):
+                # 409: inserted by an earlier attempt whose response was lost.
+                item = result if status == 200 else dict(body, status='confirmed')
+                row = event_row(sync.doctor_id, sync.calendar_id, item)
+                row.appointment_id = target.pk
+                rows.append(row)
+            elif method == 'DELETE' and status in (204, 404, 410):
+                gone.append(target)
+            else:
+                failed += 1
+                logger.warning('Calendar %s %s failed with %s: %s', method, target, status, result)
+        with transaction.atomic():
+            if rows:
+                CalendarEvent.objects.bulk_create(
+                    rows, update_conflicts=True,
+                    unique_fields=['doctor', 'calendar_id', 'event_id'],
+                    update_fields=EVENT_FIELDS + ['appointment'],
+                )
+            if gone:
+                CalendarEvent.objects.filter(
+                    doctor_id=sync.doctor_id, calendar_id=sync.calendar_id, event_id__in=gone
+                ).delete()
+        created += len(rows)
+        removed += len(gone)
+    return {'created': created, 'removed': removed, 'failed': failed}
@@ -0,0 +1,36 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import render
+from django.utils import timezone
+from django.views import View
+from oauth2_provider.views.generic import ProtectedResourceView
+
+from .models import CalendarEvent
+
+# Kept out of users.views so oauth2_provider's view stack is only imported
+# when the calendar is first requested (see lazy_view in users.utlis).
+
+
+class CalendarView(ProtectedResourceView):
+    async def dispatch(self, request, *args, **kwargs):
+        # ProtectedResourceMixin.dispatch checks the bearer token synchronously
+        # against the database, so do the same check off the event loop.
+        if request.method.upper() != 'OPTIONS':
+            valid, oauth_request = await sync_to_async(self.verify_request)(request)
+            if not valid:
+                return self.unauthenticated_response(request, oauth_request)
+            request.resource_owner = oauth_request.user
+        return await View.dispatch(self, request, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        # Served from the local mirror kept up to date by `manage.py sync_calendars`,
+        # never from the Calendar API on the request path.
+        events = [
+            event async for event in CalendarEvent.objects.filter(
+                doctor=user, end__gte=timezone.now()
+            ).order_by('start')[:100]
+        ]
+        return await sync_to_async(render)(request, 'calendar_integration/calendar_events.html', {'events': events})
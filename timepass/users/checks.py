@@ -0,0 +1,29 @@
+from django.core import checks
+from django.db import connections
+
+from .search import missing_search_triggers
+
+
+@checks.register(checks.Tags.database)
+def check_search_triggers(app_configs=None, databases=None, **kwargs):
+    """
+    The SQLite search index only follows tweet writes through its triggers,
+    which a migration that rebuilds users_tweet silently drops. Runs before
+    migrate and with `manage.py check --database default`; a warning, so
+    it doesn't block the migration that restores them.
+    """
+    errors = []
+    for alias in databases or []:
+        connection = connections[alias]
+        if connection.vendor != 'sqlite':
+            continue
+        missing = missing_search_triggers(connection)
+        if missing:
+            errors.append(checks.Warning(
+                f'The tweet search triggers {", ".join(missing)} are missing from the {alias!r} database, '
+                'so searches miss new and edited tweets.',
+                hint='Add migrations.RunPython(users.search.create_search_triggers) after the operation '
+                     'that rebuilt users_tweet.',
+                id='users.W001',
+            ))
+    return errors
@@ -0,0 +1,19 @@
+from django.utils.functional import SimpleLazyObject
+
+from .utlis import next_appointment_dates
+
+
+def appointments(request):
+    """
+    Navigation flags for the logged-in user's appointments. They are resolved
+    lazily from the cache, so pages that don't use them cost nothing.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    dates = SimpleLazyObject(lambda: next_appointment_dates(user))
+    return {
+        'next_appointment_dates': dates,
+        'has_upcoming_appointments': SimpleLazyObject(lambda: dates['patient'] is not None),
+        'has_scheduled_calls': SimpleLazyObject(lambda: dates['doctor'] is not None),
+    }
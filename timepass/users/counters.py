@@ -0,0 +1,97 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import AuthorStats, CategoryStats, Tweet
+
+# (stats model, its key field, the Tweet column it counts by)
+COUNTERS = [(CategoryStats, 'category', 'category'), (AuthorStats, 'author', 'user_id')]
+STATE_FIELDS = ('user_id', 'category', 'is_draft')
+
+
+def _counted_in(state):
+    """
+    The (model, key) counters a tweet in ``state`` is counted in.
+    """
+    if state['is_draft'] or state['user_id'] is None:
+        return set()
+    return {(CategoryStats, state['category']), (AuthorStats, state['user_id'])}
+
+
+def _add(model, key, amount):
+    field = 'category' if model is CategoryStats else 'author_id'
+    rows = model.objects.filter(**{field: key})
+    # Clamped at zero, so a counter that drifted can't make a delete fail.
+    if not rows.update(published=Greatest(F('published') + amount, 0)) and amount > 0:
+        try:
+            with transaction.atomic():
+                model.objects.create(**{field: key, 'published': amount})
+        except IntegrityError:
+            rows.update(published=F('published') + amount)
+
+
+def _saved_state(tweet):
+    saved = getattr(tweet, '_saved_state', None)
+    if saved is None or not all(name in saved for name in STATE_FIELDS):
+        return None
+    return {name: saved[name] for name in STATE_FIELDS}
+
+
+def tweet_saving(tweet):
+    """
+    Called from pre_save. Reads what a tweet that wasn't loaded from the
+    database, e.g. Tweet(pk=...), is about to overwrite.
+    """
+    if tweet.pk is not None and _saved_state(tweet) is None:
+        tweet._replaced_state = Tweet.objects.filter(pk=tweet.pk).values(*STATE_FIELDS).first() or {}
+
+
+def tweet_saved(tweet, created, update_fields=None):
+    """
+    Move a saved tweet between the counters: publishing, unpublishing and
+    changing the category of a published tweet. Called from post_save,
+    inside the transaction of Tweet.save(), before DirtyFieldsMixin
+    records the new state.
+    """
+    replaced = tweet.__dict__.pop('_replaced_state', {})
+    before = {} if created else _saved_state(tweet) or replaced
+    after = {
+        name: getattr(tweet, name) if update_fields is None or name.removesuffix('_id') in update_fields
+        else before[name]
+        for name in STATE_FIELDS
+    }
+    old, new = (_counted_in(before) if before else set()), _counted_in(after)
+    for model, key in new - old:
+        _add(model, key, 1)
+    for model, key in old - new:
+        _add(model, key, -1)
+
+
+def tweet_deleted(tweet):
+    state = _saved_state(tweet) or {name: getattr(tweet, name) for name in STATE_FIELDS}
+    for model, key in _counted_in(state):
+        _add(model, key, -1)
+
+
+def recount(categories=None, author_ids=None):
+    """
+    Recompute counters from the tweets table: all of them, or those of the
+    given categories and authors, e.g. after bulk_create, which sends no
+    signals.
+    """
+    everything = categories is None and author_ids is None
+    published = Tweet.objects.filter(is_draft=False).order_by()
+    with transaction.atomic():
+        for (model, field, column), keys in zip(COUNTERS, (categories, author_ids)):
+            if not everything and not keys:
+                continue
+            rows = published if everything else published.filter(**{f'{column}__in': set(keys)})
+            counts = dict.fromkeys([] if everything else keys, 0)
+            counts.update(rows.values(column).annotate(count=Count('pk')).values_list(column, 'count'))
+            if everything:
+                model.objects.all().delete()
+            attname = model._meta.get_field(field).attname
+            model.objects.bulk_create(
+                [model(**{attname: key, 'published': count}) for key, count in counts.items()],
+                update_conflicts=True, unique_fields=[field], update_fields=['published'],
+            )
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import DoctorDirectoryEntry
+
+
+def directory_name(user):
+    return user.get_full_name() or user.username
+
+
+def get_version(speciality_id):
+    """
+    Opaque token that changes whenever a doctor of the speciality is added,
+    removed or renamed: the number of entries and the time the newest one
+    was written. Used to build the directory ETag; read from the entries
+    themselves so every process agrees on it.
+    """
+    version = DoctorDirectoryEntry.objects.filter(speciality_id=speciality_id).aggregate(
+        count=Count('pk'), updated_at=Max('updated_at'),
+    )
+    updated_at = version['updated_at'].timestamp() if version['updated_at'] else 0
+    return f'{version["count"]}-{updated_at:f}'
+
+
+def sync_doctor(profile):
+    """
+    Create, update or remove the directory entry for a profile.
+    """
+    entry = DoctorDirectoryEntry.objects.filter(user_id=profile.user_id).first()
+    if profile.user_type != 'doctor' or not profile.speciality_id:
+        if entry:
+            entry.delete()
+        return None
+
+    name = directory_name(profile.user)
+    if entry and (entry.speciality_id, entry.name) == (profile.speciality_id, name):
+        return entry
+    entry, _ = DoctorDirectoryEntry.objects.update_or_create(
+        user_id=profile.user_id,
+        defaults={'speciality_id': profile.speciality_id, 'name': name, 'search_name': name.lower()},
+    )
+    return entry
+
+
+def sync_doctors(profiles, batch_size=500):
+    """
+    sync_doctor() for many profiles at once, e.g. after bulk_create or
+    bulk_update, which send no signals. ``profile.user`` must be loaded.
+    """
+    doctors = [profile for profile in profiles if profile.user_type == 'doctor' and profile.speciality_id]
+    doctor_ids = {profile.user_id for profile in doctors}
+    others = [profile.user_id for profile in profiles if profile.user_id not in doctor_ids]
+    DoctorDirectoryEntry.objects.filter(user_id__in=others).delete()
+    DoctorDirectoryEntry.objects.bulk_create([
+        DoctorDirectoryEntry(
+            user_id=profile.user_id, speciality_id=profile.speciality_id,
+            name=directory_name(profile.user), search_name=directory_name(profile.user).lower(),
+        )
+        for profile in doctors
+    ], batch_size=batch_size, update_conflicts=True, unique_fields=['user'], update_fields=['speciality', 'name', 'search_name', 'updated_at'])
+
+
+def _directory_page(speciality_id, prefix, page, page_size):
+    entries = DoctorDirectoryEntry.objects.filter(speciality_id=speciality_id)
+    if prefix:
+        entries = entries.filter(search_name__startswith=prefix.lower())
+    offset = (page - 1) * page_size
+    # One extra row tells whether there is a next page.
+    return entries.order_by('search_name', 'user_id').values_list('user_id', 'name')[offset:offset + page_size + 1]
+
+
+def _page_results(rows, page, page_size):
+    next_page = page + 1 if len(rows) > page_size else None
+    return [{'id': pk, 'name': name} for pk, name in rows[:page_size]], next_page
+
+
+def search_doctors(speciality_id, prefix='', page=1, page_size=None):
+    """
+    One page of doctors of a speciality whose name starts with ``prefix``,
+    ordered by name. Returns (results, next_page).
+    """
+    page_size = page_size or settings.DOCTOR_DIRECTORY_PAGE_SIZE
+    return _page_results(list(_directory_page(speciality_id, prefix, page, page_size)), page, page_size)
+
+
+async def asearch_doctors(speciality_id, prefix='', page=1, page_size=None):
+    """
+    search_doctors() for async views.
+    """
+    page_size = page_size or settings.DOCTOR_DIRECTORY_PAGE_SIZE
+    rows = [row async for row in _directory_page(speciality_id, prefix, page, page_size)]
+    return _page_results(rows, page, page_size)
@@ -0,0 +1,111 @@
+import base64
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.text import slugify
+
+from .models import AuthorStats, CategoryStats, Tweet
+
+FEED_CACHE_PREFIX = 'feed:first_page'
+BLOG_TYPES_CACHE_KEY = 'feed:blog_types'
+ALL_CATEGORIES = 'all'
+CACHED_CATEGORIES = {None, ''} | {category for category, _ in Tweet.BLOG_TYPES}
+
+
+def encode_cursor(tweet):
+    """
+    Encode the (created_at, id) position of a tweet as an opaque cursor.
+    """
+    raw = f'{tweet.created_at.isoformat()}|{tweet.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor. Raises ValueError if it is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, pk = raw.split('|')
+        return datetime.datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, UnicodeError, ValueError) as exc:
+        raise ValueError('Invalid feed cursor') from exc
+
+
+def category_slugs():
+    return {slugify(category): category for category, _ in Tweet.BLOG_TYPES}
+
+
+def first_page_cache_key(category):
+    return f'{FEED_CACHE_PREFIX}:{slugify(category) if category else ALL_CATEGORIES}'
+
+
+def invalidate_feed_cache():
+    """
+    Drop the cached first page of every category. A tweet can move between
+    categories on edit, so all of them are cleared rather than just one.
+    """
+    keys = [BLOG_TYPES_CACHE_KEY, first_page_cache_key(None)]
+    keys += [first_page_cache_key(category) for category, _ in Tweet.BLOG_TYPES]
+    cache.delete_many(keys)
+
+
+def get_blog_types():
+    """
+    Return (category, published tweets) for the categories with published
+    tweets, from the counters table, cached until the next tweet write.
+    """
+    blog_types = cache.get(BLOG_TYPES_CACHE_KEY)
+    if blog_types is None:
+        blog_types = list(
+            CategoryStats.objects.filter(published__gt=0).order_by('category').values_list('category', 'published')
+        )
+        cache.set(BLOG_TYPES_CACHE_KEY, blog_types, settings.FEED_CACHE_TIMEOUT)
+    return blog_types
+
+
+def get_author_count(author_id):
+    """
+    Published tweets of an author, from the counters table.
+    """
+    return AuthorStats.objects.filter(author_id=author_id).values_list('published', flat=True).first() or 0
+
+
+def _fetch_page(category, after, page_size, author_id=None):
+    tweets = Tweet.objects.filter(is_draft=False)
+    if category:
+        tweets = tweets.filter(category=category)
+    if author_id:
+        tweets = tweets.filter(user_id=author_id)
+    if after:
+        created_at, pk = after
+        tweets = tweets.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+    rows = list(tweets.order_by('created_at', 'pk')[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = encode_cursor(rows[-1]) if has_more else None
+    return rows, next_cursor
+
+
+def get_feed_page(category=None, cursor=None, page_size=None, author_id=None):
+    """
+    Return (tweets, next_cursor) for one page of the published feed, or of
+    one author's tweets, ordered by (created_at, id). The first page of each
+    category is served from the cache.
+    """
+    page_size = page_size or settings.FEED_PAGE_SIZE
+    if cursor:
+        return _fetch_page(category, decode_cursor(cursor), page_size, author_id)
+    # Only the default page size of a known category is cached, so arbitrary
+    # query strings can't fill the cache with one-off entries.
+    if author_id or page_size != settings.FEED_PAGE_SIZE or category not in CACHED_CATEGORIES:
+        return _fetch_page(category, None, page_size, author_id)
+
+    key = first_page_cache_key(category)
+    page = cache.get(key)
+    if page is None:
+        page = _fetch_page(category, None, page_size)
+        cache.set(key, page, settings.FEED_CACHE_TIMEOUT)
+    return page
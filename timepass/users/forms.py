@@ -1,7 +1,9 @@
 from django import forms
 from django.contrib.auth.models import User
-from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
+from django.contrib.auth import password_validation
+from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, PasswordResetForm
 from .models import *
+from . import outbox, registration, specialities
 
 from django.contrib import admin
 
@@ -13,7 +15,19 @@ class ProfileAdmin(admin.ModelAdmin):
 @admin.register(DoctorProfile)
 class DoctorProfileAdmin(admin.ModelAdmin):
     list_display = ('profile', 'speciality')
-    search_fields = ('profile__user__username', 'profile__user__email', 'speciality')
+    list_select_related = ('profile__user', 'profile__speciality')
+    search_fields = ('profile__user__username', 'profile__user__email', 'profile__speciality__name')
+
+
+class SpecialityField(forms.TypedChoiceField):
+    """
+    Speciality picker backed by the cached registry, so rendering and
+    validating it doesn't query the Speciality table.
+    """
+    def __init__(self, **kwargs):
+        kwargs.setdefault('widget', forms.Select(attrs={'class': 'form-control'}))
+        super().__init__(choices=specialities.choices, coerce=specialities.get, empty_value=None, **kwargs)
+
 
 class RegisterForm(UserCreationForm):
     TYPES_OF_USERS = [
@@ -32,7 +46,7 @@ class RegisterForm(UserCreationForm):
     city = forms.CharField(max_length=30, required=True, widget=forms.TextInput(attrs={'placeholder': 'City', 'class': 'form-control'}))
     state = forms.CharField(max_length=30, required=True, widget=forms.TextInput(attrs={'placeholder': 'State', 'class': 'form-control'}))
     pincode = forms.CharField(max_length=6, required=True, widget=forms.TextInput(attrs={'placeholder': 'Pincode', 'class': 'form-control'}))
-    speciality = forms.ChoiceField(choices=DoctorProfile.SPECIALTIES, required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    speciality = SpecialityField(required=False)
 
     class Meta:
         model = User
@@ -44,56 +58,84 @@ class RegisterForm(UserCreationForm):
         self.fields['speciality'].required = self.data.get('user_type') == 'doctor'
 
     def save(self, commit=True):
-        user = super().save(commit=False)
-        user.first_name = self.cleaned_data['first_name']
-        user.last_name = self.cleaned_data['last_name']
-        user.email = self.cleaned_data['email']
-        user.username = self.cleaned_data['username']
-        user.set_password(self.cleaned_data['password1'])
-
-        if commit:
-            user.save()
-
-            profile, created = Profile.objects.get_or_create(
-                user=user,
-                defaults={
-                    'user_type': self.cleaned_data['user_type'],
-                    'address_line1': self.cleaned_data['address_line1'],
-                    'city': self.cleaned_data['city'],
-                    'state': self.cleaned_data['state'],
-                    'pincode': self.cleaned_data['pincode'],
-                    'avatar': self.cleaned_data.get('avatar', None)
-                }
-            )
-
-            if not created:
-                profile.user_type = self.cleaned_data['user_type']
-                profile.address_line1 = self.cleaned_data['address_line1']
-                profile.city = self.cleaned_data['city']
-                profile.state = self.cleaned_data['state']
-                profile.pincode = self.cleaned_data['pincode']
-                profile.avatar = self.cleaned_data.get('avatar', None)
-                profile.save()
+        if not commit:
+            return super().save(commit=False)
+        data = self.cleaned_data
+        return registration.register(
+            username=data['username'],
+            email=data['email'],
+            password=data['password1'],
+            first_name=data['first_name'],
+            last_name=data['last_name'],
+            user_type=data['user_type'],
+            speciality=data['speciality'],
+            address_line1=data['address_line1'],
+            city=data['city'],
+            state=data['state'],
+            pincode=data['pincode'],
+            avatar=data.get('avatar'),
+        )
+
+class ClinicMemberForm(forms.Form):
+    """
+    One row of a clinic onboarding CSV, see the register_clinic command.
+    The speciality may be given by id or by name.
+    """
+    username = forms.CharField(max_length=150, validators=[User.username_validator])
+    email = forms.EmailField()
+    first_name = forms.CharField(max_length=150, required=False)
+    last_name = forms.CharField(max_length=150, required=False)
+    user_type = forms.ChoiceField(choices=RegisterForm.TYPES_OF_USERS, required=False)
+    speciality = forms.CharField(required=False)
+    password = forms.CharField(required=False, strip=False)
+    address_line1 = forms.CharField(max_length=100, required=False)
+    city = forms.CharField(max_length=30, required=False)
+    state = forms.CharField(max_length=30, required=False)
+    pincode = forms.CharField(max_length=6, required=False)
+
+    def clean_user_type(self):
+        return self.cleaned_data['user_type'] or 'patient'
+
+    def clean_speciality(self):
+        value = self.cleaned_data['speciality']
+        speciality = specialities.resolve(value)
+        if value and speciality is None:
+            raise forms.ValidationError(f'Unknown speciality {value!r}.')
+        return speciality
 
-            if profile.user_type == 'doctor':
-                print("Saving doctor profile")  # Debugging print statement
-                print("Speciality:", self.cleaned_data['speciality'])  # Debugging print statement
-                doctor_profile, doc_created = DoctorProfile.objects.get_or_create(
-                    profile=profile,
-                    defaults={'speciality': self.cleaned_data['speciality']}
-                )
-                if not doc_created:
-                    doctor_profile.speciality = self.cleaned_data['speciality']
-                    doctor_profile.save()
-
-
-        return user
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('user_type') == 'doctor' and not cleaned_data.get('speciality'):
+            self.add_error('speciality', 'Doctors need a speciality.')
+        if cleaned_data.get('password'):
+            user = User(username=cleaned_data.get('username'), email=cleaned_data.get('email'),
+                        first_name=cleaned_data.get('first_name'), last_name=cleaned_data.get('last_name'))
+            try:
+                password_validation.validate_password(cleaned_data['password'], user)
+            except forms.ValidationError as exc:
+                self.add_error('password', exc)
+        return cleaned_data
 
 class LoginForm(AuthenticationForm):
     username = forms.CharField(max_length=100, required=True, widget=forms.TextInput(attrs={'placeholder': 'Username', 'class': 'form-control'}))
     password = forms.CharField(max_length=50, required=True, widget=forms.PasswordInput(attrs={'placeholder': 'Password', 'class': 'form-control', 'data-toggle': 'password', 'id': 'password', 'name': 'password'}))
     remember_me = forms.BooleanField(required=False, widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
 
+class ResetPasswordForm(PasswordResetForm):
+    """
+    PasswordResetForm that queues its emails in the outbox instead of
+    talking to the mail server. A reset for a registered address then takes
+    about as long as one for an unknown address, however slow SMTP is.
+    """
+
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        subject, body, html_body = outbox.render_email(
+            subject_template_name, email_template_name, context, html_email_template_name
+        )
+        outbox.enqueue(to_email, subject, body, html_body, from_email)
+
+
 class UpdateUserForm(forms.ModelForm):
     class Meta:
         model = User
@@ -111,7 +153,7 @@ class UpdateProfileForm(forms.ModelForm):
         ('doctor', 'Doctor')
     ]
     user_type = forms.ChoiceField(choices=TYPES_OF_USERS, widget=forms.Select(attrs={'class': 'form-control'}))
-    speciality = forms.ChoiceField(choices=DoctorProfile.SPECIALTIES, required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    speciality = SpecialityField(required=False)
 
     class Meta:
         model = Profile
@@ -131,10 +173,7 @@ class UpdateProfileForm(forms.ModelForm):
 
             # Set initial values for DoctorProfile fields if the user is a doctor
             if self.instance.user_type == 'doctor':
-                if doctor_profile := getattr(self.instance, 'doctorprofile', None):
-                    self.fields['speciality'].initial = doctor_profile.speciality
-                else:
-                    self.fields['speciality'].initial = ''
+                self.fields['speciality'].initial = self.instance.speciality_id
 
     def save(self, commit=True):
         profile = super().save(commit=False)
@@ -144,19 +183,13 @@ class UpdateProfileForm(forms.ModelForm):
         profile.state = self.cleaned_data['state']
         profile.pincode = self.cleaned_data['pincode']
         profile.user_type = self.cleaned_data['user_type']
+        if profile.user_type == 'doctor':
+            profile.speciality = self.cleaned_data.get('speciality')
         if commit:
             profile.save()
 
             if profile.user_type == 'doctor':
-                doctor_profile, created = DoctorProfile.objects.get_or_create(
-                    profile=profile,
-                    defaults={
-                        'speciality': self.cleaned_data.get('speciality', ''),  # Handle None value
-                    }
-                )
-                if not created:
-                    doctor_profile.speciality = self.cleaned_data.get('speciality', '')
-                    doctor_profile.save()
+                DoctorProfile.objects.get_or_create(profile=profile)
             else:
                 DoctorProfile.objects.filter(profile=profile).delete()
         return profile
@@ -224,17 +257,12 @@ class TweetForm(forms.ModelForm):
 
 
 class AppointmentForm(forms.ModelForm):
-    SPECIALTIES = [
-        ('Cardiology', 'Cardiology'),
-        ('Dermatology', 'Dermatology'),
-        ('Neurology', 'Neurology'),
-        ('Pediatrics', 'Pediatrics'),
-        ('Ortho', 'Ortho'),
-        ('Trauma', 'Trauma'),
-        ('General Surgery', 'General Surgery')
-    ]
-    speciality = forms.ChoiceField(choices=SPECIALTIES, widget=forms.Select(attrs={'class': 'form-control'}))
-    doctor = forms.ModelChoiceField(queryset=User.objects.filter(profile__user_type='doctor'), widget=forms.Select(attrs={'class': 'form-control'}))
+    speciality = SpecialityField()
+    doctor = forms.ModelChoiceField(
+        queryset=User.objects.none(),
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        error_messages={'invalid_choice': 'The selected doctor does not have the required speciality for this appointment.'}
+    )
     date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
     time = forms.TimeField(widget=forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}))
     
@@ -243,38 +271,62 @@ class AppointmentForm(forms.ModelForm):
         fields = ['speciality', 'doctor', 'date', 'time']
 
     def __init__(self, *args, **kwargs):
-        user = kwargs.pop('user', None)
+        self.user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-        if user and user.profile.user_type == 'patient':
-            self.fields['doctor'].queryset = User.objects.filter(profile__user_type='doctor')
+        # Only doctors of the chosen speciality are listed (the booking page fills the
+        # list over AJAX), so rendering doesn't load every doctor. The profile is
+        # fetched with the doctor and reused by clean(), save() and Appointment.save().
+        speciality = specialities.resolve(self.data.get('speciality') or self.initial.get('speciality'))
+        doctors = User.objects.filter(profile__user_type='doctor').select_related('profile')
+        self.fields['doctor'].queryset = doctors.filter(profile__speciality=speciality) if speciality else doctors.none()
 
     def clean(self):
         cleaned_data = super().clean()
         speciality = cleaned_data.get('speciality')
         doctor = cleaned_data.get('doctor')
         
-        if doctor and speciality:
-            doctor_profile = Profile.objects.get(user=doctor)
-            if doctor_profile.speciality != speciality:
-                self.add_error('speciality', 'The selected doctor does not have the required speciality for this appointment.')
+        if doctor and speciality and doctor.profile.speciality_id != speciality.pk:
+            self.add_error('speciality', 'The selected doctor does not have the required speciality for this appointment.')
 
         return cleaned_data
 
+    def validate_unique(self):
+        # A taken doctor/date/time is left to booking.book(), which reports
+        # it with the next free slot instead of a generic uniqueness error.
+        pass
+
     def save(self, commit=True):
         appointment = super().save(commit=False)
-        doctor_profile = Profile.objects.get(user=appointment.doctor)
-        appointment.speciality = doctor_profile.speciality  # This should match the doctor's speciality
+        appointment.speciality_id = appointment.doctor.profile.speciality_id  # This should match the doctor's speciality
         if commit:
             appointment.save()
         return appointment
     
-class UpdateDoctorProfileForm(forms.ModelForm):
+class DoctorProfileForm(forms.ModelForm):
+    """
+    Edits a doctor's speciality, which is stored on their Profile.
+    """
+    speciality = SpecialityField()
+
     class Meta:
         model = DoctorProfile
-        fields = ['speciality']
-        widgets = {
-            'speciality': forms.Select(attrs={'class': 'form-control'})
-        }
+        fields = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['speciality'].initial = self.instance.profile.speciality_id
+
+    def save(self, commit=True):
+        doctor_profile = super().save(commit=False)
+        doctor_profile.speciality = self.cleaned_data['speciality']
+        if commit:
+            doctor_profile.save()
+            doctor_profile.profile.save(update_fields=['speciality'])
+        return doctor_profile
+
+UpdateDoctorProfileForm = DoctorProfileForm
+
 class UserForm(forms.ModelForm):
     class Meta:
         model = User
@@ -297,11 +349,3 @@ class ProfileForm(forms.ModelForm):
             'pincode': forms.TextInput(attrs={'class': 'form-control'}),
             'avatar': forms.FileInput(attrs={'class': 'form-control-file'}),
         }
-
-class DoctorProfileForm(forms.ModelForm):
-    class Meta:
-        model = DoctorProfile
-        fields = ['speciality']
-        widgets = {
-            'speciality': forms.Select(attrs={'class': 'form-control'}),
-        }
\ No newline at end of file
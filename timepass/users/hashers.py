@@ -0,0 +1,82 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    ScryptPasswordHasher,
+    make_password,
+    verify_password,
+)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2 with costs from settings. Hashes made with other costs are
+    re-encoded on the next successful login.
+    """
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """
+    scrypt with costs from settings. Hashes made with other costs are
+    re-encoded on the next successful login.
+    """
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARALLELISM
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Pool that runs password hashing. The hashers release the GIL, so request
+    threads keep serving I/O while a hash runs, and the pool size caps how
+    many hashes compete for the CPU at once.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PASSWORD_HASH_WORKERS or os.cpu_count() or 1,
+                    thread_name_prefix='password-hash',
+                )
+    return _executor
+
+
+def check_password_pooled(password, encoded):
+    """
+    Verify ``password`` against ``encoded`` on the hashing pool. Returns
+    (is_correct, must_update) like django.contrib.auth.hashers.verify_password.
+    """
+    return get_executor().submit(verify_password, password, encoded).result()
+
+
+def make_password_pooled(password):
+    return get_executor().submit(make_password, password).result()
@@ -0,0 +1,186 @@
+import hashlib
+import io
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .models import ImageJob
+
+logger = logging.getLogger(__name__)
+
+# Bounding boxes of the renditions generated for each image field, keyed by
+# "<app_label>.<model_name>.<field_name>". Images are only ever scaled down.
+RENDITION_SPECS = {
+    'users.profile.avatar': {
+        'thumbnail': (100, 100),
+        'retina': (200, 200),
+    },
+    'users.tweet.photo': {
+        'thumbnail': (143, 90),
+        'card': (286, 180),
+        'retina': (572, 360),
+    },
+}
+
+CONTENT_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+}
+
+
+def rendition_formats():
+    """
+    Output formats from settings that the installed Pillow can encode.
+    """
+    return [fmt for fmt in settings.IMAGE_RENDITION_FORMATS if fmt in CONTENT_TYPES and features.check(fmt)]
+
+
+def spec_key(instance, field_name):
+    return f'{instance._meta.label_lower}.{field_name}'
+
+
+def hash_content(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def build_renditions(data, content_hash, key):
+    """
+    Decode the image once and write every rendition in every output format.
+    Files are content addressed, so renditions that already exist are kept.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        img = ImageOps.exif_transpose(source)
+        img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    metadata = {
+        'hash': content_hash,
+        'width': img.width,
+        'height': img.height,
+        'renditions': {},
+    }
+    _, model_name, field_name = key.split('.')
+    folder = f'renditions/{content_hash[:2]}/{content_hash}/{model_name}-{field_name}'
+    for name, size in RENDITION_SPECS[key].items():
+        resized = img.copy()
+        resized.thumbnail(size)
+        variants = {}
+        for fmt in rendition_formats():
+            path = f'{folder}/{name}.{fmt}'
+            if not default_storage.exists(path):
+                buffer = io.BytesIO()
+                resized.save(buffer, format=fmt.upper(), quality=settings.IMAGE_RENDITION_QUALITY)
+                saved = default_storage.save(path, ContentFile(buffer.getvalue()))
+                if saved != path:
+                    # Another worker wrote the same rendition first; keep theirs.
+                    default_storage.delete(saved)
+            variants[fmt] = {'name': path, 'width': resized.width, 'height': resized.height}
+        metadata['renditions'][name] = variants
+    return metadata
+
+
+def process_job(job):
+    """
+    Generate and attach the renditions for one claimed job.
+    """
+    model = job.content_type.model_class()
+    instance = model.objects.filter(pk=job.object_id).first()
+    image = getattr(instance, job.field_name, None)
+    if image is None or image.name != job.source_name:
+        # The object was deleted or a newer upload replaced this file.
+        job.status = ImageJob.DONE
+        job.save(update_fields=['status', 'updated_at'])
+        return
+
+    with image.storage.open(image.name, 'rb') as fh:
+        data = fh.read()
+    content_hash = hash_content(data)
+
+    metadata = (
+        ImageJob.objects
+        .filter(content_hash=content_hash, content_type=job.content_type,
+                field_name=job.field_name, status=ImageJob.DONE)
+        .exclude(result={})
+        .values_list('result', flat=True)
+        .first()
+    )
+    if metadata is None:
+        metadata = build_renditions(data, content_hash, spec_key(instance, job.field_name))
+    else:
+        logger.debug('Reusing renditions for %s (%s)', job.source_name, content_hash)
+
+    # Update the column directly so model.save() doesn't enqueue another job.
+    model.objects.filter(pk=instance.pk, **{job.field_name: job.source_name}).update(
+        **{f'{job.field_name}_renditions': dict(metadata, source=job.source_name)}
+    )
+    job.content_hash = content_hash
+    job.result = metadata
+    job.status = ImageJob.DONE
+    job.error = ''
+    job.save(update_fields=['content_hash', 'result', 'status', 'error', 'updated_at'])
+
+
+def run_job(pk):
+    """
+    Worker entry point. Each pool thread has its own DB connection, which is
+    closed once the job is finished.
+    """
+    job = ImageJob.objects.select_related('content_type').get(pk=pk)
+    try:
+        process_job(job)
+    except Exception as exc:
+        logger.exception('Image job %s failed', pk)
+        job.status = ImageJob.FAILED if job.attempts >= settings.IMAGE_JOB_MAX_ATTEMPTS else ImageJob.PENDING
+        job.error = str(exc)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+    finally:
+        connection.close()
+    return job.status
+
+
+def claim_jobs(limit):
+    """
+    Move up to ``limit`` pending jobs to processing. The conditional UPDATE
+    guarantees a job is only claimed by one worker.
+    """
+    pending = (
+        ImageJob.objects
+        .filter(status=ImageJob.PENDING)
+        .order_by('created_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+    claimed = []
+    for pk in list(pending):
+        updated = ImageJob.objects.filter(pk=pk, status=ImageJob.PENDING).update(
+            status=ImageJob.PROCESSING, attempts=F('attempts') + 1, updated_at=timezone.now()
+        )
+        if updated:
+            claimed.append(pk)
+    return claimed
+
+
+def requeue_stale_jobs():
+    """
+    Return jobs left in processing by a worker that died back to the queue.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.IMAGE_JOB_STALE_AFTER)
+    return ImageJob.objects.filter(status=ImageJob.PROCESSING, updated_at__lt=cutoff).update(
+        status=ImageJob.PENDING
+    )
+
+
+def enqueue_missing(model, field_name):
+    """
+    Queue every row of ``model`` whose renditions are missing or out of date.
+    """
+    queued = 0
+    for instance in model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True}).iterator():
+        if ImageJob.enqueue(instance, field_name):
+            queued += 1
+    return queued
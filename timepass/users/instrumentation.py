@@ -0,0 +1,279 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import Template
+
+logger = logging.getLogger('timepass.requests')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Stats of the request being handled by the current thread or task.
+_current = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'query_time', 'template_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.template_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_time += time.perf_counter() - start
+
+
+def timed_execute(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_timer(connection):
+    """
+    Count queries on ``connection`` against the request being handled. The
+    stats are found through a context variable, which sync_to_async copies
+    into its threads, so queries from async views are counted too even
+    though every thread has its own connection.
+    """
+    if timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, timed_execute)
+
+
+class EndpointMetrics:
+    __slots__ = ('count', 'buckets', 'duration', 'queries', 'query_time', 'template_time', 'recent')
+
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.duration = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.template_time = 0.0
+        self.recent = deque(maxlen=settings.METRICS_WINDOW)
+
+
+class MetricsRegistry:
+    """
+    In-process aggregates per (view, method, status). Every worker process
+    keeps its own, so a scraper sees the process that served the scrape.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = defaultdict(EndpointMetrics)
+        self._counters = defaultdict(int)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def observe(self, labels, duration, stats):
+        with self._lock:
+            metrics = self._endpoints[labels]
+            metrics.count += 1
+            metrics.duration += duration
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    metrics.buckets[i] += 1
+            metrics.queries += stats.queries
+            metrics.query_time += stats.query_time
+            metrics.template_time += stats.template_time
+            metrics.recent.append(duration)
+
+    def clear(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                (labels, metrics.count, list(metrics.buckets), metrics.duration, metrics.queries,
+                 metrics.query_time, metrics.template_time, sorted(metrics.recent))
+                for labels, metrics in self._endpoints.items()
+            ]
+
+    def percentiles(self):
+        """
+        {(view, method, status): {0.5: seconds, 0.95: ..., 0.99: ...}} over the
+        most recent METRICS_WINDOW requests of each endpoint.
+        """
+        return {
+            labels: {q: _quantile(recent, q) for q in QUANTILES}
+            for labels, *_, recent in self.snapshot() if recent
+        }
+
+    def render(self):
+        """
+        The registry in the Prometheus text exposition format.
+        """
+        lines = [
+            '# HELP timepass_request_duration_seconds Request latency.',
+            '# TYPE timepass_request_duration_seconds histogram',
+        ]
+        snapshot = self.snapshot()
+        for labels, count, buckets, duration, *_ in snapshot:
+            for bound, value in zip(LATENCY_BUCKETS, buckets):
+                lines.append(f'timepass_request_duration_seconds_bucket{{{_labels(labels, le=bound)}}} {value}')
+            lines.append(f'timepass_request_duration_seconds_bucket{{{_labels(labels, le="+Inf")}}} {count}')
+            lines.append(f'timepass_request_duration_seconds_sum{{{_labels(labels)}}} {duration:.6f}')
+            lines.append(f'timepass_request_duration_seconds_count{{{_labels(labels)}}} {count}')
+
+        lines += [
+            '# HELP timepass_request_latency_seconds Latency quantiles over recent requests.',
+            '# TYPE timepass_request_latency_seconds summary',
+        ]
+        for labels, *_, recent in snapshot:
+            for q in QUANTILES:
+                if recent:
+                    value = _quantile(recent, q)
+                    lines.append(f'timepass_request_latency_seconds{{{_labels(labels, quantile=q)}}} {value:.6f}')
+
+        counters = (
+            ('timepass_db_queries_total', 'Database queries run by requests.', 4, '{}'),
+            ('timepass_db_query_seconds_total', 'Time spent in database queries.', 5, '{:.6f}'),
+            ('timepass_template_render_seconds_total', 'Time spent rendering templates.', 6, '{:.6f}'),
+        )
+        for name, help_text, index, fmt in counters:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for row in snapshot:
+                lines.append(f'{name}{{{_labels(row[0])}}} {fmt.format(row[index])}')
+
+        for name, value in sorted(self.counters().items()):
+            lines += [f'# TYPE timepass_{name}_total counter', f'timepass_{name}_total {value}']
+        return '\n'.join(lines) + '\n'
+
+
+def _quantile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _labels(labels, **extra):
+    view, method, status = labels
+    pairs = [('view', view), ('method', method), ('status', status), *extra.items()]
+    return ','.join(f'{key}="{value}"' for key, value in pairs)
+
+
+registry = MetricsRegistry()
+
+
+def _timed_render(render):
+    def wrapper(self, *args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return render(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            stats.template_time += time.perf_counter() - start
+    wrapper.instrumented = True
+    return wrapper
+
+
+def instrument_templates():
+    """
+    Time renders through the Django template backend, which is what render()
+    and render_to_string() go through. Included templates are rendered inside
+    the outer render, so they are not counted twice.
+    """
+    if not getattr(Template.render, 'instrumented', False):
+        Template.render = _timed_render(Template.render)
+
+
+class InstrumentationMiddleware:
+    """
+    Record latency, DB query count and time and template render time for
+    every request. All requests feed the /metrics aggregates; a sample of
+    them, plus every slow request, is also logged as a structured record.
+    Works in sync and async stacks, so async views stay async under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        instrument_templates()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, time.perf_counter() - start, stats)
+        return response
+
+    def record(self, request, response, duration, stats):
+        match = request.resolver_match
+        view = (match.view_name or match._func_path) if match else 'unresolved'
+        registry.observe((view, request.method, response.status_code), duration, stats)
+
+        slow = duration * 1000 >= settings.METRICS_SLOW_REQUEST_MS
+        if slow or random.random() < settings.METRICS_LOG_SAMPLE_RATE:
+            logger.log(logging.WARNING if slow else logging.INFO, 'request', extra={
+                'view': view,
+                'method': request.method,
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'db_queries': stats.queries,
+                'db_ms': round(stats.query_time * 1000, 2),
+                'template_ms': round(stats.template_time * 1000, 2),
+            })
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, including any fields passed through ``extra``.
+    """
+
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        payload.update({key: value for key, value in vars(record).items() if key not in self.RESERVED})
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
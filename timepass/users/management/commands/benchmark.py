@@ -0,0 +1,319 @@
+import datetime
+import io
+import json
+import platform
+import random
+import statistics
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from users import specialities
+from users.counters import recount
+from users.feed import invalidate_feed_cache
+from users.models import Appointment, DoctorDirectoryEntry, Profile, Tweet
+
+PREFIX = 'bench-'
+PASSWORD = 'bench-Passw0rd!'
+SLOT_TIMES = [datetime.time(9 + m // 60, m % 60) for m in range(0, 8 * 60, 30)]
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def jpeg_bytes(size=(640, 400)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (70, 130, 180)).save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def weekdays(start):
+    day = start
+    while True:
+        if day.weekday() < 5:
+            yield day
+        day += datetime.timedelta(days=1)
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the core user journeys against the configured database. Seeds '
+            'synthetic users, doctors, tweets and appointments inside a transaction that '
+            'is rolled back afterwards, so point DATABASES at a local SQLite or '
+            'PostgreSQL stand-in rather than production. Writes JSON results and can '
+            'compare them with a stored baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Patients to seed.')
+        parser.add_argument('--doctors', type=int, default=50, help='Doctors to seed.')
+        parser.add_argument('--tweets', type=int, default=500, help='Tweets (with photos) to seed.')
+        parser.add_argument('--appointments', type=int, default=1000, help='Appointments to seed.')
+        parser.add_argument('--iterations', type=int, default=50, help='Timed requests per journey.')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per journey.')
+        parser.add_argument('--journeys', help='Comma-separated subset of journeys to run.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for reproducible data.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', help='Compare against results previously written with --output.')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed fractional p95 increase over the baseline before failing.')
+
+    def seed(self, options):
+        rng = self.rng
+        password = make_password(PASSWORD)
+        speciality_ids = [s.pk for s in specialities.all_specialities()]
+        if not speciality_ids:
+            raise CommandError('No specialities found; run migrate first.')
+
+        users = User.objects.bulk_create([
+            User(username=f'{PREFIX}patient-{i}', email=f'patient-{i}@bench.invalid', password=password,
+                 first_name='Patient', last_name=str(i))
+            for i in range(options['users'])
+        ] + [
+            User(username=f'{PREFIX}doctor-{i}', email=f'doctor-{i}@bench.invalid', password=password,
+                 first_name='Doctor', last_name=str(i))
+            for i in range(options['doctors'])
+        ])
+        if not users[0].pk:
+            # Backends that don't return ids from bulk inserts.
+            users = list(User.objects.filter(username__startswith=PREFIX).order_by('pk'))
+        patients, doctors = users[:options['users']], users[options['users']:]
+        profiles = [Profile(user=user) for user in patients]
+        profiles += [Profile(user=user, user_type='doctor', speciality_id=speciality_ids[i % len(speciality_ids)])
+                     for i, user in enumerate(doctors)]
+        Profile.objects.bulk_create(profiles)
+        DoctorDirectoryEntry.objects.bulk_create([
+            DoctorDirectoryEntry(user=profile.user, speciality_id=profile.speciality_id,
+                                 name=profile.user.get_full_name(), search_name=profile.user.get_full_name().lower())
+            for profile in profiles if profile.user_type == 'doctor'
+        ])
+        for profile in profiles:
+            profile.user.profile = profile
+
+        # Every seeded tweet shares one stored photo.
+        self.seed_photo = default_storage.save(f'{PREFIX}photos/seed.jpg', ContentFile(jpeg_bytes()))
+        categories = [category for category, _ in Tweet.BLOG_TYPES]
+        tweets = Tweet.objects.bulk_create([
+            Tweet(user=rng.choice(patients + doctors), title=f'Benchmark tweet {i}',
+                  category=categories[i % len(categories)], content='Lorem ipsum ' * 20,
+                  summary='Benchmark summary', photo=self.seed_photo, is_draft=i % 10 == 0)
+            for i in range(options['tweets'])
+        ])
+        if tweets and not tweets[0].pk:
+            tweets = list(Tweet.objects.filter(title__startswith='Benchmark tweet').order_by('pk'))
+
+        # Seeded appointments fill the weeks before the ones the booking journey uses.
+        slots = ((day, slot) for day in weekdays(timezone.localdate() + datetime.timedelta(days=1))
+                 for slot in SLOT_TIMES)
+        appointments = []
+        for day, slot in slots:
+            remaining = options['appointments'] - len(appointments)
+            if remaining <= 0:
+                break
+            appointments += [
+                Appointment(patient=rng.choice(patients), doctor=doctor, date=day, time=slot,
+                            speciality_id=doctor.profile.speciality_id)
+                for doctor in doctors[:remaining]
+            ]
+        Appointment.objects.bulk_create(appointments)
+        self.first_free_day = (max(a.date for a in appointments) if appointments else timezone.localdate()) \
+            + datetime.timedelta(days=1)
+        recount(categories=categories, author_ids=[user.pk for user in users])
+        invalidate_feed_cache()
+        return patients, doctors, [tweet for tweet in tweets if not tweet.is_draft]
+
+    def journeys(self, patients, doctors, tweets):
+        rng = self.rng
+        patient_client = Client()
+        patient_client.force_login(patients[0])
+        category = Tweet.BLOG_TYPES[0][0]
+        photo = jpeg_bytes()
+        booking_slots = ((day, slot, doctor) for day in weekdays(self.first_free_day)
+                         for slot in SLOT_TIMES for doctor in doctors)
+
+        def home(i):
+            return patient_client.get(reverse('home'))
+
+        def home_filtered(i):
+            return patient_client.get(reverse('home'), {'blog_type': category})
+
+        def tweet_search(i):
+            return patient_client.get(reverse('tweet_search'), {'q': rng.choice(['lorem', 'benchmark summary', 'ips'])})
+
+        def tweet_view(i):
+            return patient_client.get(reverse('tweet_view', args=[rng.choice(tweets).pk]))
+
+        def tweet_create(i):
+            upload = SimpleUploadedFile(f'bench-{i}.jpg', photo, content_type='image/jpeg')
+            return patient_client.post(reverse('tweet_create'), {
+                'title': f'Created {i}', 'content': 'Benchmark content', 'summary': 'Summary',
+                'category': category, 'photo': upload,
+            })
+
+        def book_appointment(i):
+            day, slot, doctor = next(booking_slots)
+            return patient_client.post(reverse('book_appointment'), {
+                'speciality': doctor.profile.speciality_id, 'doctor': doctor.pk,
+                'date': day.isoformat(), 'time': slot.strftime('%H:%M'),
+            })
+
+        def doctor_lookup(i):
+            return patient_client.get(reverse('get_doctors_by_speciality'),
+                                      {'speciality': rng.choice(doctors).profile.speciality_id})
+
+        def register(i):
+            return Client().post(reverse('users-register'), {
+                'username': f'{PREFIX}new{i}', 'email': f'new-{i}@bench.invalid',
+                'password1': PASSWORD, 'password2': PASSWORD, 'user_type': 'patient',
+                'first_name': 'New', 'last_name': str(i), 'address_line1': '1 Bench Street',
+                'city': 'Bench', 'state': 'Bench', 'pincode': '123456',
+            })
+
+        def login(i):
+            return Client().post(reverse('login'), {'username': rng.choice(patients).username, 'password': PASSWORD})
+
+        return {
+            'home': (home, {200}),
+            'home_filtered': (home_filtered, {200}),
+            'tweet_search': (tweet_search, {200}),
+            'tweet_view': (tweet_view, {200}),
+            'tweet_create': (tweet_create, {302}),
+            'book_appointment': (book_appointment, {302}),
+            'get_doctors_by_speciality': (doctor_lookup, {200}),
+            'register': (register, {302}),
+            'login': (login, {302}),
+        }
+
+    def measure(self, request, expected, iterations, warmup):
+        for i in range(warmup):
+            request(-1 - i)
+        timings, queries, errors = [], [], 0
+        for i in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = request(i)
+                timings.append(time.perf_counter() - started)
+            queries.append(len(captured))
+            if response.status_code not in expected:
+                errors += 1
+        total = sum(timings)
+        ms = [t * 1000 for t in timings]
+        return {
+            'requests': iterations,
+            'errors': errors,
+            'throughput_rps': round(iterations / total, 2) if total else None,
+            'mean_ms': round(statistics.mean(ms), 3),
+            'p50_ms': round(percentile(ms, 50), 3),
+            'p95_ms': round(percentile(ms, 95), 3),
+            'p99_ms': round(percentile(ms, 99), 3),
+            'max_ms': round(max(ms), 3),
+            'queries_mean': round(statistics.mean(queries), 2),
+        }
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+        self.rng = random.Random(options['seed'])
+        self.seed_photo = None
+        setup_test_environment()
+        results = {}
+        uploaded = []
+        # Every login comes from one client and a handful of accounts; lift the
+        # limits so the journey measures the login path rather than 429s.
+        unlimited = {scope: {kind: (10 ** 9, window) for kind, (_, window) in limits.items()}
+                     for scope, limits in settings.RATELIMITS.items()}
+        try:
+            with transaction.atomic(), override_settings(RATELIMITS=unlimited):
+                started = time.perf_counter()
+                patients, doctors, tweets = self.seed(options)
+                if not (patients and doctors and tweets):
+                    raise CommandError('--users, --doctors and --tweets must all be at least 1 '
+                                       '(and enough tweets to include a published one)')
+                self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f}s')
+                journeys = self.journeys(patients, doctors, tweets)
+                selected = options['journeys'].split(',') if options['journeys'] else list(journeys)
+                unknown = set(selected) - set(journeys)
+                if unknown:
+                    raise CommandError(f'Unknown journeys: {", ".join(sorted(unknown))}')
+                for name in selected:
+                    request, expected = journeys[name]
+                    results[name] = self.measure(request, expected, options['iterations'], options['warmup'])
+                    self.report(name, results[name])
+                uploaded = list(Tweet.objects.filter(user__username__startswith=PREFIX)
+                                .exclude(photo=self.seed_photo).values_list('photo', flat=True))
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            teardown_test_environment()
+            for name in filter(None, uploaded + [self.seed_photo]):
+                default_storage.delete(name)
+            # Caches may hold rows from the rolled-back seed.
+            invalidate_feed_cache()
+
+        document = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'seed': {key: options[key] for key in ('users', 'doctors', 'tweets', 'appointments', 'seed')},
+                'iterations': options['iterations'],
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(document, fh, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+        failures = [f'{name}: {r["errors"]} of {r["requests"]} requests failed'
+                    for name, r in results.items() if r['errors']]
+        if options['baseline']:
+            failures += self.compare(results, options['baseline'], options['threshold'])
+        if failures:
+            raise CommandError('\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
+
+    def report(self, name, r):
+        self.stdout.write(
+            f'{name:<26} {r["throughput_rps"]:>8} req/s  p50={r["p50_ms"]:.1f}ms p95={r["p95_ms"]:.1f}ms '
+            f'p99={r["p99_ms"]:.1f}ms  {r["queries_mean"]:g} queries  errors={r["errors"]}'
+        )
+
+    def compare(self, results, path, threshold):
+        with open(path) as fh:
+            baseline = json.load(fh)['results']
+        regressions = []
+        self.stdout.write(f'\nAgainst baseline {path}:')
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if not previous:
+                self.stdout.write(f'{name:<26} no baseline')
+                continue
+            change = current['p95_ms'] / previous['p95_ms'] - 1 if previous['p95_ms'] else 0.0
+            line = (f'{name:<26} p95 {previous["p95_ms"]:.1f} -> {current["p95_ms"]:.1f}ms ({change:+.0%}), '
+                    f'queries {previous["queries_mean"]:g} -> {current["queries_mean"]:g}')
+            if change > threshold or current['queries_mean'] > previous['queries_mean']:
+                regressions.append(f'{name} regressed: {line.split(None, 1)[1]}')
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        return regressions
@@ -0,0 +1,60 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+PASSWORD = 'correct horse battery staple'
+
+
+class Command(BaseCommand):
+    help = ('Measure password verifications per second, which bounds logins per second, '
+            'for each configured hasher: on one thread (roughly one core) and on a '
+            'pool of --workers threads.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashers', help='Comma-separated hasher names (default: all configured).')
+        parser.add_argument('--logins', type=int, default=20, help='Verifications per measurement.')
+        parser.add_argument('--workers', type=int, default=settings.PASSWORD_HASH_WORKERS or os.cpu_count() or 1)
+
+    def rate(self, verify, n, workers=1):
+        started = time.perf_counter()
+        if workers == 1:
+            for _ in range(n):
+                verify()
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for future in [pool.submit(verify) for _ in range(n)]:
+                    future.result()
+        return n / (time.perf_counter() - started)
+
+    def handle(self, *args, **options):
+        names = options['hashers'].split(',') if options['hashers'] else list(settings.PASSWORD_HASHER_CHOICES)
+        unknown = set(names) - set(settings.PASSWORD_HASHER_CHOICES)
+        if unknown:
+            raise CommandError(f'Unknown hashers: {", ".join(sorted(unknown))}')
+        workers, cores = options['workers'], os.cpu_count() or 1
+
+        self.stdout.write(f'{"hasher":<10} {"1 thread":>12} {f"{workers} threads":>12} {"per core":>12}')
+        for name in names:
+            with override_settings(PASSWORD_HASHERS=[settings.PASSWORD_HASHER_CHOICES[name]]):
+                try:
+                    hasher = get_hasher()
+                    encoded = hasher.encode(PASSWORD, hasher.salt())
+                except ValueError as exc:
+                    # e.g. argon2 without argon2-cffi installed
+                    self.stdout.write(f'{name:<10} skipped: {exc}')
+                    continue
+
+                def verify():
+                    if not hasher.verify(PASSWORD, encoded):
+                        raise CommandError(f'{name} failed to verify its own hash')
+
+                single = self.rate(verify, options['logins'])
+                pooled = self.rate(verify, options['logins'], workers)
+            self.stdout.write(
+                f'{name:<10} {single:>8.1f}/s   {pooled:>8.1f}/s   {pooled / min(workers, cores):>8.1f}/s'
+            )
@@ -0,0 +1,124 @@
+import itertools
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from users.models import Tweet
+from users.search import index_available, search_tweets
+
+PREFIX = 'searchbench-'
+TOPICS = ['vaccine', 'cholesterol', 'anxiety', 'insomnia', 'booster', 'cardiology', 'therapy', 'fever',
+          'hypertension', 'meditation', 'antibodies', 'arrhythmia', 'depression', 'immunity', 'symptoms']
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = ('Compare the full-text tweet search with icontains scans. Seeds --tweets synthetic tweets '
+            'inside a transaction that is rolled back afterwards, times a set of queries both ways and '
+            'the index upkeep of edits, publishes and deletes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tweets', type=int, default=100_000)
+        parser.add_argument('--iterations', type=int, default=20, help='Timed runs per query and mode.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for reproducible data.')
+
+    def seed(self, count):
+        rng = self.rng
+        # Word frequencies follow Zipf's law as in real text: the topics are
+        # the most common words, followed by a long tail of rare ones.
+        vocabulary = TOPICS + [f'word{i}' for i in range(20_000)]
+        cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+        def text(words):
+            return ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=words))
+
+        user = User.objects.create_user(f'{PREFIX}author')
+        categories = [category for category, _ in Tweet.BLOG_TYPES]
+        started = time.perf_counter()
+        for start in range(0, count, 5000):
+            Tweet.objects.bulk_create([
+                Tweet(user=user, title=text(6), category=categories[i % len(categories)], summary=text(25),
+                      content=text(70), is_draft=i % 10 == 0)
+                for i in range(start, min(count, start + 5000))
+            ])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Seeded {count} tweets in {elapsed:.1f}s ({count / elapsed:.0f} rows/s, '
+                          f'index upkeep included)')
+        return user
+
+    def queries(self):
+        rng = self.rng
+        return {
+            'common word': 'therapy',
+            'two words': 'anxiety meditation',
+            'rare word': f'word{rng.randrange(15_000, 20_000)}',
+            'stemmed': 'vaccines',
+            'no match': 'zzzunknown',
+            'page 5': ('vaccine', 5),
+        }
+
+    def time_query(self, query, page, indexed, iterations):
+        search_tweets(query, page, indexed=indexed)
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            results, _ = search_tweets(query, page, indexed=indexed)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), percentile(timings, 95), len(results)
+
+    def time_upkeep(self, user, iterations):
+        """
+        Milliseconds per save of a new draft, an edit, a publish and a delete.
+        """
+        timings = {'create draft': [], 'edit published': [], 'publish': [], 'delete': []}
+
+        def timed(name, action):
+            started = time.perf_counter()
+            action()
+            timings[name].append((time.perf_counter() - started) * 1000)
+
+        for i in range(iterations):
+            tweet = Tweet(user=user, title=f'upkeep {i}', category=Tweet.BLOG_TYPES[0][0],
+                          summary='upkeep summary', content='upkeep content', is_draft=True)
+            timed('create draft', tweet.save)
+            tweet.is_draft = False
+            timed('publish', tweet.save)
+            tweet.content = 'edited upkeep content'
+            timed('edit published', tweet.save)
+            timed('delete', tweet.delete)
+        return {name: statistics.median(values) for name, values in timings.items()}
+
+    def handle(self, *args, **options):
+        if not index_available():
+            raise CommandError(f'No full-text index on {connection.vendor}; only SQLite and PostgreSQL have one.')
+        self.rng = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                user = self.seed(options['tweets'])
+                self.stdout.write(f'{"query":<14} {"index p50/p95":>18} {"scan p50/p95":>18} {"speed-up":>9}  hits')
+                for name, query in self.queries().items():
+                    query, page = query if isinstance(query, tuple) else (query, 1)
+                    index_p50, index_p95, index_hits = self.time_query(query, page, True, options['iterations'])
+                    scan_p50, scan_p95, scan_hits = self.time_query(query, page, False, options['iterations'])
+                    self.stdout.write(
+                        f'{name:<14} {index_p50:>8.2f}/{index_p95:<7.2f}ms {scan_p50:>8.2f}/{scan_p95:<7.2f}ms '
+                        f'{scan_p50 / index_p50:>8.0f}x  {index_hits}/{scan_hits}'
+                    )
+                for name, ms in self.time_upkeep(user, options['iterations']).items():
+                    self.stdout.write(f'{name:<14} {ms:.2f}ms per save')
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(self.style.SUCCESS('Benchmark complete; seeded tweets rolled back'))
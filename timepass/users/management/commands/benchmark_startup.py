@@ -0,0 +1,50 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so every measurement is a cold start.
+SCRIPT = '''
+import json, time
+started = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+from timepass.wsgi import application
+imported = time.perf_counter()
+environ = {{'PATH_INFO': {path!r}, 'REQUEST_METHOD': 'GET', 'HTTP_HOST': {host!r}}}
+setup_testing_defaults(environ)
+status = []
+body = b''.join(application(environ, lambda s, headers, exc_info=None: status.append(s)))
+done = time.perf_counter()
+print(json.dumps({{'import_ms': (imported - started) * 1000, 'first_response_ms': (done - started) * 1000,
+                  'status': status[0], 'bytes': len(body)}}))
+'''
+
+
+class Command(BaseCommand):
+    help = ('Measure cold-start time to the first response of the WSGI app: import '
+            'timepass.wsgi in a fresh interpreter and serve one request, several times.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--path', default='/login/', help='Path of the first request.')
+
+    def handle(self, *args, **options):
+        host = next((h for h in settings.ALLOWED_HOSTS if h not in ('*', '') and not h.startswith('.')), 'localhost')
+        script = SCRIPT.format(path=options['path'], host=host)
+        runs = []
+        for _ in range(options['runs']):
+            completed = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR,
+                                       env=os.environ.copy(), capture_output=True, text=True)
+            if completed.returncode:
+                raise CommandError(completed.stderr[-2000:])
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        self.stdout.write(f'GET {options["path"]} -> {runs[0]["status"]} ({options["runs"]} cold starts)')
+        for key, label in (('import_ms', 'import timepass.wsgi'), ('first_response_ms', 'first response')):
+            values = [run[key] for run in runs]
+            self.stdout.write(f'  {label:<22} median {statistics.median(values):7.1f}ms  '
+                              f'min {min(values):7.1f}ms  max {max(values):7.1f}ms')
@@ -0,0 +1,145 @@
+import datetime
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+
+from users import specialities
+from users.booking import SlotUnavailable, book
+from users.models import Appointment
+
+SLOT_TIMES = [datetime.time(9 + m // 60, m % 60) for m in range(0, 8 * 60, 30)]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def writer(patient_id, doctor, slots, latencies, errors, start_at):
+    """
+    Book ``slots`` of one doctor back to back, recording each booking's latency.
+    """
+    time.sleep(max(0.0, start_at - time.time()))
+    try:
+        for date, slot in slots:
+            appointment = Appointment(patient_id=patient_id, doctor=doctor, date=date, time=slot,
+                                      speciality_id=doctor.profile.speciality_id)
+            started = time.perf_counter()
+            try:
+                book(appointment)
+                latencies.append((time.perf_counter() - started) * 1000)
+            except (OperationalError, SlotUnavailable) as exc:
+                errors.append(f'{exc.__class__.__name__}: {exc}')
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Run concurrent writers through the booking path and report bookings/sec. '
+            'With --compare on SQLite, runs once on a copy of the database with SQLite '
+            'defaults and once with SQLITE_PRAGMAS, to show what the tuning buys. '
+            'Creates throwaway users prefixed "writers-" and removes them afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--bookings', type=int, default=25, help='Bookings per thread.')
+        parser.add_argument('--compare', action='store_true',
+                            help='SQLite only: compare default and tuned settings on database copies.')
+        parser.add_argument('--json', action='store_true', help='Print the result as JSON.')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(options)
+        result = self.run_load(options['threads'], options['bookings'])
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+        else:
+            self.report(connection.vendor, result)
+
+    def run_load(self, threads, per_thread):
+        tag = f'writers-{uuid.uuid4().hex[:8]}'
+        speciality = specialities.all_specialities()[0]
+        patient = User.objects.create_user(f'{tag}-patient')
+        doctors = []
+        for i in range(threads):
+            doctor = User.objects.create_user(f'{tag}-doctor-{i}', first_name='Writer', last_name=str(i))
+            doctor.profile.user_type = 'doctor'
+            doctor.profile.speciality = speciality
+            doctor.profile.save()
+            doctors.append(doctor)
+        start_date = datetime.date(2099, 1, 1)
+        slots = [(start_date + datetime.timedelta(days=n // len(SLOT_TIMES)), SLOT_TIMES[n % len(SLOT_TIMES)])
+                 for n in range(per_thread)]
+        connections.close_all()
+
+        latencies, errors = [], []
+        start_at = time.time() + 0.5
+        workers = [
+            threading.Thread(target=writer, args=(patient.pk, doctor, slots, latencies, errors, start_at))
+            for doctor in doctors
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.time() - start_at
+
+        User.objects.filter(username__startswith=tag).delete()
+        return {
+            'threads': threads,
+            'bookings': len(latencies),
+            'errors': len(errors),
+            'first_error': errors[0] if errors else None,
+            'bookings_per_sec': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99), 1) if latencies else None,
+            'mean_ms': round(statistics.mean(latencies), 1) if latencies else None,
+        }
+
+    def compare(self, options):
+        database = settings.DATABASES['default']
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('--compare only applies to SQLite; run without it on PostgreSQL.')
+        manage_py = os.path.join(settings.BASE_DIR, 'manage.py')
+        results = {}
+        with tempfile.TemporaryDirectory() as scratch:
+            for mode, tuned in (('default', '0'), ('tuned', '1')):
+                path = os.path.join(scratch, f'{mode}.sqlite3')
+                with sqlite3.connect(database['NAME']) as source, sqlite3.connect(path) as copy:
+                    source.backup(copy)
+                    copy.execute('PRAGMA journal_mode = delete')
+                env = dict(os.environ, SQLITE_PATH=path, SQLITE_TUNED=tuned)
+                completed = subprocess.run(
+                    [sys.executable, manage_py, 'benchmark_writers', '--json',
+                     '--threads', str(options['threads']), '--bookings', str(options['bookings'])],
+                    env=env, capture_output=True, text=True,
+                )
+                if completed.returncode:
+                    raise CommandError(f'{mode} run failed:\n{completed.stderr}')
+                results[mode] = json.loads(completed.stdout.strip().splitlines()[-1])
+                self.report(f'sqlite {mode}', results[mode])
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+        default, tuned = results['default']['bookings_per_sec'], results['tuned']['bookings_per_sec']
+        if default:
+            self.stdout.write(self.style.SUCCESS(f'Tuned SQLite: {tuned / default:.1f}x the bookings/sec'))
+
+    def report(self, label, r):
+        self.stdout.write(
+            f'{label:<16} {r["threads"]} writers: {r["bookings"]} bookings, {r["errors"]} errors, '
+            f'{r["bookings_per_sec"]}/s, p50={r["p50_ms"]}ms p99={r["p99_ms"]}ms'
+        )
+        if r['first_error']:
+            self.stdout.write(f'{"":<16} first error: {r["first_error"]}')
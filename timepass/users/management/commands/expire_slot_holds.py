@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.booking import expire_holds
+
+
+class Command(BaseCommand):
+    help = 'Release appointment slot holds that were never confirmed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep sweeping instead of exiting after one pass.')
+        parser.add_argument('--sleep', type=float, default=30.0,
+                            help='Seconds between sweeps when looping.')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_holds()
+            self.stdout.write(f'Released {expired} expired slot holds')
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
@@ -0,0 +1,49 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.transfer import DATASETS, FORMATS, MediaBundle, guess_format, write_rows
+
+
+class Command(BaseCommand):
+    help = ('Stream tweets, profiles (with their users and doctor profiles) or appointments to an NDJSON '
+            'or CSV file, reading the table in chunks so memory use stays flat however large it is.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(DATASETS))
+        parser.add_argument('--output', default='-', help='File to write, or - for standard output.')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to csv for .csv files, otherwise ndjson.')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows read from the database per query.')
+        parser.add_argument('--media', help='Also copy the referenced media files into this zip file.')
+
+    def handle(self, *args, **options):
+        dataset = DATASETS[options['dataset']]()
+        fmt = options['format'] or guess_format(options['output'])
+        bundle = MediaBundle(options['media'], 'w') if options['media'] else None
+        started = time.perf_counter()
+
+        def rows():
+            for obj in dataset.queryset().iterator(chunk_size=options['batch_size']):
+                row = dataset.row(obj)
+                if bundle:
+                    for field in dataset.media_fields:
+                        bundle.add(row[field])
+                yield row
+
+        try:
+            if options['output'] == '-':
+                count = write_rows(dataset, rows(), sys.stdout, fmt)
+            else:
+                with open(options['output'], 'w', newline='', encoding='utf-8') as stream:
+                    count = write_rows(dataset, rows(), stream, fmt)
+        finally:
+            if bundle:
+                bundle.close()
+
+        elapsed = time.perf_counter() - started
+        # Progress goes to stderr, so the rows can be piped from stdout.
+        self.stderr.write(f'Exported {count} {options["dataset"]} in {elapsed:.2f}s '
+                          f'({count / elapsed if elapsed else 0:.0f} rows/s)')
+        if bundle and bundle.missing:
+            self.stderr.write(f'{bundle.missing} referenced media files were missing from the storage')
@@ -0,0 +1,195 @@
+import datetime
+import email.parser
+import email.policy
+import itertools
+import json
+import re
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from django.core.management.base import BaseCommand
+
+EVENTS_PATH = re.compile(r'^/calendar/v3/calendars/([^/]+)/events(?:/([^/]+))?$')
+
+
+class FakeCalendar:
+    """
+    In-memory stand-in for the parts of Google Calendar v3 used by
+    users.calendar_sync: paged events.list with sync tokens, insert, delete
+    and multipart batch requests, plus the OAuth token endpoint used by
+    users.tokens. Sync tokens only survive for the lifetime of the process,
+    so restarting it makes clients fall back to a full sync.
+    """
+
+    def __init__(self, token_lifetime=3600):
+        self.token_lifetime = token_lifetime
+        self.token_refreshes = 0
+        self.lock = threading.Lock()
+        self.instance = uuid.uuid4().hex[:8]
+        self.sequence = itertools.count(1)
+        self.last_change = 0
+        # calendar id -> event id -> (change number, event)
+        self.calendars = {}
+        self.requests = 0
+
+    def _store(self, calendar_id, event):
+        self.last_change = next(self.sequence)
+        event['updated'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        event['etag'] = f'"{self.last_change}"'
+        self.calendars.setdefault(calendar_id, {})[event['id']] = (self.last_change, event)
+        return event
+
+    def seed(self, calendar_id, count):
+        start = datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+        with self.lock:
+            for i in range(count):
+                begins = start + datetime.timedelta(hours=i)
+                self._store(calendar_id, {
+                    'id': uuid.uuid4().hex, 'status': 'confirmed', 'summary': f'Event {i}',
+                    'start': {'dateTime': begins.isoformat()},
+                    'end': {'dateTime': (begins + datetime.timedelta(minutes=30)).isoformat()},
+                })
+
+    def list(self, calendar_id, query):
+        page_size = int(query.get('maxResults', 250))
+        with self.lock:
+            # Page tokens carry the change number the listing started at, so
+            # changes made while a client pages through are left for its next sync.
+            offset, pinned = map(int, query.get('pageToken', f'0:{self.last_change}').split(':'))
+            events = self.calendars.get(calendar_id, {}).values()
+            if 'syncToken' in query:
+                instance, _, since = query['syncToken'].partition('-')
+                if instance != self.instance:
+                    return 410, {'error': {'code': 410, 'message': 'Sync token is no longer valid.'}}
+                changed = [(n, e) for n, e in events if int(since) < n <= pinned]
+            else:
+                changed = [(n, e) for n, e in events if n <= pinned and e['status'] != 'cancelled']
+            changed.sort(key=lambda pair: pair[0])
+            page = {'kind': 'calendar#events', 'items': [dict(e) for _, e in changed[offset:offset + page_size]]}
+            if offset + page_size < len(changed):
+                page['nextPageToken'] = f'{offset + page_size}:{pinned}'
+            else:
+                page['nextSyncToken'] = f'{self.instance}-{pinned}'
+            return 200, page
+
+    def insert(self, calendar_id, body):
+        with self.lock:
+            event_id = body.get('id') or uuid.uuid4().hex
+            if event_id in self.calendars.get(calendar_id, {}):
+                return 409, {'error': {'code': 409, 'message': 'The requested identifier already exists.'}}
+            return 200, self._store(calendar_id, dict(body, id=event_id, status='confirmed'))
+
+    def delete(self, calendar_id, event_id):
+        with self.lock:
+            stored = self.calendars.get(calendar_id, {}).get(event_id)
+            if stored is None:
+                return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+            if stored[1]['status'] == 'cancelled':
+                return 410, {'error': {'code': 410, 'message': 'Resource has been deleted'}}
+            self._store(calendar_id, dict(stored[1], status='cancelled'))
+            return 204, None
+
+    def refresh_token(self, form):
+        with self.lock:
+            if form.get('grant_type') != 'refresh_token' or form.get('refresh_token') == 'revoked':
+                return 400, {'error': 'invalid_grant', 'error_description': 'Token has been expired or revoked.'}
+            self.token_refreshes += 1
+            return 200, {'access_token': f'fake-{uuid.uuid4().hex}', 'expires_in': self.token_lifetime,
+                         'token_type': 'Bearer'}
+
+    def dispatch(self, method, target, body):
+        self.requests += 1
+        url = urlsplit(target)
+        match = EVENTS_PATH.match(url.path)
+        if not match:
+            return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+        calendar_id, event_id = unquote(match[1]), match[2] and unquote(match[2])
+        if method == 'GET' and not event_id:
+            return self.list(calendar_id, {k: v[-1] for k, v in parse_qs(url.query).items()})
+        if method == 'POST' and not event_id:
+            return self.insert(calendar_id, body)
+        if method == 'DELETE' and event_id:
+            return self.delete(calendar_id, event_id)
+        return 405, {'error': {'code': 405, 'message': 'Method Not Allowed'}}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    calendar = None
+    quiet = False
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _send(self, status, payload, content_type='application/json'):
+        data = payload if isinstance(payload, bytes) else (json.dumps(payload).encode() if payload is not None else b'')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._send(*self.calendar.dispatch('GET', self.path, None))
+
+    def do_DELETE(self):
+        self._send(*self.calendar.dispatch('DELETE', self.path, None))
+
+    def do_POST(self):
+        raw = self._body()
+        if self.path.startswith('/batch/'):
+            return self.batch(raw)
+        if self.path == '/token':
+            form = {key: values[-1] for key, values in parse_qs(raw.decode()).items()}
+            return self._send(*self.calendar.refresh_token(form))
+        self._send(*self.calendar.dispatch('POST', self.path, json.loads(raw or b'{}')))
+
+    def batch(self, raw):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f'Content-Type: {self.headers["Content-Type"]}\r\n\r\n'.encode() + raw
+        )
+        boundary = f'batch_{uuid.uuid4().hex}'
+        out = []
+        for part in message.iter_parts():
+            head, _, body = part.get_payload(decode=True).decode().partition('\r\n\r\n')
+            method, target = head.split('\r\n', 1)[0].split(' ')[:2]
+            status, result = self.calendar.dispatch(method, target, json.loads(body) if body.strip() else None)
+            payload = json.dumps(result) if result is not None else ''
+            out.append(
+                f'--{boundary}\r\nContent-Type: application/http\r\n'
+                f'Content-ID: <response-{part["Content-ID"].strip("<>")}>\r\n\r\n'
+                f'HTTP/1.1 {status} {self.responses.get(status, ("",))[0]}\r\n'
+                f'Content-Type: application/json\r\n\r\n{payload}\r\n'
+            )
+        out.append(f'--{boundary}--\r\n')
+        self._send(200, ''.join(out).encode(), f'multipart/mixed; boundary={boundary}')
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+class Command(BaseCommand):
+    help = 'Run a local in-memory fake of the Google Calendar API for developing and exercising sync_calendars.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--seed', type=int, default=0, help='Events to create in the "primary" calendar.')
+        parser.add_argument('--token-lifetime', type=int, default=3600,
+                            help='expires_in of access tokens issued by POST /token.')
+        parser.add_argument('--quiet', action='store_true', help='Do not log every request.')
+
+    def handle(self, *args, **options):
+        calendar = FakeCalendar(options['token_lifetime'])
+        calendar.seed('primary', options['seed'])
+        handler = type('FakeCalendarHandler', (Handler,), {'calendar': calendar, 'quiet': options['quiet']})
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), handler)
+        self.stdout.write(f'Fake Calendar API on http://127.0.0.1:{options["port"]} ({options["seed"]} events seeded)')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,84 @@
+import socketserver
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class SlowSMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP to accept mail from smtplib, answering each message
+    only after the server's ``delay``, like a slow or distant mail relay.
+    Recipients containing the server's ``reject`` string are refused with a
+    permanent 550, and a transient 451 is answered to every ``flaky``-th message.
+    """
+
+    def handle(self):
+        self.wfile.write(b'220 fake ESMTP\r\n')
+        for line in self.rfile:
+            command = line[:4].upper()
+            if command == b'RCPT':
+                if self.server.reject and self.server.reject in line.decode(errors='replace'):
+                    self.wfile.write(b'550 No such user here\r\n')
+                    continue
+                self.wfile.write(b'250 OK\r\n')
+            elif command == b'DATA':
+                self.wfile.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                for data in self.rfile:
+                    if data == b'.\r\n':
+                        break
+                time.sleep(self.server.delay)
+                if self.server.accept():
+                    self.wfile.write(b'250 OK\r\n')
+                else:
+                    self.wfile.write(b'451 Try again later\r\n')
+            elif command == b'QUIT':
+                self.wfile.write(b'221 Bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 OK\r\n')
+
+
+class SlowSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, delay, port=0, reject='', flaky=0):
+        super().__init__(('127.0.0.1', port), SlowSMTPHandler)
+        self.delay = delay
+        self.reject = reject
+        self.flaky = flaky
+        self.messages = 0
+        self.received = 0
+        self.connections = 0
+
+    def accept(self):
+        self.received += 1
+        if self.flaky and self.received % self.flaky == 0:
+            return False
+        self.messages += 1
+        return True
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+class Command(BaseCommand):
+    help = 'Run a local SMTP sink that accepts and discards mail, for developing and exercising send_emails.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--delay', type=float, default=0.0, help='Seconds taken to accept each message.')
+        parser.add_argument('--reject', default='', help='Refuse recipients containing this string with a 550.')
+        parser.add_argument('--flaky', type=int, default=0, help='Answer every Nth message with a transient 451.')
+
+    def handle(self, *args, **options):
+        server = SlowSMTPServer(options['delay'], options['port'], options['reject'], options['flaky'])
+        self.stdout.write(f'Fake SMTP server on 127.0.0.1:{options["port"]}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'{server.messages} messages over {server.connections} connections')
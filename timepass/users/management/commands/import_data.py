@@ -0,0 +1,58 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.transfer import DATASETS, FORMATS, MediaBundle, batched, guess_format, load_batch, read_rows
+
+
+class Command(BaseCommand):
+    help = ('Import a file written by export_data. Rows are read as a stream and written in batches, each '
+            'in its own transaction; after an interruption, rerun with the --offset printed for the last '
+            'committed batch. Rows that already exist are updated (profiles) or skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(DATASETS))
+        parser.add_argument('input', help='File to read, or - for standard input.')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to csv for .csv files, otherwise ndjson.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per batch.')
+        parser.add_argument('--offset', type=int, default=0, help='Skip this many rows, to resume an import.')
+        parser.add_argument('--media', help='Copy the files of this zip, written by export_data --media, into the media storage first.')
+
+    def handle(self, *args, **options):
+        dataset = DATASETS[options['dataset']]()
+        fmt = options['format'] or guess_format(options['input'])
+
+        if options['media']:
+            bundle = MediaBundle(options['media'], 'r')
+            try:
+                self.stdout.write(f'Copied {bundle.extract()} media files')
+            finally:
+                bundle.close()
+
+        if options['input'] == '-':
+            self.load(dataset, sys.stdin, fmt, options)
+        else:
+            with open(options['input'], newline='', encoding='utf-8') as stream:
+                self.load(dataset, stream, fmt, options)
+
+    def load(self, dataset, stream, fmt, options):
+        started = time.perf_counter()
+        offset = options['offset']
+        totals = [0, 0, 0]
+        for rows in batched(read_rows(stream, fmt, offset), options['batch_size']):
+            for i, count in enumerate(load_batch(dataset, rows, options['batch_size'])):
+                totals[i] += count
+            offset += len(rows)
+            elapsed = time.perf_counter() - started
+            processed = offset - options['offset']
+            self.stdout.write(f'{processed} rows, {processed / elapsed:.0f} rows/s (resume with --offset {offset})')
+
+        elapsed = time.perf_counter() - started
+        created, updated, skipped = totals
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {options["dataset"]}: {created} created, {updated} updated, {skipped} skipped '
+            f'in {elapsed:.2f}s'
+        ))
+        if dataset.media_fields and created + updated:
+            self.stdout.write('Run `manage.py process_image_jobs --backfill` to generate renditions for imported images.')
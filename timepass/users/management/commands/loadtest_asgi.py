@@ -0,0 +1,211 @@
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+import requests
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from users import specialities
+from users.models import DoctorDirectoryEntry, OutboundEmail, Profile
+
+from .fake_smtp_server import SlowSMTPServer
+
+PREFIX = 'asgi-'
+
+SERVERS = {
+    'wsgi': ('gunicorn', lambda port, workers: [
+        '-m', 'gunicorn', 'timepass.wsgi:application', '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers), '--log-level', 'warning',
+    ]),
+    'asgi': ('uvicorn', lambda port, workers: [
+        '-m', 'uvicorn', 'timepass.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+        '--workers', str(workers), '--log-level', 'warning',
+    ]),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = ('Compare how many concurrent requests the app sustains under uvicorn (ASGI) and '
+            'gunicorn sync workers (WSGI) with the same number of worker processes. Half the '
+            'clients submit password resets, whose emails are queued in the outbox (any sent inline '
+            'would go to a deliberately slow local SMTP server); the other half look doctors up. '
+            'Creates users prefixed "asgi-" and removes them and their queued emails afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', default='wsgi,asgi', help='Comma separated: wsgi, asgi.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes per server.')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent clients.')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per server.')
+        parser.add_argument('--smtp-delay', type=float, default=0.2, help='Seconds the SMTP server takes per message.')
+
+    def handle(self, *args, **options):
+        servers = options['servers'].split(',')
+        for name in servers:
+            if name not in SERVERS:
+                raise CommandError(f'Unknown server {name!r}')
+            if importlib.util.find_spec(SERVERS[name][0]) is None:
+                raise CommandError(f'{SERVERS[name][0]} is not installed (pip install -r requirements.txt)')
+
+        smtp = SlowSMTPServer(options['smtp_delay'])
+        threading.Thread(target=smtp.serve_forever, daemon=True).start()
+        tag = f'{PREFIX}{uuid.uuid4().hex[:8]}'
+        session_key = None
+        try:
+            emails, session_key, speciality = self.seed(tag, options['concurrency'])
+            results = {}
+            for name in servers:
+                results[name] = self.run_server(name, options, smtp, emails, session_key, speciality)
+                self.report(name, results[name], options)
+            if len(results) == 2:
+                wsgi, asgi = results['wsgi'], results['asgi']
+                if wsgi['total_rps']:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'ASGI served {asgi["total_rps"] / wsgi["total_rps"]:.1f}x the requests/sec of WSGI'
+                    ))
+        finally:
+            smtp.shutdown()
+            smtp.server_close()
+            User.objects.filter(username__startswith=tag).delete()
+            OutboundEmail.objects.filter(to__startswith=tag).delete()
+            if session_key:
+                import_module(settings.SESSION_ENGINE).SessionStore(session_key).delete()
+
+    def seed(self, tag, clients):
+        """
+        Accounts for the reset emails to go to, a doctor to look up and a
+        logged-in session for the lookups.
+        """
+        password = make_password(uuid.uuid4().hex)
+        users = [User.objects.create(username=f'{tag}-{i}', email=f'{tag}-{i}@example.com', password=password)
+                 for i in range(clients)]
+        speciality = specialities.all_specialities()[0]
+        doctor = User.objects.create(username=f'{tag}-doctor', first_name='Load', last_name='Doctor')
+        Profile.objects.filter(user=doctor).update(user_type='doctor', speciality=speciality)
+        DoctorDirectoryEntry.objects.update_or_create(
+            user=doctor, defaults={'speciality': speciality, 'name': 'Load Doctor', 'search_name': 'load doctor'}
+        )
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session.update({
+            SESSION_KEY: str(users[0].pk),
+            BACKEND_SESSION_KEY: settings.AUTHENTICATION_BACKENDS[0],
+            HASH_SESSION_KEY: users[0].get_session_auth_hash(),
+        })
+        session.create()
+        return [user.email for user in users], session.session_key, speciality
+
+    def run_server(self, name, options, smtp, emails, session_key, speciality):
+        port = free_port()
+        env = dict(
+            os.environ,
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=str(smtp.server_address[1]),
+            RATELIMIT_ENABLED='0', METRICS_LOG_SAMPLE_RATE='0', METRICS_SLOW_REQUEST_MS='1000000',
+        )
+        process = subprocess.Popen([sys.executable, *SERVERS[name][1](port, options['workers'])],
+                                   cwd=settings.BASE_DIR, env=env)
+        base = f'http://127.0.0.1:{port}'
+        try:
+            self.wait_until_up(base, process)
+            sent_before = smtp.messages
+            queued_before = OutboundEmail.objects.filter(to__in=emails).count()
+            result = self.load(base, options, emails, session_key, speciality)
+            result['emails'] = OutboundEmail.objects.filter(to__in=emails).count() - queued_before
+            result['sent_inline'] = smtp.messages - sent_before
+            return result
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    def wait_until_up(self, base, process, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'Server exited with status {process.returncode}')
+            try:
+                # The first request also pays for loading the URLconf.
+                requests.get(f'{base}/login/', timeout=10)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise CommandError('Server did not start')
+
+    def load(self, base, options, emails, session_key, speciality):
+        latencies = {'password_reset': [], 'doctor_lookup': []}
+        errors = []
+        stop_at = time.time() + options['duration']
+
+        def client(i):
+            http = requests.Session()
+            kind = 'password_reset' if i % 2 == 0 else 'doctor_lookup'
+            if kind == 'password_reset':
+                http.get(f'{base}/password-reset/', timeout=60)
+                token = http.cookies['csrftoken']
+            else:
+                http.cookies.set(settings.SESSION_COOKIE_NAME, session_key)
+            while time.time() < stop_at:
+                started = time.perf_counter()
+                try:
+                    if kind == 'password_reset':
+                        response = http.post(f'{base}/password-reset/', timeout=60, allow_redirects=False, data={
+                            'csrfmiddlewaretoken': token, 'email': emails[i],
+                        })
+                        ok = response.status_code == 302
+                    else:
+                        response = http.get(f'{base}/get-doctors-by-speciality/', timeout=60,
+                                            params={'speciality': speciality.pk, 'q': 'load'})
+                        ok = response.status_code == 200 and response.json()['results']
+                except requests.RequestException as exc:
+                    ok, response = False, exc
+                if ok:
+                    latencies[kind].append((time.perf_counter() - started) * 1000)
+                else:
+                    errors.append(f'{kind}: {getattr(response, "status_code", response)}')
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(client, range(options['concurrency'])))
+        elapsed = time.time() - started
+        result = {'errors': len(errors), 'first_error': errors[0] if errors else None}
+        for kind, values in latencies.items():
+            result[kind] = {
+                'requests': len(values),
+                'rps': round(len(values) / elapsed, 1),
+                'p50_ms': round(percentile(values, 50), 1) if values else None,
+                'p95_ms': round(percentile(values, 95), 1) if values else None,
+                'mean_ms': round(statistics.mean(values), 1) if values else None,
+            }
+        result['total_rps'] = round(sum(len(values) for values in latencies.values()) / elapsed, 1)
+        return result
+
+    def report(self, name, result, options):
+        self.stdout.write(f'{name} ({SERVERS[name][0]}, {options["workers"]} workers, '
+                          f'{options["concurrency"]} clients): {result["total_rps"]} req/s, '
+                          f'{result["errors"]} errors, {result["emails"]} emails queued, {result["sent_inline"]} sent inline')
+        for kind in ('password_reset', 'doctor_lookup'):
+            r = result[kind]
+            self.stdout.write(f'  {kind:<15} {r["requests"]:>6} requests  {r["rps"]:>7}/s  '
+                              f'p50={r["p50_ms"]}ms p95={r["p95_ms"]}ms')
+        if result['first_error']:
+            self.stdout.write(f'  first error: {result["first_error"]}')
@@ -0,0 +1,97 @@
+import datetime
+import multiprocessing
+import statistics
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from users import specialities
+from users.booking import SlotUnavailable, book
+from users.models import Appointment, BookingStats
+
+
+def attempt_booking(patient_id, doctor_id, date, slot, start_at):
+    """
+    One contender: wait for the shared start time, then try to book the slot.
+    Returns (outcome, latency in ms).
+    """
+    doctor = User.objects.select_related('profile').get(pk=doctor_id)
+    appointment = Appointment(patient_id=patient_id, doctor=doctor, date=date, time=slot,
+                              speciality_id=doctor.profile.speciality_id)
+    time.sleep(max(0.0, start_at - time.time()))
+    started = time.perf_counter()
+    try:
+        book(appointment)
+        outcome = 'booked'
+    except SlotUnavailable:
+        outcome = 'conflict'
+    except Exception as exc:
+        outcome = f'error: {exc.__class__.__name__}: {exc}'
+    finally:
+        connections.close_all()
+    return outcome, (time.perf_counter() - started) * 1000
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = ('Fire N concurrent bookings at one slot and check exactly one wins. '
+            'Creates throwaway users prefixed "loadtest-" and removes them afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--mode', choices=['thread', 'process'], default='thread')
+        parser.add_argument('--max-p99-ms', type=float, default=2000.0,
+                            help='Fail if the p99 booking latency exceeds this.')
+
+    def handle(self, *args, **options):
+        n = options['concurrency']
+        tag = f'loadtest-{uuid.uuid4().hex[:8]}'
+        doctor = User.objects.create_user(f'{tag}-doctor', first_name='Load', last_name='Test')
+        doctor.profile.user_type = 'doctor'
+        doctor.profile.speciality = specialities.all_specialities()[0]
+        doctor.profile.save()
+        patient_ids = [User.objects.create_user(f'{tag}-patient-{i}').pk for i in range(n)]
+        date = datetime.date.today() + datetime.timedelta(days=30)
+        slot = datetime.time(10, 0)
+
+        try:
+            # Workers open their own connections; forked processes must not share ours.
+            connections.close_all()
+            if options['mode'] == 'process':
+                pool = ProcessPoolExecutor(max_workers=n, mp_context=multiprocessing.get_context('fork'))
+            else:
+                pool = ThreadPoolExecutor(max_workers=n)
+            start_at = time.time() + 1.0
+            with pool:
+                futures = [pool.submit(attempt_booking, pid, doctor.pk, date, slot, start_at) for pid in patient_ids]
+                results = [future.result() for future in futures]
+
+            outcomes = [outcome for outcome, _ in results]
+            latencies = [latency for _, latency in results]
+            booked = Appointment.objects.filter(doctor=doctor, date=date, time=slot).count()
+            stats = BookingStats.objects.filter(doctor=doctor).first()
+            p50, p99 = percentile(latencies, 50), percentile(latencies, 99)
+
+            self.stdout.write(f'{n} concurrent bookings ({options["mode"]} mode)')
+            self.stdout.write(f'  booked:    {outcomes.count("booked")} (rows in db: {booked})')
+            self.stdout.write(f'  conflicts: {outcomes.count("conflict")} (counted: {stats.conflicts if stats else 0})')
+            for error in sorted({o for o in outcomes if o.startswith('error')}):
+                self.stdout.write(f'  {error} x{outcomes.count(error)}')
+            self.stdout.write(f'  latency:   p50={p50:.1f}ms p99={p99:.1f}ms max={max(latencies):.1f}ms '
+                              f'mean={statistics.mean(latencies):.1f}ms')
+
+            if booked != 1 or outcomes.count('booked') != 1:
+                raise CommandError(f'Expected exactly one booking, got {booked}')
+            if p99 > options['max_p99_ms']:
+                raise CommandError(f'p99 latency {p99:.1f}ms exceeds {options["max_p99_ms"]}ms')
+            self.stdout.write(self.style.SUCCESS('Exactly one booking won'))
+        finally:
+            User.objects.filter(username__startswith=tag).delete()
@@ -0,0 +1,46 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.images import claim_jobs, enqueue_missing, requeue_stale_jobs, run_job
+from users.models import Profile, Tweet
+
+
+class Command(BaseCommand):
+    help = 'Generate image renditions for queued uploads using a pool of worker threads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.IMAGE_WORKERS,
+                            help='Number of worker threads resizing images.')
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Jobs claimed from the queue per round.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the queue instead of exiting once it is empty.')
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help='Seconds to wait between polls when the queue is empty.')
+        parser.add_argument('--backfill', action='store_true',
+                            help='Queue existing avatars and tweet photos that have no renditions yet.')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            queued = enqueue_missing(Profile, 'avatar') + enqueue_missing(Tweet, 'photo')
+            self.stdout.write(f'Queued {queued} existing images')
+
+        processed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                requeue_stale_jobs()
+                claimed = claim_jobs(options['batch_size'])
+                if not claimed:
+                    if not options['loop']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                for status in pool.map(run_job, claimed):
+                    processed += 1
+                    if status != 'done':
+                        self.stderr.write(f'Job finished with status {status}')
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} image jobs'))
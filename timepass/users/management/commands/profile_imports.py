@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SCRIPT = '''
+import django
+django.setup()
+import importlib
+for name in {modules!r}:
+    importlib.import_module(name)
+'''
+
+
+def parse_importtime(output):
+    """
+    Rows of (self_us, cumulative_us, depth, module) from ``python -X importtime``.
+    """
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+
+class Command(BaseCommand):
+    help = ('Summarise `python -X importtime` for a cold process that sets up Django and '
+            'imports the given modules (by default the WSGI app and the URLconf).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('modules', nargs='*', default=['timepass.wsgi', settings.ROOT_URLCONF])
+        parser.add_argument('--top', type=int, default=20, help='Rows to show in each table.')
+
+    def handle(self, *args, **options):
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', SCRIPT.format(modules=options['modules'])],
+            cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True,
+        )
+        if completed.returncode:
+            raise CommandError(completed.stderr[-2000:])
+        rows = parse_importtime(completed.stderr)
+        total = sum(self_us for self_us, *_ in rows)
+
+        packages = defaultdict(int)
+        for self_us, _, _, name in rows:
+            packages[name.split('.')[0]] += self_us
+
+        self.stdout.write(f'Total import time: {total / 1000:.1f}ms across {len(rows)} modules\n')
+        self.stdout.write('By top-level package (self time):')
+        for name, us in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {us / 1000:8.1f}ms  {us / total:6.1%}  {name}')
+        self.stdout.write('\nSlowest imports (cumulative):')
+        for self_us, cumulative_us, depth, name in sorted(rows, key=lambda row: -row[1])[:options['top']]:
+            self.stdout.write(f'  {cumulative_us / 1000:8.1f}ms  {"  " * depth}{name}')
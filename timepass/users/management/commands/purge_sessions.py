@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from users.sessions import purge_expired
+
+
+class Command(BaseCommand):
+    help = ('Delete expired database sessions in small batches. Unlike clearsessions, '
+            'no single DELETE holds the write lock for long.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to sleep between batches so writers can get in.')
+
+    def handle(self, *args, **options):
+        deleted = purge_expired(options['batch_size'], options['pause'])
+        self.stdout.write(f'Deleted {deleted} expired sessions')
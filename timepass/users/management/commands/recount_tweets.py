@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from users.counters import recount
+from users.feed import get_blog_types, invalidate_feed_cache
+from users.models import AuthorStats
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the published tweet counters per category and per author from the tweets table, '
+            'e.g. after tweets were changed with raw SQL.')
+
+    def handle(self, *args, **options):
+        recount()
+        invalidate_feed_cache()
+        categories = get_blog_types()
+        self.stdout.write(self.style.SUCCESS(
+            f'Counted {sum(count for _, count in categories)} published tweets in {len(categories)} categories '
+            f'by {AuthorStats.objects.filter(published__gt=0).count()} authors'
+        ))
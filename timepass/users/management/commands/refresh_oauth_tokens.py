@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.tokens import refresh_expiring
+
+
+class Command(BaseCommand):
+    help = ('Renew stored OAuth access tokens that expire within TOKEN_REFRESH_MARGIN seconds, '
+            'so requests never have to refresh them inline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--margin', type=int, default=settings.TOKEN_REFRESH_MARGIN,
+                            help='Refresh tokens expiring within this many seconds.')
+        parser.add_argument('--loop', action='store_true', help='Keep refreshing every --interval seconds.')
+        parser.add_argument('--interval', type=float, default=settings.TOKEN_REFRESH_INTERVAL)
+
+    def handle(self, *args, **options):
+        while True:
+            refreshed, failed = refresh_expiring(options['margin'])
+            if refreshed or failed or not options['loop']:
+                self.stdout.write(f'Refreshed {refreshed} tokens, {failed} failed')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
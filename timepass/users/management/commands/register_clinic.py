@@ -0,0 +1,69 @@
+import csv
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from users.forms import ClinicMemberForm
+from users.registration import bulk_register
+
+
+class Command(BaseCommand):
+    help = ('Onboard a clinic from a CSV file with one row per user. Columns: username, email and '
+            'optionally first_name, last_name, user_type (patient or doctor), speciality (id or name), '
+            'password, address_line1, city, state, pincode. Users without a password must set one '
+            'through a password reset. Nothing is imported if any row is invalid.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='Path of the CSV file, or - for standard input.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per INSERT statement.')
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help='Import the valid rows and only report the invalid ones.')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without importing it.')
+
+    def handle(self, *args, **options):
+        if options['csv_file'] == '-':
+            members, errors = self.validate(csv.DictReader(sys.stdin))
+        else:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as f:
+                members, errors = self.validate(csv.DictReader(f))
+
+        for line, message in errors:
+            self.stderr.write(f'Line {line}: {message}')
+        if errors and not options['skip_invalid']:
+            raise CommandError(f'{len(errors)} invalid rows, nothing imported')
+        if options['dry_run']:
+            self.stdout.write(f'{len(members)} rows are valid')
+            return
+
+        started = time.perf_counter()
+        users = bulk_register(members, batch_size=options['batch_size'])
+        doctors = sum(member['user_type'] == 'doctor' for member in members)
+        self.stdout.write(self.style.SUCCESS(
+            f'Registered {len(users)} users ({doctors} doctors) in {time.perf_counter() - started:.2f}s'
+        ))
+
+    def validate(self, rows):
+        """
+        Clean every row and reject usernames that are taken or repeated in
+        the file. Returns (members, [(line, message)]).
+        """
+        members, errors, lines = [], [], {}
+        for line, row in enumerate(rows, start=2):
+            form = ClinicMemberForm({key.strip(): (value or '').strip() for key, value in row.items() if key})
+            if not form.is_valid():
+                errors.append((line, '; '.join(f'{field}: {" ".join(messages)}' for field, messages in form.errors.items())))
+                continue
+            username = form.cleaned_data['username']
+            if username in lines:
+                errors.append((line, f'username {username!r} repeats line {lines[username]}'))
+                continue
+            lines[username] = line
+            members.append(form.cleaned_data)
+
+        taken = set(User.objects.filter(username__in=list(lines)).values_list('username', flat=True))
+        for username in taken:
+            errors.append((lines[username], f'username {username!r} is already registered'))
+        errors.sort()
+        return [member for member in members if member['username'] not in taken], errors
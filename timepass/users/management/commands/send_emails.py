@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from users.models import OutboundEmail
+from users.outbox import drain, queue_reminders
+
+
+class Command(BaseCommand):
+    help = ('Send queued emails over one SMTP connection per round, retrying failures with backoff. '
+            'Also queues appointment reminders.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE,
+                            help='Emails claimed from the queue at a time.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the queue instead of exiting once it is empty.')
+        parser.add_argument('--sleep', type=float, default=5.0,
+                            help='Seconds to wait between polls.')
+        parser.add_argument('--reminder-interval', type=float, default=60.0,
+                            help='Seconds between looking for appointments that need a reminder.')
+        parser.add_argument('--no-reminders', action='store_true', help='Do not queue appointment reminders.')
+        parser.add_argument('--retry-dead', action='store_true',
+                            help='Move dead emails back to the queue before sending.')
+
+    def handle(self, *args, **options):
+        if options['retry_dead']:
+            revived = OutboundEmail.objects.filter(status=OutboundEmail.DEAD).update(
+                status=OutboundEmail.PENDING, attempts=0, next_attempt_at=timezone.now()
+            )
+            self.stdout.write(f'Requeued {revived} dead emails')
+
+        reminders_at = 0
+        while True:
+            if not options['no_reminders'] and time.monotonic() >= reminders_at:
+                queued = queue_reminders()
+                reminders_at = time.monotonic() + options['reminder_interval']
+                if queued:
+                    self.stdout.write(f'Queued {queued} appointment reminders')
+            sent, retried, dead = drain(options['batch_size'])
+            if sent or retried or dead or not options['loop']:
+                self.stdout.write(f'Sent {sent} emails, {retried} to retry, {dead} dead')
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['sleep'])
@@ -0,0 +1,61 @@
+import time
+
+import requests
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from users.calendar_sync import CalendarAPIError, CalendarClient, push_appointments, sync_calendar
+from users.models import CalendarSync
+from users.tokens import TokenUnavailable, get_access_token
+
+
+class Command(BaseCommand):
+    help = ('Mirror doctors\' Google Calendars into CalendarEvent using incremental sync '
+            'tokens, then push their new appointments as events in batched API calls.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', action='append', default=[],
+                            help='Username of a doctor to start syncing (repeatable).')
+        parser.add_argument('--calendar', default='primary', help='Calendar id for doctors added with --doctor.')
+        parser.add_argument('--api-url', help='Calendar API base URL, e.g. a local fake_calendar_api.')
+        parser.add_argument('--access-token', help='Use this access token instead of each doctor\'s stored one.')
+        parser.add_argument('--full', action='store_true', help='Drop sync tokens and list every calendar in full.')
+        parser.add_argument('--no-push', action='store_true', help='Only pull changes, do not push appointments.')
+        parser.add_argument('--loop', action='store_true', help='Keep syncing every --interval seconds.')
+        parser.add_argument('--interval', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        for username in options['doctor']:
+            doctor = User.objects.filter(username=username, profile__user_type='doctor').first()
+            if doctor is None:
+                raise CommandError(f'No doctor named {username!r}')
+            CalendarSync.objects.get_or_create(doctor=doctor, defaults={'calendar_id': options['calendar']})
+        if options['full']:
+            CalendarSync.objects.update(sync_token='')
+
+        session = requests.Session()
+        while True:
+            self.sync_all(session, options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def sync_all(self, session, options):
+        for sync in CalendarSync.objects.select_related('doctor'):
+            started = time.perf_counter()
+            try:
+                token = options['access_token'] or get_access_token(sync.doctor_id)
+                client = CalendarClient(token, base_url=options['api_url'], session=session)
+                pulled = sync_calendar(client, sync)
+                pushed = {} if options['no_push'] else push_appointments(client, sync)
+            except (CalendarAPIError, TokenUnavailable, OSError) as exc:
+                sync.last_error = str(exc)[:1000]
+                sync.save(update_fields=['last_error'])
+                self.stderr.write(f'{sync}: {exc}')
+                continue
+            self.stdout.write(
+                f'{sync}: {"full" if pulled["full"] else "incremental"} sync, {pulled["upserted"]} upserted, '
+                f'{pulled["deleted"]} deleted; pushed {pushed.get("created", 0)} appointments, '
+                f'removed {pushed.get("removed", 0)}, {pushed.get("failed", 0)} failed '
+                f'({(time.perf_counter() - started) * 1000:.0f}ms)'
+            )
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_alter_appointment_patient'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['is_draft', 'category', 'created_at'], name='tweet_feed_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['is_draft', 'created_at'], name='tweet_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0016_workinghours'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('conflicts', models.PositiveIntegerField(default=0)),
+                ('expired_holds', models.PositiveIntegerField(default=0)),
+                ('doctor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='booking_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Booking stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='patient_slot_holds', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('doctor', 'date', 'time')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0017_slot_holds'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDirectoryEntry',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='directory_entry', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('speciality', models.CharField(max_length=100)),
+                ('name', models.CharField(max_length=150)),
+                ('search_name', models.CharField(max_length=150)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Doctor directory entries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['user_type', 'speciality'], name='profile_type_speciality_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctordirectoryentry',
+            index=models.Index(fields=['speciality', 'search_name'], name='directory_speciality_name_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def populate_directory(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+    DoctorDirectoryEntry = apps.get_model('users', 'DoctorDirectoryEntry')
+    entries = []
+    doctors = Profile.objects.filter(user_type='doctor').exclude(speciality__isnull=True).exclude(speciality='')
+    for profile in doctors.select_related('user').iterator():
+        user = profile.user
+        name = f'{user.first_name} {user.last_name}'.strip() or user.username
+        entries.append(DoctorDirectoryEntry(
+            user_id=user.pk, speciality=profile.speciality, name=name, search_name=name.lower()
+        ))
+    DoctorDirectoryEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0018_doctor_directory'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_directory, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,194 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+SPECIALITIES = [
+    'Cardiology',
+    'Dermatology',
+    'Neurology',
+    'Pediatrics',
+    'Ortho',
+    'Trauma',
+    'General Surgery',
+]
+
+
+def seed_specialities(apps, schema_editor):
+    Speciality = apps.get_model('users', 'Speciality')
+    for name in SPECIALITIES:
+        Speciality.objects.get_or_create(name=name)
+
+
+def convert_to_ids(apps, schema_editor):
+    Speciality = apps.get_model('users', 'Speciality')
+    Profile = apps.get_model('users', 'Profile')
+    DoctorProfile = apps.get_model('users', 'DoctorProfile')
+    Appointment = apps.get_model('users', 'Appointment')
+    DoctorDirectoryEntry = apps.get_model('users', 'DoctorDirectoryEntry')
+    ids = {s.name: s.pk for s in Speciality.objects.all()}
+
+    def speciality_id(name):
+        if name not in ids:
+            ids[name] = Speciality.objects.create(name=name).pk
+        return ids[name]
+
+    # DoctorProfile.speciality is the one doctors edit, so it wins where the two disagree.
+    for profile_id, name in DoctorProfile.objects.exclude(speciality='').values_list('profile_id', 'speciality'):
+        Profile.objects.filter(pk=profile_id).update(speciality=name)
+
+    for model in (Profile, Appointment):
+        names = model.objects.exclude(speciality__isnull=True).exclude(speciality='')
+        for name in names.values_list('speciality', flat=True).distinct():
+            model.objects.filter(speciality=name).update(speciality_ref_id=speciality_id(name))
+    rebuild_directory(apps, 'speciality_ref_id', lambda profile: profile.speciality_ref_id)
+
+
+def rebuild_directory(apps, *fields):
+    """
+    The directory is derived from Profile, so rebuild it rather than convert it.
+    ``fields`` pairs DoctorDirectoryEntry columns with getters on the profile.
+    """
+    Profile = apps.get_model('users', 'Profile')
+    DoctorDirectoryEntry = apps.get_model('users', 'DoctorDirectoryEntry')
+    DoctorDirectoryEntry.objects.all().delete()
+    columns = dict(zip(fields[::2], fields[1::2]))
+    entries = []
+    doctors = Profile.objects.filter(user_type='doctor', speciality_ref__isnull=False)
+    for profile in doctors.select_related('user', 'speciality_ref').iterator():
+        user = profile.user
+        name = f'{user.first_name} {user.last_name}'.strip() or user.username
+        values = {column: getter(profile) for column, getter in columns.items()}
+        entries.append(DoctorDirectoryEntry(user_id=user.pk, name=name, search_name=name.lower(), **values))
+    DoctorDirectoryEntry.objects.bulk_create(entries, batch_size=500)
+
+
+def convert_to_names(apps, schema_editor):
+    Speciality = apps.get_model('users', 'Speciality')
+    Profile = apps.get_model('users', 'Profile')
+    DoctorProfile = apps.get_model('users', 'DoctorProfile')
+    Appointment = apps.get_model('users', 'Appointment')
+    for speciality in Speciality.objects.all():
+        for model in (Profile, Appointment):
+            model.objects.filter(speciality_ref_id=speciality.pk).update(speciality=speciality.name)
+        DoctorProfile.objects.filter(profile__speciality_ref_id=speciality.pk).update(speciality=speciality.name)
+    rebuild_directory(
+        apps,
+        'speciality', lambda profile: profile.speciality_ref.name,
+        'speciality_ref_id', lambda profile: profile.speciality_ref_id,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0019_populate_doctor_directory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Speciality',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Specialities',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(seed_specialities, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='profile',
+            name='profile_type_speciality_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='doctordirectoryentry',
+            name='directory_speciality_name_idx',
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='speciality_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='users.speciality'),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='speciality_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='users.speciality'),
+        ),
+        migrations.AddField(
+            model_name='doctordirectoryentry',
+            name='speciality_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.speciality'),
+        ),
+        # Relax the old columns first so that migrating backwards re-adds them as
+        # nullable and convert_to_names can fill them in.
+        migrations.AlterField(
+            model_name='doctorprofile',
+            name='speciality',
+            field=models.CharField(choices=[('Cardiology', 'Cardiology'), ('Dermatology', 'Dermatology'), ('Neurology', 'Neurology'), ('Pediatrics', 'Pediatrics'), ('Ortho', 'Ortho'), ('Trauma', 'Trauma'), ('General Surgery', 'General Surgery')], max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='speciality',
+            field=models.CharField(choices=[('Cardiology', 'Cardiology'), ('Dermatology', 'Dermatology'), ('Neurology', 'Neurology'), ('Pediatrics', 'Pediatrics'), ('Ortho', 'Ortho'), ('Trauma', 'Trauma'), ('General Surgery', 'General Surgery')], max_length=100, null=True, verbose_name='Speciality'),
+        ),
+        migrations.AlterField(
+            model_name='doctordirectoryentry',
+            name='speciality',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.RunPython(convert_to_ids, convert_to_names),
+        migrations.RemoveField(
+            model_name='profile',
+            name='speciality',
+        ),
+        migrations.RemoveField(
+            model_name='doctorprofile',
+            name='speciality',
+        ),
+        migrations.RemoveField(
+            model_name='appointment',
+            name='speciality',
+        ),
+        migrations.RemoveField(
+            model_name='doctordirectoryentry',
+            name='speciality',
+        ),
+        migrations.RenameField(
+            model_name='profile',
+            old_name='speciality_ref',
+            new_name='speciality',
+        ),
+        migrations.RenameField(
+            model_name='appointment',
+            old_name='speciality_ref',
+            new_name='speciality',
+        ),
+        migrations.RenameField(
+            model_name='doctordirectoryentry',
+            old_name='speciality_ref',
+            new_name='speciality',
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='speciality',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='profiles', to='users.speciality'),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='speciality',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='appointments', to='users.speciality', verbose_name='Speciality'),
+        ),
+        migrations.AlterField(
+            model_name='doctordirectoryentry',
+            name='speciality',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.speciality'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['user_type', 'speciality'], name='profile_type_speciality_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctordirectoryentry',
+            index=models.Index(fields=['speciality', 'search_name'], name='directory_speciality_name_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0020_speciality'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calendar_id', models.CharField(default='primary', max_length=255)),
+                ('sync_token', models.CharField(blank=True, max_length=255)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('doctor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_sync', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CalendarEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calendar_id', models.CharField(max_length=255)),
+                ('event_id', models.CharField(max_length=1024)),
+                ('status', models.CharField(default='confirmed', max_length=20)),
+                ('summary', models.CharField(blank=True, max_length=255)),
+                ('description', models.TextField(blank=True)),
+                ('start', models.DateTimeField(blank=True, null=True)),
+                ('end', models.DateTimeField(blank=True, null=True)),
+                ('all_day', models.BooleanField(default=False)),
+                ('etag', models.CharField(blank=True, max_length=64)),
+                ('updated', models.DateTimeField(blank=True, null=True)),
+                ('appointment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='calendar_event', to='users.appointment')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['doctor', 'start'], name='calendarevent_doctor_start_idx')],
+                'unique_together': {('doctor', 'calendar_id', 'event_id')},
+            },
+        ),
+    ]
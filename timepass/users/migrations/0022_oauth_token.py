@@ -0,0 +1,29 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0021_calendar_sync'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OAuthToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('access_token', models.TextField()),
+                ('refresh_token', models.TextField(blank=True)),
+                ('scopes', models.TextField(blank=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('refresh_failures', models.PositiveSmallIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='oauth_token', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
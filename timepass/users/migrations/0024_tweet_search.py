@@ -0,0 +1,88 @@
+from django.db import migrations
+
+# The index is maintained by the database itself, so bulk_create, queryset
+# updates and cascade deletes keep it current as well as Model.save().
+# Only published tweets are indexed.
+
+SQLITE_FORWARD = [
+    # External content: the text stays in users_tweet and snippet() reads it from there.
+    """
+    CREATE VIRTUAL TABLE users_tweet_search USING fts5(
+        title, summary, content, content='users_tweet', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER users_tweet_search_insert AFTER INSERT ON users_tweet WHEN NOT new.is_draft BEGIN
+        INSERT INTO users_tweet_search (rowid, title, summary, content)
+        VALUES (new.id, new.title, new.summary, new.content);
+    END
+    """,
+    # An external content index is told the old values of the row it drops.
+    """
+    CREATE TRIGGER users_tweet_search_delete AFTER DELETE ON users_tweet WHEN NOT old.is_draft BEGIN
+        INSERT INTO users_tweet_search (users_tweet_search, rowid, title, summary, content)
+        VALUES ('delete', old.id, old.title, old.summary, old.content);
+    END
+    """,
+    # Edits and publishing; one trigger so the old row is always dropped before the new one is added.
+    """
+    CREATE TRIGGER users_tweet_search_update AFTER UPDATE OF title, summary, content, is_draft ON users_tweet
+    WHEN NOT old.is_draft OR NOT new.is_draft BEGIN
+        INSERT INTO users_tweet_search (users_tweet_search, rowid, title, summary, content)
+        SELECT 'delete', old.id, old.title, old.summary, old.content WHERE NOT old.is_draft;
+        INSERT INTO users_tweet_search (rowid, title, summary, content)
+        SELECT new.id, new.title, new.summary, new.content WHERE NOT new.is_draft;
+    END
+    """,
+    """
+    INSERT INTO users_tweet_search (rowid, title, summary, content)
+    SELECT id, title, summary, content FROM users_tweet WHERE NOT is_draft
+    """,
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS users_tweet_search_update',
+    'DROP TRIGGER IF EXISTS users_tweet_search_delete',
+    'DROP TRIGGER IF EXISTS users_tweet_search_insert',
+    'DROP TABLE IF EXISTS users_tweet_search',
+]
+
+# A generated column is recomputed by PostgreSQL on every write of the row;
+# the partial GIN index only holds published tweets.
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE users_tweet ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(summary, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(content, '')), 'C')
+    ) STORED
+    """,
+    'CREATE INDEX users_tweet_search_idx ON users_tweet USING GIN (search_vector) WHERE NOT is_draft',
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS users_tweet_search_idx',
+    'ALTER TABLE users_tweet DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0023_outbound_email'),
+    ]
+
+    operations = [
+        # Other backends have no index and fall back to scanning in users.search.
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.0.7 on 2026-10-18 13:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_published(apps, schema_editor):
+    Tweet = apps.get_model('users', 'Tweet')
+    CategoryStats = apps.get_model('users', 'CategoryStats')
+    AuthorStats = apps.get_model('users', 'AuthorStats')
+    published = Tweet.objects.filter(is_draft=False).order_by()
+    CategoryStats.objects.bulk_create([
+        CategoryStats(category=row['category'], published=row['count'])
+        for row in published.values('category').annotate(count=Count('pk'))
+    ])
+    AuthorStats.objects.bulk_create([
+        AuthorStats(author_id=row['user_id'], published=row['count'])
+        for row in published.values('user_id').annotate(count=Count('pk'))
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0024_tweet_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('published', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Author stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=50, unique=True)),
+                ('published', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Category stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['user', 'is_draft', 'created_at'], name='tweet_feed_author_idx'),
+        ),
+        migrations.AddField(
+            model_name='authorstats',
+            name='author',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tweet_stats', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(count_published, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0025_tweet_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oauthtoken',
+            name='refreshing_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,21 +1,113 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from PIL import Image
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+import copy
 import uuid
-class Profile(models.Model):
-    SPECIALTIES = [
-        ('Cardiology', 'Cardiology'),
-        ('Dermatology', 'Dermatology'),
-        ('Neurology', 'Neurology'),
-        ('Pediatrics', 'Pediatrics'),
-        ('Ortho', 'Ortho'),
-        ('Trauma', 'Trauma'),
-        ('General Surgery', 'General Surgery')
-    ]
-    speciality = models.CharField(max_length=100, choices=SPECIALTIES, blank=True, null=True)
+
+
+class DirtyFieldsMixin:
+    """
+    Remembers the column values a model instance was loaded or last saved
+    with. save() without update_fields then writes only the columns that
+    changed, and skips the query and the save signals if none did.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_state = instance._field_state()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        # Also how deferred fields are loaded on first access.
+        if hasattr(self, '_saved_state'):
+            state = self._field_state()
+            # Relations without a column of their own, e.g. reverse ones, have no attname.
+            names = {getattr(self._meta.get_field(name), 'attname', None) for name in fields} if fields else state
+            self._saved_state.update({name: state[name] for name in names if name in state})
+
+    def _field_state(self):
+        state = {}
+        for field in self._meta.concrete_fields:
+            # Deferred fields are neither compared nor written.
+            if field.attname in self.__dict__ and not field.primary_key:
+                value = getattr(self, field.attname)
+                if isinstance(value, FieldFile):
+                    value = value.name
+                elif isinstance(value, (dict, list)):
+                    value = copy.deepcopy(value)
+                state[field.attname] = value
+        return state
+
+    def get_dirty_fields(self):
+        """
+        Names of the fields changed since the instance was loaded or saved;
+        every field for an instance that isn't in the database yet.
+        """
+        saved = getattr(self, '_saved_state', None)
+        if self._state.adding or saved is None:
+            return [field.name for field in self._meta.concrete_fields if not field.primary_key]
+        current = self._field_state()
+        # A field deferred when the instance was loaded and assigned since is dirty too.
+        return [
+            field.name for field in self._meta.concrete_fields
+            if field.attname in current and (field.attname not in saved or current[field.attname] != saved[field.attname])
+        ]
+
+    def has_changed(self, field_name, update_fields=None):
+        """
+        Whether the field changed and a save with ``update_fields`` writes it.
+        """
+        if update_fields is not None and field_name not in update_fields:
+            return False
+        return field_name in self.get_dirty_fields()
+
+    def save(self, *args, **kwargs):
+        if not args and kwargs.get('update_fields') is None and not kwargs.get('force_insert') \
+                and not self._state.adding and hasattr(self, '_saved_state'):
+            dirty = self.get_dirty_fields()
+            if dirty:
+                # auto_now columns are only refreshed when they are written.
+                dirty += [field.name for field in self._meta.concrete_fields
+                          if getattr(field, 'auto_now', False) and field.name not in dirty]
+            kwargs['update_fields'] = dirty
+        super().save(*args, **kwargs)
+        state = self._field_state()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and hasattr(self, '_saved_state'):
+            written = {self._meta.get_field(name).attname for name in update_fields}
+            self._saved_state.update({name: value for name, value in state.items() if name in written})
+        else:
+            self._saved_state = state
+
+
+class Speciality(models.Model):
+    """
+    Lookup table of medical specialities. Read through the cached registry in
+    users.specialities rather than queried directly.
+    """
+    id = models.SmallAutoField(primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        verbose_name_plural = "Specialities"
+        ordering = ['id']
+
+    def __str__(self):
+        return self.name
+
+
+class Profile(DirtyFieldsMixin, models.Model):
+    speciality = models.ForeignKey(Speciality, on_delete=models.PROTECT, related_name='profiles', blank=True, null=True)
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     avatar = models.ImageField(default='default.jpg', upload_to='profile_images')
+    avatar_renditions = models.JSONField(default=dict, blank=True, editable=False)
     bio = models.TextField(blank=True)
     address_line1 = models.CharField(max_length=100, blank=True)
     city = models.CharField(max_length=30, blank=True)
@@ -28,19 +120,21 @@ class Profile(models.Model):
     ]
     user_type = models.CharField(max_length=10, choices=USER_TYPES, default='patient')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_type', 'speciality'], name='profile_type_speciality_idx'),
+        ]
+
     def __str__(self):
         return self.user.username
 
     def save(self, *args, **kwargs):
+        avatar_changed = self.has_changed('avatar', kwargs.get('update_fields'))
         super().save(*args, **kwargs)
-        if self.avatar and hasattr(self.avatar, 'path'):
-            img = Image.open(self.avatar.path)
-            if img.height > 100 or img.width > 100:
-                new_img_size = (100, 100)
-                img.thumbnail(new_img_size)
-                img.save(self.avatar.path)
-
-class Tweet(models.Model):
+        if avatar_changed:
+            ImageJob.enqueue(self, 'avatar')
+
+class Tweet(DirtyFieldsMixin, models.Model):
     BLOG_TYPES = [
         ('Mental Health', 'Mental Health'),
         ('Heart Disease', 'Heart Disease'),
@@ -53,43 +147,42 @@ class Tweet(models.Model):
     content = models.TextField(max_length=500)
     summary = models.TextField(max_length=250)
     photo = models.ImageField(upload_to='photos/', blank=True, null=True)
+    photo_renditions = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_draft = models.BooleanField(default=False)
 
+    # Published tweets are full-text indexed by triggers (SQLite) or a
+    # generated column (PostgreSQL) added in migration 0024, see users.search.
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_draft', 'category', 'created_at'], name='tweet_feed_category_idx'),
+            models.Index(fields=['is_draft', 'created_at'], name='tweet_feed_idx'),
+            models.Index(fields=['user', 'is_draft', 'created_at'], name='tweet_feed_author_idx'),
+        ]
+
     def __str__(self):
         return f'{self.title} - {self.summary[:15]}...'
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        if self.photo and hasattr(self.photo, 'path'):
-            img = Image.open(self.photo.path)
-            if img.height > 286 or img.width > 180:
-                new_img_size = (286, 180)
-                img.thumbnail(new_img_size)
-                img.save(self.photo.path)
-
-class DoctorProfile(models.Model):
-    SPECIALTIES = [
-        ('Cardiology', 'Cardiology'),
-        ('Dermatology', 'Dermatology'),
-        ('Neurology', 'Neurology'),
-        ('Pediatrics', 'Pediatrics'),
-        ('Ortho', 'Ortho'),
-        ('Trauma', 'Trauma'),
-        ('General Surgery', 'General Surgery')
-    ]
+        photo_changed = self.has_changed('photo', kwargs.get('update_fields'))
+        # The post_save signal updates the published counters in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        if photo_changed:
+            ImageJob.enqueue(self, 'photo')
+
+class DoctorProfile(DirtyFieldsMixin, models.Model):
     profile = models.OneToOneField(Profile, on_delete=models.CASCADE, limit_choices_to={'user_type': 'doctor'})
-    speciality = models.CharField(max_length=100, choices=SPECIALTIES)
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        if self.profile.avatar and hasattr(self.profile.avatar, 'path'):
-            img = Image.open(self.profile.avatar.path)
-            if img.height > 100 or img.width > 100:
-                new_img_size = (100, 100)
-                img.thumbnail(new_img_size)
-                img.save(self.profile.avatar.path)
+    @property
+    def speciality(self):
+        # Stored once on Profile so the two can't drift apart.
+        return self.profile.speciality
+
+    @speciality.setter
+    def speciality(self, value):
+        self.profile.speciality = value
 
     def __str__(self):
         return f'Dr. {self.profile.user.username} - {self.speciality}'
@@ -98,17 +191,7 @@ class DoctorProfile(models.Model):
 
 
 class Appointment(models.Model):
-    SPECIALTIES = [
-        ('Cardiology', 'Cardiology'),
-        ('Dermatology', 'Dermatology'),
-        ('Neurology', 'Neurology'),
-        ('Pediatrics', 'Pediatrics'),
-        ('Ortho', 'Ortho'),
-        ('Trauma', 'Trauma'),
-        ('General Surgery', 'General Surgery')
-    ]
-
-    speciality = models.CharField(max_length=100, choices=SPECIALTIES, verbose_name="Speciality")
+    speciality = models.ForeignKey(Speciality, on_delete=models.PROTECT, related_name='appointments', verbose_name="Speciality")
     patient = models.ForeignKey(User, related_name='patient_appointments', on_delete=models.CASCADE, verbose_name="Patient")
     doctor = models.ForeignKey(User, related_name='doctor_appointments', on_delete=models.CASCADE, verbose_name="Doctor")
     date = models.DateField(verbose_name="Appointment Date")
@@ -127,4 +210,285 @@ class Appointment(models.Model):
         super().save(*args, **kwargs)
         
     def __str__(self):
-        return f'Dr. {self.doctor} with Pt. {self.patient} at {self.date} {self.time}'
\ No newline at end of file
+        return f'Dr. {self.doctor} with Pt. {self.patient} at {self.date} {self.time}'
+
+
+class DoctorDirectoryEntry(models.Model):
+    """
+    Denormalised, read-only copy of each doctor's name and speciality used by
+    the doctor lookup on the booking page. Kept in sync by signals.
+    """
+    user = models.OneToOneField(User, primary_key=True, related_name='directory_entry', on_delete=models.CASCADE)
+    speciality = models.ForeignKey(Speciality, on_delete=models.CASCADE, related_name='+')
+    name = models.CharField(max_length=150)
+    search_name = models.CharField(max_length=150)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Doctor directory entries"
+        indexes = [
+            models.Index(fields=['speciality', 'search_name'], name='directory_speciality_name_idx'),
+        ]
+
+    def __str__(self):
+        return f'Dr. {self.name} - {self.speciality}'
+
+
+class SlotHold(models.Model):
+    """
+    Short-lived reservation of a doctor's slot while a patient confirms the
+    booking. The unique constraint makes reserving an atomic conditional insert.
+    """
+    doctor = models.ForeignKey(User, related_name='slot_holds', on_delete=models.CASCADE)
+    patient = models.ForeignKey(User, related_name='patient_slot_holds', on_delete=models.CASCADE)
+    date = models.DateField()
+    time = models.TimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('doctor', 'date', 'time')
+
+    def __str__(self):
+        return f'Hold on Dr. {self.doctor} at {self.date} {self.time} for {self.patient}'
+
+
+class BookingStats(models.Model):
+    """
+    Per-doctor booking contention counters.
+    """
+    doctor = models.OneToOneField(User, related_name='booking_stats', on_delete=models.CASCADE)
+    bookings = models.PositiveIntegerField(default=0)
+    conflicts = models.PositiveIntegerField(default=0)
+    expired_holds = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Booking stats"
+
+    def __str__(self):
+        return f'Dr. {self.doctor}: {self.bookings} booked, {self.conflicts} conflicts, {self.expired_holds} expired holds'
+
+
+class CategoryStats(models.Model):
+    """
+    Published tweets per category, kept current by users.counters so the
+    feed's category list doesn't scan the tweets.
+    """
+    category = models.CharField(max_length=50, unique=True)
+    published = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Category stats"
+
+    def __str__(self):
+        return f'{self.category}: {self.published} published'
+
+
+class AuthorStats(models.Model):
+    """
+    Published tweets per author, kept current by users.counters.
+    """
+    author = models.OneToOneField(User, related_name='tweet_stats', on_delete=models.CASCADE)
+    published = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Author stats"
+
+    def __str__(self):
+        return f'{self.author}: {self.published} published'
+
+
+class WorkingHours(models.Model):
+    """
+    Weekly template of the hours a doctor takes appointments, split into
+    slots of ``slot_minutes``. A doctor may have several blocks per weekday.
+    """
+    WEEKDAYS = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday')
+    ]
+
+    doctor = models.ForeignKey(User, related_name='working_hours', on_delete=models.CASCADE, limit_choices_to={'profile__user_type': 'doctor'})
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAYS)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30)
+
+    class Meta:
+        verbose_name_plural = "Working hours"
+        ordering = ['doctor', 'weekday', 'start_time']
+
+    def clean(self):
+        if self.start_time and self.end_time and self.start_time >= self.end_time:
+            raise ValidationError('Working hours must end after they start.')
+        if not self.slot_minutes:
+            raise ValidationError('Slot length must be at least one minute.')
+
+    def __str__(self):
+        return f'Dr. {self.doctor} {self.get_weekday_display()} {self.start_time}-{self.end_time}'
+
+
+class ImageJob(models.Model):
+    """
+    Database-backed queue of uploaded images waiting for their renditions to be
+    generated. Drained by the ``process_image_jobs`` management command.
+    """
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed')
+    ]
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.CharField(max_length=64)
+    content_object = GenericForeignKey('content_type', 'object_id')
+    field_name = models.CharField(max_length=50)
+    source_name = models.CharField(max_length=255)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='imagejob_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.source_name} ({self.status})'
+
+    @classmethod
+    def enqueue(cls, instance, field_name):
+        """
+        Queue rendition generation for an image field unless the stored
+        renditions already belong to the current file.
+        """
+        image = getattr(instance, field_name)
+        field = instance._meta.get_field(field_name)
+        renditions = getattr(instance, f'{field_name}_renditions')
+        if not image or image.name == field.default or renditions.get('source') == image.name:
+            return None
+        job, created = cls.objects.get_or_create(
+            content_type=ContentType.objects.get_for_model(instance),
+            object_id=str(instance.pk),
+            field_name=field_name,
+            source_name=image.name,
+            status=cls.PENDING,
+        )
+        return job
+
+
+class CalendarSync(models.Model):
+    """
+    Incremental sync state of a doctor's Google Calendar. ``sync_token`` is
+    the nextSyncToken of the last completed listing; empty means the next
+    sync lists the calendar in full.
+    """
+    doctor = models.OneToOneField(User, related_name='calendar_sync', on_delete=models.CASCADE)
+    calendar_id = models.CharField(max_length=255, default='primary')
+    sync_token = models.CharField(max_length=255, blank=True)
+    synced_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f'Dr. {self.doctor} ({self.calendar_id})'
+
+
+class CalendarEvent(models.Model):
+    """
+    Local mirror of one event of a doctor's Google Calendar, refreshed by the
+    ``sync_calendars`` command. Events pushed for an Appointment link back to it.
+    """
+    doctor = models.ForeignKey(User, related_name='calendar_events', on_delete=models.CASCADE)
+    calendar_id = models.CharField(max_length=255)
+    event_id = models.CharField(max_length=1024)
+    appointment = models.OneToOneField(Appointment, related_name='calendar_event', on_delete=models.SET_NULL, blank=True, null=True)
+    status = models.CharField(max_length=20, default='confirmed')
+    summary = models.CharField(max_length=255, blank=True)
+    description = models.TextField(blank=True)
+    start = models.DateTimeField(blank=True, null=True)
+    end = models.DateTimeField(blank=True, null=True)
+    all_day = models.BooleanField(default=False)
+    etag = models.CharField(max_length=64, blank=True)
+    updated = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ('doctor', 'calendar_id', 'event_id')
+        indexes = [
+            models.Index(fields=['doctor', 'start'], name='calendarevent_doctor_start_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.summary} ({self.start})'
+
+
+class OAuthToken(models.Model):
+    """
+    A user's Google OAuth credentials, encrypted at rest. Read and written
+    through users.tokens, which keeps decrypted access tokens in memory.
+    """
+    user = models.OneToOneField(User, related_name='oauth_token', on_delete=models.CASCADE)
+    access_token = models.TextField()
+    refresh_token = models.TextField(blank=True)
+    scopes = models.TextField(blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    refresh_failures = models.PositiveSmallIntegerField(default=0)
+    # Lease of the process refreshing the token, so only one of them calls Google.
+    refreshing_until = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.user} (expires {self.expires_at})'
+
+
+class OutboundEmail(models.Model):
+    """
+    Transactional outbox of emails. Rows are written in the same transaction
+    as the change they report and sent by the ``send_emails`` management
+    command; messages that keep failing are kept as DEAD for inspection.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead')
+    ]
+
+    to = models.EmailField(max_length=254)
+    from_email = models.CharField(max_length=254, blank=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    # Set for emails that must only ever be queued once, e.g. "reminder:<appointment id>".
+    dedupe_key = models.CharField(max_length=100, unique=True, blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outboundemail_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {self.to} ({self.status})'
@@ -0,0 +1,190 @@
+import datetime
+import logging
+import random
+import smtplib
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F
+from django.template import loader
+from django.utils import timezone
+
+from .models import Appointment, OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(to, subject, body, html_body='', from_email=None, dedupe_key=None):
+    """
+    Queue one email. Call it inside the transaction of the change the email
+    reports, so it is only sent if that change is committed.
+    """
+    return OutboundEmail.objects.create(
+        to=to, subject=subject, body=body, html_body=html_body or '',
+        from_email=from_email or '', dedupe_key=dedupe_key,
+    )
+
+
+def render_email(subject_template_name, email_template_name, context, html_email_template_name=None):
+    """
+    (subject, body, html_body) rendered from templates, with the subject
+    forced onto one line.
+    """
+    subject = ''.join(loader.render_to_string(subject_template_name, context).splitlines())
+    body = loader.render_to_string(email_template_name, context)
+    html_body = loader.render_to_string(html_email_template_name, context) if html_email_template_name else ''
+    return subject, body, html_body
+
+
+def appointment_email(appointment, kind):
+    """
+    Unsaved confirmation or reminder email to the patient of an appointment.
+    """
+    subject, body, _ = render_email(
+        f'users/appointment_{kind}_subject.txt', f'users/appointment_{kind}_email.txt', {'appointment': appointment}
+    )
+    return OutboundEmail(to=appointment.patient.email, subject=subject, body=body, dedupe_key=f'{kind}:{appointment.pk}')
+
+
+def queue_confirmation(appointment):
+    if appointment.patient.email:
+        appointment_email(appointment, 'confirmation').save()
+
+
+def queue_reminders(now=None):
+    """
+    Queue a reminder for every appointment starting within the next
+    APPOINTMENT_REMINDER_HOURS that hasn't had one. Returns how many were queued.
+    """
+    now = now or timezone.now()
+    until = now + datetime.timedelta(hours=settings.APPOINTMENT_REMINDER_HOURS)
+    tz = timezone.get_current_timezone()
+    candidates = (
+        Appointment.objects
+        .filter(date__gte=timezone.localdate(now), date__lte=timezone.localdate(until))
+        .exclude(patient__email='')
+        .select_related('patient', 'doctor', 'speciality')
+    )
+    due = [
+        appointment for appointment in candidates
+        if now < timezone.make_aware(datetime.datetime.combine(appointment.date, appointment.time), tz) <= until
+    ]
+    already = set(OutboundEmail.objects.filter(
+        dedupe_key__in=[f'reminder:{appointment.pk}' for appointment in due]
+    ).values_list('dedupe_key', flat=True))
+    emails = [appointment_email(appointment, 'reminder') for appointment in due
+              if f'reminder:{appointment.pk}' not in already]
+    # A reminder queued by another worker in the meantime is skipped by the unique key.
+    OutboundEmail.objects.bulk_create(emails, ignore_conflicts=True)
+    return len(emails)
+
+
+def claim(limit):
+    """
+    Move up to ``limit`` due emails to sending. The conditional UPDATE
+    guarantees an email is only claimed by one worker.
+    """
+    now = timezone.now()
+    due = (
+        OutboundEmail.objects
+        .filter(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+        .order_by('next_attempt_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+    claimed = []
+    for pk in list(due):
+        # next_attempt_at doubles as the claim time for requeue_stale().
+        updated = OutboundEmail.objects.filter(pk=pk, status=OutboundEmail.PENDING).update(
+            status=OutboundEmail.SENDING, attempts=F('attempts') + 1, next_attempt_at=now
+        )
+        if updated:
+            claimed.append(pk)
+    return claimed
+
+
+def requeue_stale():
+    """
+    Return emails left in sending by a worker that died back to the queue.
+    They may have gone out already; a duplicate beats a lost email.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.OUTBOX_STALE_AFTER)
+    return OutboundEmail.objects.filter(status=OutboundEmail.SENDING, next_attempt_at__lt=cutoff).update(
+        status=OutboundEmail.PENDING
+    )
+
+
+def retry_delay(attempts):
+    """
+    Exponential backoff with jitter, so a recovering mail server isn't hit
+    by every deferred email at once.
+    """
+    delay = min(settings.OUTBOX_RETRY_BASE * 2 ** (attempts - 1), settings.OUTBOX_RETRY_MAX)
+    return datetime.timedelta(seconds=delay * random.uniform(1, 1.25))
+
+
+def _message(email, connection):
+    message = EmailMultiAlternatives(
+        email.subject, email.body, email.from_email or settings.DEFAULT_FROM_EMAIL, [email.to], connection=connection
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def _permanent(exc):
+    # 5xx replies won't succeed on a retry; 4xx and dropped connections might.
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in exc.recipients.values())
+    return isinstance(exc, smtplib.SMTPResponseException) and exc.smtp_code >= 500
+
+
+def deliver(pks, connection):
+    """
+    Send claimed emails over one open SMTP connection. Each email that fails
+    is retried with backoff and moved to DEAD after OUTBOX_MAX_ATTEMPTS or a
+    permanent rejection. Returns (sent, retried, dead).
+    """
+    sent, retried, dead = [], 0, 0
+    for email in OutboundEmail.objects.filter(pk__in=pks, status=OutboundEmail.SENDING).order_by('pk'):
+        try:
+            connection.open()
+            connection.send_messages([_message(email, connection)])
+        except (smtplib.SMTPException, OSError) as exc:
+            if not isinstance(exc, (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)):
+                # The connection is in an unknown state; the next email reconnects.
+                connection.close()
+            email.last_error = f'{type(exc).__name__}: {exc}'[:1000]
+            if _permanent(exc) or email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                email.status = OutboundEmail.DEAD
+                dead += 1
+                logger.error('Giving up on email %s to %s: %s', email.pk, email.to, email.last_error)
+            else:
+                email.status = OutboundEmail.PENDING
+                email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+                retried += 1
+                logger.warning('Email %s to %s failed, retrying: %s', email.pk, email.to, email.last_error)
+            email.save(update_fields=['status', 'next_attempt_at', 'last_error'])
+        else:
+            sent.append(email.pk)
+    if sent:
+        OutboundEmail.objects.filter(pk__in=sent).update(status=OutboundEmail.SENT, sent_at=timezone.now(), last_error='')
+    return len(sent), retried, dead
+
+
+def drain(batch_size=None, connection=None):
+    """
+    Send everything that is due now. Returns (sent, retried, dead).
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    connection = connection or get_connection()
+    totals = [0, 0, 0]
+    try:
+        requeue_stale()
+        while True:
+            claimed = claim(batch_size)
+            if not claimed:
+                return tuple(totals)
+            for i, count in enumerate(deliver(claimed, connection)):
+                totals[i] += count
+    finally:
+        connection.close()
@@ -0,0 +1,171 @@
+import hashlib
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+RATELIMIT_CACHE_PREFIX = 'ratelimit'
+
+
+class LocalMemoryBackend:
+    """
+    Exact sliding log of hit times per key, kept in this process. Suits a
+    single worker; use CacheBackend when several processes serve logins.
+    """
+
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self._hits = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, now):
+        with self._lock:
+            hits = self._hits.setdefault(key, deque())
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return hits[0] + window - now
+            hits.append(now)
+            if len(self._hits) > self.MAX_KEYS:
+                self._prune(now, window)
+            return 0
+
+    def _prune(self, now, window):
+        for key in [key for key, hits in self._hits.items() if not hits or hits[-1] <= now - window]:
+            del self._hits[key]
+
+    def reset(self, key, window, now):
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+class CacheBackend:
+    """
+    Sliding window approximated from the counts of the current and previous
+    fixed windows, weighted by how much of the previous one still overlaps.
+    Counters use cache.add/incr, which are atomic on Redis and memcached.
+    """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def _keys(self, key, window, now):
+        current = int(now // window)
+        return f'{key}:{current}', f'{key}:{current - 1}'
+
+    def hit(self, key, limit, window, now):
+        current_key, previous_key = self._keys(key, window, now)
+        counts = self.cache.get_many([current_key, previous_key])
+        current, previous = counts.get(current_key, 0), counts.get(previous_key, 0)
+        remaining = window - now % window
+        if current >= limit:
+            return remaining
+        if previous * remaining / window + current >= limit:
+            # Wait until enough of the previous window has slid out.
+            return max(remaining - (limit - current) * window / previous, 1)
+        self.cache.add(current_key, 0, window * 2)
+        try:
+            self.cache.incr(current_key)
+        except ValueError:
+            # Evicted between add() and incr().
+            self.cache.set(current_key, 1, window * 2)
+        return 0
+
+    def reset(self, key, window, now):
+        self.cache.delete_many(self._keys(key, window, now))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if settings.RATELIMIT_BACKEND == 'cache':
+                    _backend = CacheBackend(settings.RATELIMIT_CACHE)
+                else:
+                    _backend = LocalMemoryBackend()
+    return _backend
+
+
+def client_ip(request):
+    """
+    The address of the client as seen by the outermost of the
+    RATELIMIT_TRUSTED_PROXIES proxies. Each proxy appends the address it
+    received the request from to X-Forwarded-For, so only the entries they
+    added can be trusted, counting from the right; anything to their left
+    is whatever the client sent.
+    """
+    value = request.META.get(settings.RATELIMIT_IP_HEADER) or request.META.get('REMOTE_ADDR', '')
+    entries = [entry.strip() for entry in value.split(',')]
+    return entries[max(len(entries) - max(settings.RATELIMIT_TRUSTED_PROXIES, 1), 0)]
+
+
+def _key(scope, kind, value):
+    digest = hashlib.sha1(value.encode()).hexdigest()
+    return f'{RATELIMIT_CACHE_PREFIX}:{scope}:{kind}:{digest}'
+
+
+def _values(request, identity):
+    ip = client_ip(request)
+    identity = identity.strip().lower()
+    return {'ip': ip, 'account': identity, 'account_ip': f'{identity}|{ip}' if identity else ''}
+
+
+def check(request, scope, identity):
+    """
+    Count an attempt against the ``scope`` limits in RATELIMITS, keyed by
+    client IP, by ``identity`` (a username or email) and by the identity
+    from that IP. Returns 0 if the attempt is allowed, otherwise the
+    seconds until it would be.
+    """
+    if not settings.RATELIMIT_ENABLED:
+        return 0
+    backend = get_backend()
+    now = time.time()
+    values = _values(request, identity)
+    for kind, (limit, window) in settings.RATELIMITS[scope].items():
+        if values[kind]:
+            retry_after = backend.hit(_key(scope, kind, values[kind]), limit, window, now)
+            if retry_after:
+                return retry_after
+    return 0
+
+
+def reset(request, scope, identity):
+    """
+    Clear the client's per-account counter, e.g. after a successful login.
+    The global per-account counter is kept, so guesses spread over many
+    addresses still add up.
+    """
+    limit, window = settings.RATELIMITS[scope]['account_ip']
+    get_backend().reset(_key(scope, 'account_ip', _values(request, identity)['account_ip']), window, time.time())
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse('Too many attempts. Please try again later.', status=429, content_type='text/plain')
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+class RateLimitMixin:
+    """
+    Reject POSTs over the ``rate_limit_scope`` limits with a 429 before the
+    form is validated, so the password hasher never runs for them.
+    """
+    rate_limit_scope = None
+    rate_limit_field = 'username'
+
+    def post(self, request, *args, **kwargs):
+        retry_after = check(request, self.rate_limit_scope, request.POST.get(self.rate_limit_field, ''))
+        if retry_after:
+            return too_many_requests(retry_after)
+        return super().post(request, *args, **kwargs)
@@ -0,0 +1,81 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .directory import sync_doctors
+from .hashers import get_executor, make_password_pooled
+from .models import DoctorProfile, Profile
+
+PROFILE_FIELDS = ['address_line1', 'city', 'state', 'pincode', 'bio']
+
+
+def _build(username, email, user_type='patient', speciality=None, first_name='', last_name='', avatar=None,
+           **profile_fields):
+    user = User(username=username, email=email, first_name=first_name, last_name=last_name)
+    profile = Profile(
+        user=user,
+        user_type=user_type,
+        speciality=speciality if user_type == 'doctor' else None,
+        **{name: value for name, value in profile_fields.items() if name in PROFILE_FIELDS and value},
+    )
+    if avatar:
+        profile.avatar = avatar
+    return user, profile
+
+
+def register(username, email, password, **fields):
+    """
+    Create a user with their Profile, and DoctorProfile for doctors, in one
+    transaction: one INSERT per table, the doctor's directory entry and at
+    most one image job for the avatar. The password is hashed once, on the
+    hashing pool, before the transaction starts.
+    """
+    user, profile = _build(username, email, **fields)
+    user.password = make_password_pooled(password)
+    with transaction.atomic():
+        # Saved by the create_profile signal in place of a blank profile.
+        user._new_profile = profile
+        user.save()
+        if profile.user_type == 'doctor':
+            DoctorProfile.objects.create(profile=profile)
+    return user
+
+
+def bulk_register(members, batch_size=500):
+    """
+    Register many users at once, e.g. a clinic's staff and patients.
+    ``members`` are dicts of register() arguments. A ``password_hash``,
+    e.g. from an export, is stored as is; members with neither get an
+    unusable password and can set theirs through a password reset. Rows
+    are inserted with bulk_create, which sends no signals, so the
+    directory entries of the new doctors are written here as well.
+    Returns the created users.
+    """
+    passwords = get_executor().map(make_password, [
+        None if member.get('password_hash') else member.get('password') or None for member in members
+    ])
+    built = [
+        _build(**{key: value for key, value in member.items() if key not in ('password', 'password_hash')})
+        for member in members
+    ]
+    users = []
+    for (user, profile), member, password in zip(built, members, passwords):
+        user.password = member.get('password_hash') or password
+        users.append(user)
+
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=batch_size)
+        if any(user.pk is None for user in users):
+            # Backends that can't return the ids of inserted rows.
+            ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'pk'))
+            for user in users:
+                user.pk = ids[user.username]
+        profiles = []
+        for user, profile in built:
+            profile.user = user
+            profiles.append(profile)
+        Profile.objects.bulk_create(profiles, batch_size=batch_size)
+        doctors = [profile for profile in profiles if profile.user_type == 'doctor']
+        DoctorProfile.objects.bulk_create([DoctorProfile(profile=profile) for profile in doctors], batch_size=batch_size)
+        sync_doctors(doctors, batch_size)
+    return users
@@ -0,0 +1,195 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Tweet
+
+# The triggers that keep the SQLite index of migration 0024 current. It is an
+# external content index: the text stays in users_tweet and snippet() reads
+# it from there, and the index is told the old values of each row it drops.
+# Only published tweets are indexed. Used to restore them after a table
+# rebuild; migration 0024 keeps its own copy of the statements.
+SQLITE_TRIGGERS = {
+    'users_tweet_search_insert': """
+        CREATE TRIGGER IF NOT EXISTS users_tweet_search_insert AFTER INSERT ON users_tweet
+        WHEN NOT new.is_draft BEGIN
+            INSERT INTO users_tweet_search (rowid, title, summary, content)
+            VALUES (new.id, new.title, new.summary, new.content);
+        END
+    """,
+    'users_tweet_search_delete': """
+        CREATE TRIGGER IF NOT EXISTS users_tweet_search_delete AFTER DELETE ON users_tweet
+        WHEN NOT old.is_draft BEGIN
+            INSERT INTO users_tweet_search (users_tweet_search, rowid, title, summary, content)
+            VALUES ('delete', old.id, old.title, old.summary, old.content);
+        END
+    """,
+    # Edits and publishing; one trigger so the old row is always dropped before the new one is added.
+    'users_tweet_search_update': """
+        CREATE TRIGGER IF NOT EXISTS users_tweet_search_update
+        AFTER UPDATE OF title, summary, content, is_draft ON users_tweet
+        WHEN NOT old.is_draft OR NOT new.is_draft BEGIN
+            INSERT INTO users_tweet_search (users_tweet_search, rowid, title, summary, content)
+            SELECT 'delete', old.id, old.title, old.summary, old.content WHERE NOT old.is_draft;
+            INSERT INTO users_tweet_search (rowid, title, summary, content)
+            SELECT new.id, new.title, new.summary, new.content WHERE NOT new.is_draft;
+        END
+    """,
+}
+
+SQLITE_REINDEX = [
+    "INSERT INTO users_tweet_search (users_tweet_search) VALUES ('delete-all')",
+    """
+    INSERT INTO users_tweet_search (rowid, title, summary, content)
+    SELECT id, title, summary, content FROM users_tweet WHERE NOT is_draft
+    """,
+]
+
+# Placed around matched words by the database, and turned into <mark> tags
+# once the rest of the snippet has been escaped.
+MATCH_START, MATCH_END = '\x02', '\x03'
+
+# Ranking scores every match, so it is limited to the newest
+# SEARCH_RANK_WINDOW matches, which the index lists without scoring them.
+SQLITE_SEARCH = f"""
+    SELECT rowid, bm25(users_tweet_search, 10.0, 4.0, 1.0) AS score,
+           snippet(users_tweet_search, -1, '{MATCH_START}', '{MATCH_END}', '…', 24)
+    FROM users_tweet_search
+    WHERE users_tweet_search MATCH %s AND rowid >= (
+        SELECT min(rowid) FROM (
+            SELECT rowid FROM users_tweet_search WHERE users_tweet_search MATCH %s ORDER BY rowid DESC LIMIT %s
+        )
+    )
+    ORDER BY score, rowid DESC
+    LIMIT %s OFFSET %s
+"""
+
+# ts_headline is slow, so it only runs on the rows of the page.
+POSTGRES_SEARCH = f"""
+    SELECT id, score, ts_headline('english', summary || ' ' || content, query,
+                                  'StartSel={MATCH_START}, StopSel={MATCH_END}, MinWords=15, MaxWords=30')
+    FROM (
+        SELECT id, summary, content, query, ts_rank(search_vector, query) AS score
+        FROM (
+            SELECT id, summary, content, search_vector, query
+            FROM users_tweet, to_tsquery('english', %s) query
+            WHERE NOT is_draft AND search_vector @@ query
+            ORDER BY id DESC
+            LIMIT %s
+        ) recent
+        ORDER BY score DESC, id DESC
+        LIMIT %s OFFSET %s
+    ) hits
+    ORDER BY score DESC, id DESC
+"""
+
+
+def terms(query):
+    """
+    The words of a search box query. Operators and quotes are dropped, so
+    no input can make the full-text query invalid.
+    """
+    return re.findall(r'\w+', query.lower())[:settings.SEARCH_MAX_TERMS]
+
+
+def highlight(snippet):
+    return mark_safe(escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>'))
+
+
+def index_available():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def missing_search_triggers(connection):
+    """
+    Names of the SQLITE_TRIGGERS missing from a SQLite database that has
+    the search index. A migration that rebuilds users_tweet, as SQLite
+    does for most column changes, drops them.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE (type = 'table' AND name = 'users_tweet_search') "
+            "OR (type = 'trigger' AND tbl_name = 'users_tweet')"
+        )
+        found = {name for name, in cursor.fetchall()}
+    if 'users_tweet_search' not in found:
+        return []
+    return [name for name in SQLITE_TRIGGERS if name not in found]
+
+
+def create_search_triggers(apps, schema_editor):
+    """
+    Re-create the missing index triggers and reindex, for a RunPython
+    operation after any migration that rebuilds users_tweet on SQLite.
+    Does nothing on other databases.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or not missing_search_triggers(connection):
+        return
+    for statement in SQLITE_TRIGGERS.values():
+        schema_editor.execute(statement)
+    # Tweets written while the triggers were missing aren't indexed.
+    for statement in SQLITE_REINDEX:
+        schema_editor.execute(statement)
+
+
+def _match_expression(words):
+    # Every word must match, in any of its stemmed forms.
+    if connection.vendor == 'sqlite':
+        return ' '.join(f'"{word}"' for word in words)
+    return ' & '.join(words)
+
+
+def _indexed_hits(words, offset, limit):
+    match = _match_expression(words)
+    if connection.vendor == 'sqlite':
+        sql, params = SQLITE_SEARCH, [match, match, settings.SEARCH_RANK_WINDOW, limit, offset]
+    else:
+        sql, params = POSTGRES_SEARCH, [match, settings.SEARCH_RANK_WINDOW, limit, offset]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(pk, snippet) for pk, _, snippet in cursor.fetchall()]
+
+
+def _scan_hits(words, offset, limit):
+    tweets = Tweet.objects.filter(is_draft=False)
+    for word in words:
+        tweets = tweets.filter(Q(title__icontains=word) | Q(summary__icontains=word) | Q(content__icontains=word))
+    rows = tweets.order_by('-created_at', '-pk').values_list('pk', 'summary')[offset:offset + limit]
+    pattern = re.compile('|'.join(re.escape(word) for word in words), re.IGNORECASE)
+    return [(pk, pattern.sub(lambda m: f'{MATCH_START}{m.group()}{MATCH_END}', summary)) for pk, summary in rows]
+
+
+def search_tweets(query, page=1, page_size=None, indexed=None):
+    """
+    One page of the published tweets matching every word of ``query``,
+    best matches first among the newest SEARCH_RANK_WINDOW matches, each
+    with a highlighted ``snippet``. Uses the full-text index of migration
+    0024 on SQLite and PostgreSQL and an icontains scan, newest first,
+    elsewhere or with ``indexed=False``.
+    Returns (tweets, next_page).
+    """
+    page_size = page_size or settings.SEARCH_PAGE_SIZE
+    words = terms(query)
+    if not words or not 1 <= page <= settings.SEARCH_MAX_PAGES:
+        return [], None
+    if indexed is None:
+        indexed = index_available()
+    fetch = _indexed_hits if indexed else _scan_hits
+    # One extra row tells whether there is a next page.
+    hits = fetch(words, (page - 1) * page_size, page_size + 1)
+    next_page = page + 1 if len(hits) > page_size and page < settings.SEARCH_MAX_PAGES else None
+
+    hits = hits[:page_size]
+    tweets = Tweet.objects.select_related('user').filter(is_draft=False).in_bulk([pk for pk, _ in hits])
+    results = []
+    for pk, snippet in hits:
+        if pk in tweets:
+            tweet = tweets[pk]
+            tweet.snippet = highlight(snippet)
+            results.append(tweet)
+    return results, next_page
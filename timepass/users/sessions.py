@@ -0,0 +1,76 @@
+import copy
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+from .instrumentation import registry
+
+
+class SessionStore(CachedDBStore):
+    """
+    cached_db sessions that are served from the cache on the hot path,
+    skip the write when a request marked the session modified without
+    changing it, and count loads, DB reads and writes for /metrics.
+    """
+
+    def load(self):
+        registry.increment('session_loads')
+        data = super().load()
+        self._loaded = copy.deepcopy(data)
+        return data
+
+    def _get_session_from_db(self):
+        registry.increment('session_db_reads')
+        return super()._get_session_from_db()
+
+    def clear(self):
+        # Also called by flush(); the loaded data no longer describes the session.
+        super().clear()
+        self._loaded = None
+
+    def _unchanged(self):
+        """
+        Whether saving would write back exactly what was loaded. A session
+        flushed or expired since, whose cache entry is gone, is written so
+        that the database reports it as interrupted.
+        """
+        return (
+            not settings.SESSION_SAVE_EVERY_REQUEST
+            and getattr(self, '_loaded', None) == self._session
+            and self._cache.has_key(self.cache_key)
+        )
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            # Goes through create(), which calls back with must_create=True.
+            return super().save(must_create)
+        if not must_create and self._unchanged():
+            registry.increment('session_writes_skipped')
+            return
+        registry.increment('session_writes')
+        super().save(must_create)
+        self._loaded = copy.deepcopy(self._session)
+
+    @classmethod
+    def clear_expired(cls):
+        purge_expired()
+
+
+def purge_expired(batch_size=1000, pause=0.0):
+    """
+    Delete expired sessions in batches of ``batch_size`` so each DELETE
+    holds the write lock only briefly. Returns the number deleted.
+    """
+    deleted = 0
+    now = timezone.now()
+    while True:
+        keys = list(Session.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        count, _ = Session.objects.filter(session_key__in=keys).delete()
+        deleted += count
+        if pause:
+            time.sleep(pause)
@@ -1,13 +1,94 @@
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Profile
+from .models import Profile, Tweet, Appointment, DoctorProfile, DoctorDirectoryEntry, Speciality
+from . import counters, specialities
+from .feed import invalidate_feed_cache
+from .directory import sync_doctor
+from .utlis import invalidate_next_appointments
+from .instrumentation import install_query_timer
+from .outbox import queue_confirmation
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
     if created:
-        Profile.objects.create(user=instance)
+        # users.registration hands over a filled-in profile to insert instead of a blank one.
+        profile = getattr(instance, '_new_profile', None) or Profile(user=instance)
+        profile.user = instance
+        profile.save(force_insert=True)
+
+# User columns shown through the profile, in the doctor directory.
+PROFILE_USER_FIELDS = {'username', 'first_name', 'last_name'}
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
+def save_profile(sender, instance, created, update_fields=None, **kwargs):
+    # A new user's profile was saved by create_profile a moment ago, and saves
+    # of other columns, like the last_login update on every login, don't touch it.
+    if created or (update_fields is not None and not PROFILE_USER_FIELDS.intersection(update_fields)):
+        return
+    profile = instance.profile
+    if profile.get_dirty_fields():
+        profile.save()
+    elif profile.user_type == 'doctor':
+        # Nothing to write, but the directory entry may show the old name.
+        sync_doctor(profile)
+
+@receiver(post_save, sender=Tweet)
+@receiver(post_delete, sender=Tweet)
+def refresh_feed_cache(sender, instance, **kwargs):
+    # After the commit, so a concurrent request can't cache the old counters again.
+    transaction.on_commit(invalidate_feed_cache)
+
+@receiver(pre_save, sender=Tweet)
+def read_replaced_tweet(sender, instance, **kwargs):
+    counters.tweet_saving(instance)
+
+@receiver(post_save, sender=Tweet)
+def count_published_tweet(sender, instance, created, update_fields=None, **kwargs):
+    counters.tweet_saved(instance, created, update_fields)
+
+@receiver(post_delete, sender=Tweet)
+def uncount_published_tweet(sender, instance, **kwargs):
+    counters.tweet_deleted(instance)
+
+@receiver(post_save, sender=Profile)
+def sync_doctor_directory(sender, instance, **kwargs):
+    sync_doctor(instance)
+
+@receiver(post_save, sender=DoctorProfile)
+def sync_doctor_directory_from_doctor_profile(sender, instance, **kwargs):
+    sync_doctor(instance.profile)
+
+@receiver(post_delete, sender=Profile)
+def remove_from_doctor_directory(sender, instance, **kwargs):
+    DoctorDirectoryEntry.objects.filter(user_id=instance.user_id).delete()
+
+@receiver(post_save, sender=Speciality)
+@receiver(post_delete, sender=Speciality)
+def reload_specialities(sender, **kwargs):
+    specialities.clear()
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def refresh_next_appointments(sender, instance, **kwargs):
+    invalidate_next_appointments(instance.patient_id, instance.doctor_id)
+
+@receiver(post_save, sender=Appointment)
+def send_appointment_confirmation(sender, instance, created, **kwargs):
+    # Queued in the booking's transaction, so no email for a booking that is rolled back.
+    if created:
+        queue_confirmation(instance)
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    install_query_timer(connection)
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite' and settings.SQLITE_PRAGMAS:
+        with connection.cursor() as cursor:
+            for name, value in settings.SQLITE_PRAGMAS.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,70 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Speciality
+
+_registry = None
+_lock = threading.Lock()
+
+
+def _expired(registry):
+    return registry is None or time.monotonic() >= registry['expires']
+
+
+def _load():
+    """
+    Load every speciality, at most once per SPECIALITIES_CACHE_SECONDS per
+    process. The table is tiny and rarely changes; Speciality signals clear
+    the registry of the process that changed it and the others reload it
+    once it expires.
+    """
+    global _registry
+    if _expired(_registry):
+        with _lock:
+            if _expired(_registry):
+                rows = list(Speciality.objects.order_by('id'))
+                _registry = {
+                    'ordered': rows,
+                    'by_id': {row.pk: row for row in rows},
+                    'by_name': {row.name: row for row in rows},
+                    'expires': time.monotonic() + settings.SPECIALITIES_CACHE_SECONDS,
+                }
+    return _registry
+
+
+def clear():
+    global _registry
+    _registry = None
+
+
+def all_specialities():
+    return _load()['ordered']
+
+
+def choices():
+    return [(speciality.pk, speciality.name) for speciality in all_specialities()]
+
+
+def get(pk):
+    """
+    Speciality with primary key ``pk`` (an int or numeric string), or None.
+    """
+    try:
+        return _load()['by_id'].get(int(pk))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_by_name(name):
+    return _load()['by_name'].get(name)
+
+
+def resolve(value):
+    """
+    Look a speciality up by id or, for older clients, by name.
+    """
+    if value in (None, ''):
+        return None
+    return get(value) if str(value).isdigit() else get_by_name(value)
@@ -0,0 +1,62 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+
+from users.images import CONTENT_TYPES
+
+register = template.Library()
+
+
+def get_renditions(image):
+    """
+    Rendition metadata stored alongside an image field, e.g. Tweet.photo_renditions.
+    Metadata of a file that has since been replaced is ignored.
+    """
+    if not image:
+        return {}
+    metadata = getattr(image.instance, f'{image.field.name}_renditions', None) or {}
+    if metadata.get('source') != image.name:
+        return {}
+    return metadata
+
+
+def build_srcset(renditions, fmt):
+    candidates = sorted(
+        (variants[fmt] for variants in renditions.values() if fmt in variants),
+        key=lambda variant: variant['width'],
+    )
+    return ', '.join(f'{default_storage.url(v["name"])} {v["width"]}w' for v in candidates)
+
+
+@register.simple_tag
+def responsive_image(image, rendition, sizes='100vw', **attrs):
+    """
+    Render an uploaded image as a <picture> with AVIF/WebP srcsets and the
+    intrinsic size of ``rendition``, using only the stored rendition metadata.
+    Images that have not been processed yet fall back to the original file.
+
+        {% responsive_image tweet.photo 'card' sizes='(min-width: 768px) 33vw, 100vw' class='card-img-top' alt=tweet.title %}
+    """
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    renditions = get_renditions(image).get('renditions', {})
+    default = renditions.get(rendition)
+    if not default:
+        return format_html('<img src="{}"{}>', image.url, flatatt(attrs))
+
+    # The last configured format is the most widely supported one and is used for <img>.
+    formats = list(default)
+    fallback = default[formats[-1]]
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((CONTENT_TYPES[fmt], build_srcset(renditions, fmt), sizes) for fmt in formats),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" width="{}" height="{}"{}></picture>',
+        sources,
+        default_storage.url(fallback['name']),
+        fallback['width'],
+        fallback['height'],
+        flatatt(attrs),
+    )
@@ -0,0 +1,55 @@
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.test import TestCase
+from django.urls import reverse
+
+from . import specialities
+from .models import Appointment, Speciality
+
+
+class BookAppointmentQueryCountTests(TestCase):
+    """
+    book_appointment runs a fixed number of queries however many doctors
+    the speciality has. The counts include savepoint statements.
+    """
+    GET_QUERIES = 3
+    POST_QUERIES = 18
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.speciality = Speciality.objects.create(name='Query Count')
+        cls.patient = User.objects.create_user('querycount-patient')
+
+    def setUp(self):
+        # Process-wide caches would otherwise make the first test run more queries.
+        specialities.clear()
+        ContentType.objects.clear_cache()
+        for cache in caches.all():
+            cache.clear()
+        self.client.force_login(self.patient)
+
+    def add_doctors(self, count):
+        for i in range(count):
+            doctor = User.objects.create_user(f'querycount-doctor-{i}', first_name='Doctor', last_name=str(i))
+            doctor.profile.user_type = 'doctor'
+            doctor.profile.speciality = self.speciality
+            doctor.profile.save()
+        return doctor
+
+    def assert_query_counts(self, doctors):
+        doctor = self.add_doctors(doctors)
+        url = reverse('book_appointment')
+        with self.assertNumQueries(self.GET_QUERIES):
+            self.client.get(url)
+        with self.assertNumQueries(self.POST_QUERIES):
+            response = self.client.post(url, {'speciality': self.speciality.pk, 'doctor': doctor.pk,
+                                              'date': '2099-01-05', 'time': '10:00'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Appointment.objects.filter(patient=self.patient, doctor=doctor).exists())
+
+    def test_five_doctors(self):
+        self.assert_query_counts(5)
+
+    def test_fifty_doctors(self):
+        self.assert_query_counts(50)
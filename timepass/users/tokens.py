@@ -0,0 +1,306 @@
+import base64
+import datetime
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import requests
+from cryptography.fernet import Fernet, MultiFernet
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .instrumentation import registry
+from .models import OAuthToken
+
+logger = logging.getLogger(__name__)
+
+
+class TokenUnavailable(Exception):
+    """
+    The user has no stored credentials, or they could not be refreshed.
+    """
+
+
+@functools.lru_cache(maxsize=None)
+def get_fernet():
+    """
+    Encrypts with the first of TOKEN_ENCRYPTION_KEYS and decrypts with any of
+    them, so keys can be rotated. Falls back to a key derived from SECRET_KEY.
+    """
+    keys = settings.TOKEN_ENCRYPTION_KEYS or [
+        base64.urlsafe_b64encode(hashlib.sha256(settings.SECRET_KEY.encode()).digest())
+    ]
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+def encrypt(value):
+    return get_fernet().encrypt(value.encode()).decode() if value else ''
+
+
+def decrypt(value):
+    return get_fernet().decrypt(value.encode()).decode() if value else ''
+
+
+@functools.lru_cache(maxsize=None)
+def client_credentials():
+    """
+    (client_id, client_secret) of the Google OAuth client, from the
+    environment or from GOOGLE_CLIENT_SECRET_FILE.
+    """
+    if settings.GOOGLE_CLIENT_ID:
+        return settings.GOOGLE_CLIENT_ID, settings.GOOGLE_CLIENT_SECRET
+    with open(settings.GOOGLE_CLIENT_SECRET_FILE) as f:
+        config = json.load(f)
+    client = config.get('web') or config['installed']
+    return client['client_id'], client['client_secret']
+
+
+# Decrypted access tokens of this process: user id -> (token, expires_at).
+_cache = {}
+# Refreshes in progress in this process: user id -> Future of the new token.
+_inflight = {}
+_lock = threading.Lock()
+# Seconds between re-reads of a token another process is refreshing.
+LEASE_POLL_INTERVAL = 0.2
+
+
+def _remember(user_id, token, expires_at):
+    with _lock:
+        _cache[user_id] = (token, expires_at)
+
+
+def forget(user_id):
+    with _lock:
+        _cache.pop(user_id, None)
+
+
+def store_credentials(user, access_token, expires_at, refresh_token='', scopes=()):
+    """
+    Save credentials obtained from the OAuth flow. An empty refresh_token
+    keeps the stored one, as Google only returns it on first consent.
+    """
+    defaults = {'access_token': encrypt(access_token), 'expires_at': expires_at, 'refresh_failures': 0}
+    if refresh_token:
+        defaults['refresh_token'] = encrypt(refresh_token)
+    if scopes:
+        defaults['scopes'] = ' '.join(scopes)
+    OAuthToken.objects.update_or_create(user=user, defaults=defaults)
+    _remember(user.pk, access_token, expires_at)
+
+
+def get_access_token(user_id):
+    """
+    A valid access token for the user. Served from memory until it is within
+    TOKEN_RELOAD_MARGIN seconds of expiring, then re-read from the database,
+    where the background refresher will normally have renewed it already.
+    Only when it hasn't is the token refreshed here, once per user no matter
+    how many threads ask for it at the same time.
+    """
+    start_refresher()
+    margin = datetime.timedelta(seconds=settings.TOKEN_RELOAD_MARGIN)
+    now = timezone.now()
+    cached = _cache.get(user_id)
+    if cached and cached[1] - now > margin:
+        return cached[0]
+
+    row = OAuthToken.objects.filter(user_id=user_id).first()
+    if row is None:
+        raise TokenUnavailable(f'No stored credentials for user {user_id}')
+    if row.expires_at - now > margin:
+        token = decrypt(row.access_token)
+        _remember(user_id, token, row.expires_at)
+        return token
+    registry.increment('oauth_inline_refreshes')
+    return refresh(user_id, settings.TOKEN_RELOAD_MARGIN)
+
+
+def refresh(user_id, margin=0):
+    """
+    Refresh the user's access token unless it has more than ``margin``
+    seconds left. Concurrent callers in this process wait for the first
+    one's result instead of refreshing again, and other processes wait
+    for the lease on the row (see _claim).
+    """
+    with _lock:
+        future = _inflight.get(user_id)
+        leader = future is None
+        if leader:
+            future = _inflight[user_id] = Future()
+    if not leader:
+        try:
+            return future.result(timeout=settings.TOKEN_REFRESH_LEASE + settings.GOOGLE_CALENDAR_TIMEOUT)
+        except FutureTimeout:
+            raise TokenUnavailable(f'Timed out waiting for the token refresh of user {user_id}') from None
+    try:
+        token = _refresh(user_id, margin)
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    else:
+        future.set_result(token)
+        return token
+    finally:
+        with _lock:
+            _inflight.pop(user_id, None)
+
+
+def _valid_token(row, margin):
+    """
+    The decrypted access token of ``row`` if it has more than ``margin``
+    seconds left, else None.
+    """
+    if row.expires_at - timezone.now() > datetime.timedelta(seconds=margin):
+        token = decrypt(row.access_token)
+        _remember(row.user_id, token, row.expires_at)
+        return token
+    return None
+
+
+def _claim(user_id, margin):
+    """
+    Take the refresh lease of the user's token. Returns (row, lease) for
+    the caller to refresh, or (row, None) with a token renewed meanwhile.
+    While another process holds the lease, waits for it to write the
+    renewed token or for the lease to run out.
+    """
+    # Any lease taken by another process has run out by then.
+    deadline = time.monotonic() + settings.TOKEN_REFRESH_LEASE + 1
+    while True:
+        row = OAuthToken.objects.filter(user_id=user_id).first()
+        if row is None:
+            raise TokenUnavailable(f'No stored credentials for user {user_id}')
+        if _valid_token(row, margin) is not None:
+            return row, None
+        if not row.refresh_token:
+            raise TokenUnavailable(f'No refresh token for user {user_id}')
+        now = timezone.now()
+        lease = now + datetime.timedelta(seconds=settings.TOKEN_REFRESH_LEASE)
+        # Claimed only over the token that was read and once any other lease has run out.
+        claimed = OAuthToken.objects.filter(
+            Q(refreshing_until__isnull=True) | Q(refreshing_until__lt=now),
+            user_id=user_id, access_token=row.access_token,
+        ).update(refreshing_until=lease)
+        if claimed:
+            return row, lease
+        if time.monotonic() >= deadline:
+            raise TokenUnavailable(f'Timed out waiting for the token refresh of user {user_id}')
+        time.sleep(LEASE_POLL_INTERVAL)
+
+
+def _refresh(user_id, margin):
+    row, lease = _claim(user_id, margin)
+    if lease is None:
+        return _valid_token(row, margin)
+    leased = OAuthToken.objects.filter(user_id=user_id, refreshing_until=lease)
+    try:
+        token, expires_at, refresh_token = _request_token(row)
+    except TokenUnavailable:
+        leased.update(refresh_failures=F('refresh_failures') + 1, refreshing_until=None)
+        registry.increment('oauth_refresh_failures')
+        raise
+    except BaseException:
+        leased.update(refreshing_until=None)
+        raise
+
+    changes = {'access_token': encrypt(token), 'expires_at': expires_at, 'refresh_failures': 0,
+               'refreshing_until': None, 'updated_at': timezone.now()}
+    if refresh_token:
+        changes['refresh_token'] = encrypt(refresh_token)
+    # Written only over the token that was read; credentials stored
+    # meanwhile, e.g. after a new consent, are kept instead.
+    if not leased.filter(access_token=row.access_token).update(**changes):
+        leased.update(refreshing_until=None)
+        row = OAuthToken.objects.filter(user_id=user_id).first()
+        token = row and _valid_token(row, 0)
+        if not token:
+            raise TokenUnavailable(f'The credentials of user {user_id} changed during the refresh')
+        return token
+    registry.increment('oauth_token_refreshes')
+    _remember(user_id, token, expires_at)
+    return token
+
+
+def _request_token(row):
+    """
+    Exchange the refresh token of ``row`` for a new access token. Returns
+    (access_token, expires_at, refresh_token), the last one only when
+    Google issued a new one.
+    """
+    client_id, client_secret = client_credentials()
+    requested_at = timezone.now()
+    try:
+        response = requests.post(settings.GOOGLE_TOKEN_URI, timeout=settings.GOOGLE_CALENDAR_TIMEOUT, data={
+            'grant_type': 'refresh_token',
+            'refresh_token': decrypt(row.refresh_token),
+            'client_id': client_id,
+            'client_secret': client_secret,
+        })
+    except requests.RequestException as exc:
+        raise TokenUnavailable(f'Refreshing the token of user {row.user_id} failed: {exc}') from exc
+    if response.status_code != 200:
+        raise TokenUnavailable(
+            f'Refreshing the token of user {row.user_id} failed: {response.status_code}: {response.text[:200]}'
+        )
+    data = response.json()
+    expires_at = requested_at + datetime.timedelta(seconds=int(data['expires_in']))
+    return data['access_token'], expires_at, data.get('refresh_token', '')
+
+
+def refresh_expiring(margin=None):
+    """
+    Refresh every stored token that expires within ``margin`` seconds
+    (TOKEN_REFRESH_MARGIN by default). Returns (refreshed, failed).
+    """
+    margin = settings.TOKEN_REFRESH_MARGIN if margin is None else margin
+    user_ids = (
+        OAuthToken.objects.filter(
+            expires_at__lte=timezone.now() + datetime.timedelta(seconds=margin),
+            refresh_failures__lt=settings.TOKEN_MAX_REFRESH_FAILURES,
+        )
+        .exclude(refresh_token='')
+        .values_list('user_id', flat=True)
+    )
+    refreshed = failed = 0
+    for user_id in list(user_ids):
+        try:
+            refresh(user_id, margin)
+            refreshed += 1
+        except TokenUnavailable as exc:
+            logger.warning('%s', exc)
+            failed += 1
+    return refreshed, failed
+
+
+_refresher = None
+
+
+def start_refresher():
+    """
+    Start the in-process refresher thread when TOKEN_BACKGROUND_REFRESH is
+    on. Processes that can't keep threads alive between requests should run
+    `manage.py refresh_oauth_tokens --loop` instead.
+    """
+    global _refresher
+    if _refresher is not None or not settings.TOKEN_BACKGROUND_REFRESH:
+        return
+    with _lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=_refresh_forever, name='oauth-token-refresher', daemon=True)
+            _refresher.start()
+
+
+def _refresh_forever():
+    while True:
+        try:
+            refresh_expiring()
+        except Exception:
+            logger.exception('Background token refresh failed')
+        finally:
+            close_old_connections()
+        time.sleep(settings.TOKEN_REFRESH_INTERVAL)
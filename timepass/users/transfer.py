@@ -0,0 +1,310 @@
+import csv
+import itertools
+import json
+import shutil
+import zipfile
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+
+from . import specialities
+from .counters import recount
+from .directory import sync_doctors
+from .feed import invalidate_feed_cache
+from .models import Appointment, DoctorProfile, Profile, Tweet
+from .registration import bulk_register
+from .utlis import invalidate_next_appointments
+
+FORMATS = ['ndjson', 'csv']
+
+
+def guess_format(path):
+    return 'csv' if str(path).lower().endswith('.csv') else 'ndjson'
+
+
+def parse_bool(value):
+    return value if isinstance(value, bool) else str(value).strip().lower() in ('1', 'true', 'yes')
+
+
+def _speciality_name(speciality_id):
+    speciality = specialities.get(speciality_id)
+    return speciality.name if speciality else ''
+
+
+def _users_by_name(usernames):
+    return dict(User.objects.filter(username__in=set(usernames)).values_list('username', 'pk'))
+
+
+def _create_dated(model, objs, fields, batch_size):
+    """
+    bulk_create ``objs``, keeping the exported values of their auto_now(_add)
+    ``fields``: bulk_create stamps those with the current time, so they are
+    written back afterwards with bulk_update, which leaves them alone.
+    """
+    exported = [[getattr(obj, field) for field in fields] for obj in objs]
+    model.objects.bulk_create(objs, batch_size=batch_size)
+    dated = []
+    for obj, values in zip(objs, exported):
+        if obj.pk and all(values):
+            for field, value in zip(fields, values):
+                setattr(obj, field, value)
+            dated.append(obj)
+    model.objects.bulk_update(dated, fields, batch_size=batch_size)
+
+
+class Dataset:
+    """
+    How one kind of record is exported and imported. Users and specialities
+    are referred to by username and name, since ids differ between
+    environments. ``parsers`` turn the strings read from CSV (and the dates
+    of NDJSON) back into Python values.
+    """
+    columns = []
+    parsers = {}
+    media_fields = []
+
+    def queryset(self):
+        raise NotImplementedError
+
+    def row(self, obj):
+        raise NotImplementedError
+
+    def load(self, rows, batch_size):
+        """
+        Write one batch of parsed rows. Returns (created, updated, skipped).
+        """
+        raise NotImplementedError
+
+    def parse(self, row):
+        parsed = {}
+        for column in self.columns:
+            value = row.get(column)
+            if value == '' or value is None:
+                value = None
+            elif column in self.parsers and isinstance(value, str):
+                value = self.parsers[column](value)
+            parsed[column] = value
+        return parsed
+
+
+class TweetDataset(Dataset):
+    columns = ['username', 'title', 'category', 'content', 'summary', 'photo', 'is_draft', 'created_at', 'updated_at']
+    parsers = {'is_draft': parse_bool, 'created_at': parse_datetime, 'updated_at': parse_datetime}
+    media_fields = ['photo']
+
+    def queryset(self):
+        return Tweet.objects.select_related('user').order_by('pk')
+
+    def row(self, tweet):
+        return {
+            'username': tweet.user.username, 'title': tweet.title, 'category': tweet.category,
+            'content': tweet.content, 'summary': tweet.summary, 'photo': tweet.photo.name or '',
+            'is_draft': tweet.is_draft, 'created_at': tweet.created_at.isoformat(),
+            'updated_at': tweet.updated_at.isoformat(),
+        }
+
+    def load(self, rows, batch_size):
+        users = _users_by_name(row['username'] for row in rows)
+        # A tweet is identified by its author and creation time, so importing
+        # the same file twice doesn't duplicate it.
+        existing = set(Tweet.objects.filter(
+            user_id__in=users.values(), created_at__in=[row['created_at'] for row in rows if row['created_at']]
+        ).values_list('user_id', 'created_at'))
+        tweets = []
+        for row in rows:
+            user_id = users.get(row['username'])
+            if user_id is None or (user_id, row['created_at']) in existing:
+                continue
+            tweets.append(Tweet(
+                user_id=user_id, title=row['title'] or '', category=row['category'] or '',
+                content=row['content'] or '', summary=row['summary'] or '', photo=row['photo'] or None,
+                is_draft=bool(row['is_draft']), created_at=row['created_at'], updated_at=row['updated_at'],
+            ))
+        _create_dated(Tweet, tweets, ['created_at', 'updated_at'], batch_size)
+        if tweets:
+            # bulk_create sends no signals, so the counters are recomputed for what changed.
+            published = [tweet for tweet in tweets if not tweet.is_draft]
+            recount(categories={tweet.category for tweet in published},
+                    author_ids={tweet.user_id for tweet in published})
+            invalidate_feed_cache()
+        return len(tweets), 0, len(rows) - len(tweets)
+
+
+class ProfileDataset(Dataset):
+    """
+    Users with their Profile and, for doctors, DoctorProfile. Password
+    hashes are exported, so migrated users keep their passwords.
+    """
+    columns = ['username', 'email', 'first_name', 'last_name', 'password_hash', 'user_type', 'speciality',
+               'bio', 'address_line1', 'city', 'state', 'pincode', 'avatar']
+    media_fields = ['avatar']
+    profile_fields = ['user_type', 'speciality', 'bio', 'address_line1', 'city', 'state', 'pincode', 'avatar']
+
+    def queryset(self):
+        return Profile.objects.select_related('user').order_by('user_id')
+
+    def row(self, profile):
+        user = profile.user
+        return {
+            'username': user.username, 'email': user.email, 'first_name': user.first_name,
+            'last_name': user.last_name, 'password_hash': user.password, 'user_type': profile.user_type,
+            'speciality': _speciality_name(profile.speciality_id), 'bio': profile.bio,
+            'address_line1': profile.address_line1, 'city': profile.city, 'state': profile.state,
+            'pincode': profile.pincode, 'avatar': profile.avatar.name or '',
+        }
+
+    def load(self, rows, batch_size):
+        existing = {
+            profile.user.username: profile
+            for profile in Profile.objects.select_related('user').filter(user__username__in=[row['username'] for row in rows])
+        }
+        new, profiles, users = [], [], []
+        for row in rows:
+            speciality = specialities.get_by_name(row['speciality']) if row['speciality'] else None
+            values = {key: value or '' for key, value in row.items()}
+            values.update(user_type=row['user_type'] or 'patient', speciality=speciality, avatar=row['avatar'])
+            profile = existing.get(row['username'])
+            if profile is None:
+                new.append(values)
+                continue
+            user = profile.user
+            user.email, user.first_name, user.last_name = values['email'], values['first_name'], values['last_name']
+            for field in self.profile_fields:
+                setattr(profile, field, values[field] or Profile._meta.get_field(field).get_default())
+            if profile.user_type != 'doctor':
+                profile.speciality = None
+            users.append(user)
+            profiles.append(profile)
+
+        created = bulk_register(new, batch_size) if new else []
+        User.objects.bulk_update(users, ['email', 'first_name', 'last_name'], batch_size=batch_size)
+        Profile.objects.bulk_update(profiles, self.profile_fields, batch_size=batch_size)
+        DoctorProfile.objects.bulk_create(
+            [DoctorProfile(profile=profile) for profile in profiles if profile.user_type == 'doctor'],
+            batch_size=batch_size, ignore_conflicts=True,
+        )
+        DoctorProfile.objects.filter(profile__in=[profile for profile in profiles if profile.user_type != 'doctor']).delete()
+        sync_doctors(profiles, batch_size)
+        return len(created), len(profiles), 0
+
+
+class AppointmentDataset(Dataset):
+    columns = ['patient', 'doctor', 'speciality', 'date', 'time', 'created_at']
+    parsers = {'date': parse_date, 'time': parse_time, 'created_at': parse_datetime}
+
+    def queryset(self):
+        return Appointment.objects.select_related('patient', 'doctor').order_by('pk')
+
+    def row(self, appointment):
+        return {
+            'patient': appointment.patient.username, 'doctor': appointment.doctor.username,
+            'speciality': _speciality_name(appointment.speciality_id), 'date': appointment.date.isoformat(),
+            'time': appointment.time.isoformat(), 'created_at': appointment.created_at.isoformat(),
+        }
+
+    def load(self, rows, batch_size):
+        users = _users_by_name(itertools.chain.from_iterable((row['patient'], row['doctor']) for row in rows))
+        # The (doctor, date, time) slot identifies an appointment.
+        taken = set(Appointment.objects.filter(
+            doctor_id__in=[users[row['doctor']] for row in rows if row['doctor'] in users],
+            date__in={row['date'] for row in rows},
+        ).values_list('doctor_id', 'date', 'time'))
+        appointments = []
+        for row in rows:
+            speciality = specialities.get_by_name(row['speciality'] or '')
+            doctor_id, patient_id = users.get(row['doctor']), users.get(row['patient'])
+            slot = (doctor_id, row['date'], row['time'])
+            if not (doctor_id and patient_id and speciality and row['date'] and row['time']) or slot in taken:
+                continue
+            taken.add(slot)
+            appointments.append(Appointment(
+                patient_id=patient_id, doctor_id=doctor_id, speciality=speciality,
+                date=row['date'], time=row['time'], created_at=row['created_at'],
+            ))
+        _create_dated(Appointment, appointments, ['created_at'], batch_size)
+        invalidate_next_appointments(*{user_id for a in appointments for user_id in (a.patient_id, a.doctor_id)})
+        return len(appointments), 0, len(rows) - len(appointments)
+
+
+DATASETS = {
+    'tweets': TweetDataset,
+    'profiles': ProfileDataset,
+    'appointments': AppointmentDataset,
+}
+
+
+def write_rows(dataset, rows, stream, fmt):
+    """
+    Write row dicts to a text stream as they come. Returns how many were written.
+    """
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=dataset.columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            stream.write(json.dumps(row, ensure_ascii=False))
+            stream.write('\n')
+            count += 1
+    return count
+
+
+def read_rows(stream, fmt, offset=0):
+    """
+    Iterate over the row dicts of a text stream, skipping the first ``offset``.
+    """
+    rows = csv.DictReader(stream) if fmt == 'csv' else (json.loads(line) for line in stream if line.strip())
+    return itertools.islice(rows, offset, None)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def load_batch(dataset, rows, batch_size):
+    with transaction.atomic():
+        return dataset.load([dataset.parse(row) for row in rows], batch_size)
+
+
+class MediaBundle:
+    """
+    Zip archive of the media files referenced by exported rows, copied
+    to and from the default storage one file at a time.
+    """
+
+    def __init__(self, path, mode):
+        self.zip = zipfile.ZipFile(path, mode, compression=zipfile.ZIP_STORED, allowZip64=True)
+        self.missing = 0
+
+    def add(self, name):
+        if not name or name in self.zip.NameToInfo:
+            return
+        if not default_storage.exists(name):
+            self.missing += 1
+            return
+        # Images are already compressed, so they are stored as is.
+        with default_storage.open(name, 'rb') as source, self.zip.open(name, 'w', force_zip64=True) as target:
+            shutil.copyfileobj(source, target)
+
+    def extract(self):
+        """
+        Copy every file missing from the storage into it. Returns how many were copied.
+        """
+        copied = 0
+        for info in self.zip.infolist():
+            if info.is_dir() or default_storage.exists(info.filename):
+                continue
+            with self.zip.open(info) as source:
+                default_storage.save(info.filename, source)
+            copied += 1
+        return copied
+
+    def close(self):
+        self.zip.close()
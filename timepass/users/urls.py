@@ -1,5 +1,6 @@
 from django.urls import path
 from .views import *
+from .utlis import lazy_view
 
 urlpatterns = [
     path('', home, name='home'),
@@ -10,12 +11,20 @@ urlpatterns = [
     path('tweet/delete/<int:tweet_id>/', tweet_delete, name='tweet_delete'),
     path('tweet/view/<int:tweet_id>/', tweet_view, name='tweet_view'),
     path('tweet/draft/', tweet_draft, name='tweet_draft'),
+    path('tweet/feed/', tweet_feed, name='tweet_feed'),
+    path('tweet/search/', tweet_search, name='tweet_search'),
+    path('tweet/category/<slug:slug>/', category_feed, name='category_feed'),
+    path('tweet/author/<str:username>/', author_feed, name='author_feed'),
     path('book-appointment/', book_appointment, name='book_appointment'),
     path('confirm-appointment/<int:appointment_id>/', confirm_appointment, name='confirm_appointment'),
+    path('available-slots/', available_slots, name='available_slots'),
+    path('slot-holds/', reserve_slot, name='reserve_slot'),
+    path('slot-holds/<int:hold_id>/confirm/', confirm_slot, name='confirm_slot'),
     path('get-doctors-by-speciality/', get_doctors_by_speciality, name='get_doctors_by_speciality'),
-    path('calendar/', CalendarView.as_view(), name='calendar'),
+    path('calendar/', lazy_view('users.calendar_views.CalendarView', is_async=True), name='calendar'),
     path('logout/', logout_view, name='logout'),
     path('scheduled-calls/', scheduled_calls, name='scheduled_calls'),
     path('upcoming-appointments/', upcoming_appointments, name='upcoming_appointments'),
+    path('metrics/', metrics, name='metrics'),
 
 ]
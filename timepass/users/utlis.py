@@ -1,39 +1,102 @@
+import datetime
+import functools
+
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import caches
+from django.db.models import Min, Q
 from django.utils import timezone
-from datetime import datetime
+from django.utils.module_loading import import_string
 from .models import Appointment
+
+NEXT_APPOINTMENT_CACHE_PREFIX = 'appointments:next'
+
+
+def next_appointment_cache_key(user_id):
+    return f'{NEXT_APPOINTMENT_CACHE_PREFIX}:{user_id}'
+
+
+def invalidate_next_appointments(*user_ids):
+    caches[settings.NEXT_APPOINTMENT_CACHE].delete_many([next_appointment_cache_key(user_id) for user_id in user_ids])
+
+
+def next_appointment_dates(user):
+    """
+    Return {'patient': date, 'doctor': date} with the user's next appointment
+    date in each role, or None. Kept in the cache until an appointment of the
+    user changes, for at most NEXT_APPOINTMENT_CACHE_SECONDS and never past
+    local midnight, when a cached date may have passed.
+    """
+    cache = caches[settings.NEXT_APPOINTMENT_CACHE]
+    key = next_appointment_cache_key(user.pk)
+    dates = cache.get(key)
+    if dates is None:
+        today = timezone.localdate()
+        dates = Appointment.objects.filter(Q(patient=user) | Q(doctor=user), date__gte=today).aggregate(
+            patient=Min('date', filter=Q(patient=user)),
+            doctor=Min('date', filter=Q(doctor=user)),
+        )
+        midnight = timezone.make_aware(datetime.datetime.combine(today + datetime.timedelta(days=1), datetime.time()))
+        timeout = min(settings.NEXT_APPOINTMENT_CACHE_SECONDS, (midnight - timezone.now()).total_seconds())
+        cache.set(key, dates, max(int(timeout), 1))
+    return dates
+
+
 def has_upcoming_appointments(user_profile):
     """
     Check if the given user profile (patient) has upcoming appointments.
     """
     if user_profile.user_type == 'patient':
-        return Appointment.objects.filter(
-            patient=user_profile.user,
-            date__gte=timezone.now().date()
-        ).exists()
+        return next_appointment_dates(user_profile.user)['patient'] is not None
     return False
 
-from django.utils import timezone
 
 def has_scheduled_calls(user_profile):
     """
     Check if the given user profile (doctor) has scheduled calls.
     """
     if user_profile.user_type == 'doctor':
-        now = timezone.now().date()  # Get the current date in the server timezone
-        # Print debug info
-        print(f"Checking for doctor: {user_profile.user.username}")
-        print(f"Current date: {now}")
-        
-        # Query appointments
-        appointments = Appointment.objects.filter(
-            doctor=user_profile.user,
-            date__gte=now
-        )
-        
-        # Debug output
-        print(f"Found appointments: {appointments}")
-        
-        # Return whether any future appointments exist
-        return appointments.exists()
+        return next_appointment_dates(user_profile.user)['doctor'] is not None
     return False
 
+
+def lazy_view(dotted_path, is_async=False):
+    """
+    URLconf entry for a view that is imported on its first request, so heavy
+    optional integrations stay off the cold-start path. Class-based views
+    are turned into view functions with as_view(). Pass is_async for async
+    views, as Django has to know before the import how to call the entry.
+    """
+    view = None
+
+    def load():
+        nonlocal view
+        if view is None:
+            loaded = import_string(dotted_path)
+            view = loaded.as_view() if isinstance(loaded, type) else loaded
+        return view
+
+    if is_async:
+        async def wrapper(request, *args, **kwargs):
+            return await load()(request, *args, **kwargs)
+    else:
+        def wrapper(request, *args, **kwargs):
+            return load()(request, *args, **kwargs)
+
+    wrapper.__name__ = wrapper.__qualname__ = dotted_path.rsplit('.', 1)[-1]
+    wrapper.__module__ = dotted_path.rsplit('.', 1)[0]
+    return wrapper
+
+
+def async_login_required(view):
+    """
+    login_required for async views, which Django's decorator only accepts
+    from 5.1 on. Loads the user without blocking and stores it on request.user.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
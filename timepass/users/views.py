@@ -1,59 +1,121 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views import View
-from django.utils.decorators import method_decorator
-from django.contrib.auth.views import LoginView, PasswordResetView, PasswordChangeView
+from django.contrib.auth.views import LoginView, PasswordChangeView
 from django.contrib.messages.views import SuccessMessageMixin
 from .forms import *
 from .models import *
-from oauth2_provider.views.generic import ProtectedResourceView
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-import datetime
-import pytz
-from django.http import HttpResponse
+from django.http import HttpResponse, FileResponse, Http404
 from django.http import JsonResponse
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_time
+from django.utils.http import parse_etags, quote_etag, urlencode
+from django.views.decorators.http import require_POST, require_safe
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+import mimetypes
+import re
 from .utlis import *
+from .feed import category_slugs, get_author_count, get_blog_types, get_feed_page
+from .search import search_tweets
+from .availability import find_free_slots
+from . import booking
+from .directory import asearch_doctors, get_version as get_directory_version
+from . import specialities
+from .instrumentation import registry as metrics_registry
+from . import ratelimit
+from .ratelimit import RateLimitMixin
 
 def home(request):
-    user = request.user
-    blog_types = Tweet.objects.values_list('category', flat=True).distinct()
+    blog_types = get_blog_types()
     selected_blog_type = request.GET.get('blog_type')
-    
-    if selected_blog_type:
-        tweets = Tweet.objects.filter(category=selected_blog_type, is_draft=False).order_by('created_at')
-    else:
-        tweets = Tweet.objects.filter(is_draft=False).order_by('created_at')
-    
-    has_upcoming_appointments_flag = False
-    has_scheduled_calls_flag = False
-    
-    if user.is_authenticated:
-        try:
-            profile = user.profile
-            print(f"Profile: {profile}")  # Debugging print
-            # Check if the profile has upcoming appointments or scheduled calls
-            has_upcoming_appointments_flag = has_upcoming_appointments(request.user.profile)
-            has_scheduled_calls_flag = has_scheduled_calls(request.user.profile)
-        except Profile.DoesNotExist:
-            print("Profile does not exist")  # Debugging print
+
+    try:
+        tweets, next_cursor = get_feed_page(selected_blog_type, request.GET.get('cursor'))
+    except ValueError:
+        tweets, next_cursor = get_feed_page(selected_blog_type)
     
     context = {
         'tweets': tweets,
+        'next_cursor': next_cursor,
         'blog_types': blog_types,
         'selected_blog_type': selected_blog_type,
-        'has_upcoming_appointments': has_upcoming_appointments_flag,
-        'has_scheduled_calls': has_scheduled_calls_flag,
     }
     
     return render(request, 'users/tweet_list.html', context)
 
 
+def _feed_page(request, title, published, category=None, author_id=None, feed_query=''):
+    try:
+        tweets, next_cursor = get_feed_page(category, request.GET.get('cursor'), author_id=author_id)
+    except ValueError:
+        tweets, next_cursor = get_feed_page(category, author_id=author_id)
+    context = {
+        'title': title,
+        'published': published,
+        'tweets': tweets,
+        'next_cursor': next_cursor,
+        'feed_query': feed_query,
+    }
+    return render(request, 'users/tweet_feed.html', context)
+
+
+def category_feed(request, slug):
+    category = category_slugs().get(slug)
+    published = dict(get_blog_types()).get(category)
+    if not published:
+        raise Http404('No published tweets in this category')
+    return _feed_page(request, category, published, category=category,
+                      feed_query=urlencode({'blog_type': category}))
+
+
+def author_feed(request, username):
+    author = get_object_or_404(User, username=username)
+    return _feed_page(request, author.get_full_name() or author.username, get_author_count(author.pk),
+                      author_id=author.pk, feed_query=urlencode({'author': author.pk}))
+
+
+def tweet_feed(request):
+    """
+    Next page of the public feed, or of an author's tweets, for infinite
+    scroll, as rendered card fragments.
+    """
+    try:
+        author_id = int(request.GET.get('author') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid author'}, status=400)
+    try:
+        tweets, next_cursor = get_feed_page(request.GET.get('blog_type'), request.GET.get('cursor'),
+                                            author_id=author_id)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    html = render_to_string('users/tweet_cards.html', {'tweets': tweets}, request=request)
+    return JsonResponse({'html': html, 'next_cursor': next_cursor})
+
+
+def tweet_search(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 1
+    tweets, next_page = search_tweets(query, page)
+    context = {
+        'query': query,
+        'tweets': tweets,
+        'page': page,
+        'next_page': next_page,
+    }
+    return render(request, 'users/tweet_search.html', context)
+
+
 class RegisterView(View):
     form_class = RegisterForm
     initial = {'key': 'value'}
@@ -77,17 +139,23 @@ class RegisterView(View):
             return redirect('login')
         return render(request, self.template_name, {'form': form})
 
-class CustomLoginView(LoginView):
+class CustomLoginView(RateLimitMixin, LoginView):
     form_class = LoginForm
+    rate_limit_scope = 'login'
 
     def form_valid(self, form):
+        ratelimit.reset(self.request, self.rate_limit_scope, form.cleaned_data['username'])
         remember_me = form.cleaned_data.get('remember_me')
         if not remember_me:
             self.request.session.set_expiry(0)
-            self.request.session.modified = True
         return super().form_valid(form)
 
-class ResetPasswordView(SuccessMessageMixin, PasswordResetView):
+class ResetPasswordView(View):
+    """
+    Password reset submission as an async view. The emails are only queued
+    (see ResetPasswordForm), so the response never waits on the mail server.
+    """
+    rate_limit_scope = 'password_reset'
     template_name = 'users/password_reset.html'
     email_template_name = 'users/password_reset_email.html'
     subject_template_name = 'users/password_reset_subject.txt'
@@ -97,6 +165,29 @@ class ResetPasswordView(SuccessMessageMixin, PasswordResetView):
                        "please make sure you've entered the address you registered with, and check your spam folder.")
     success_url = reverse_lazy('home')
 
+    async def get(self, request, *args, **kwargs):
+        return await self.render_form(ResetPasswordForm())
+
+    async def post(self, request, *args, **kwargs):
+        retry_after = await sync_to_async(ratelimit.check)(request, self.rate_limit_scope, request.POST.get('email', ''))
+        if retry_after:
+            return ratelimit.too_many_requests(retry_after)
+        form = ResetPasswordForm(request.POST)
+        if not form.is_valid():
+            return await self.render_form(form)
+        await sync_to_async(form.save)(
+            request=request,
+            use_https=request.is_secure(),
+            email_template_name=self.email_template_name,
+            subject_template_name=self.subject_template_name,
+        )
+        messages.success(request, self.success_message)
+        return redirect(self.success_url)
+
+    async def render_form(self, form):
+        # Context processors may query the database, so render off the event loop.
+        return await sync_to_async(render)(self.request, self.template_name, {'form': form})
+
 class ChangePasswordView(SuccessMessageMixin, PasswordChangeView):
     template_name = 'users/change_password.html'
     success_message = "Successfully Changed Your Password"
@@ -219,30 +310,111 @@ def book_appointment(request):
         if form.is_valid():
             appointment = form.save(commit=False)
             appointment.patient = request.user
-            appointment.save()
-            return redirect('confirm_appointment', appointment_id=appointment.id)
+            try:
+                booking.book(appointment)
+            except booking.SlotUnavailable as exc:
+                form.add_error('time', str(exc))
+            else:
+                return redirect('confirm_appointment', appointment_id=appointment.id)
     else:
         form = AppointmentForm(user=request.user)
     
     return render(request, 'users/book_appointment.html', {'form': form})
 
+def _slot_conflict_response(exc):
+    alternative = None
+    if exc.alternative:
+        alternative = {'date': exc.alternative[0].isoformat(), 'time': exc.alternative[1].strftime('%H:%M')}
+    return JsonResponse({'error': str(exc), 'alternative': alternative}, status=409)
+
+@login_required
+@require_POST
+def reserve_slot(request):
+    """
+    Hold a slot for the current patient while they confirm the booking.
+    """
+    try:
+        doctor_id = int(request.POST['doctor']) if request.POST.get('doctor') else None
+        date = parse_date(request.POST.get('date', ''))
+        time = parse_time(request.POST.get('time', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid doctor, date or time'}, status=400)
+    doctor = doctor_id and User.objects.filter(pk=doctor_id, profile__user_type='doctor').first()
+    if not (doctor and date and time):
+        return JsonResponse({'error': 'A doctor, date and time are required'}, status=400)
+    try:
+        hold = booking.reserve_slot(request.user, doctor, date, time)
+    except booking.SlotUnavailable as exc:
+        return _slot_conflict_response(exc)
+    return JsonResponse({'hold_id': hold.pk, 'expires_at': hold.expires_at.isoformat()}, status=201)
+
 @login_required
-def get_doctors_by_speciality(request):
-    speciality = request.GET.get('speciality')
-    doctors = User.objects.filter(profile__user_type='doctor', profile__speciality=speciality)
-    doctor_list = [{'id': doctor.id, 'name': doctor.get_full_name()} for doctor in doctors]
-    return JsonResponse(doctor_list, safe=False)
+@require_POST
+def confirm_slot(request, hold_id):
+    try:
+        appointment = booking.confirm_hold(hold_id, request.user)
+    except booking.HoldExpired as exc:
+        return JsonResponse({'error': str(exc)}, status=410)
+    except booking.SlotUnavailable as exc:
+        return _slot_conflict_response(exc)
+    return JsonResponse({
+        'appointment_id': appointment.pk,
+        'url': reverse('confirm_appointment', args=[appointment.pk]),
+    }, status=201)
+
+def _directory_params(request):
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    speciality = specialities.resolve(request.GET.get('speciality'))
+    return speciality.pk if speciality else None, request.GET.get('q', '').strip(), page
+
+def _directory_request(request):
+    speciality, prefix, page = _directory_params(request)
+    etag = quote_etag(f'{get_directory_version(speciality)}:{prefix.lower()}:{page}')
+    return speciality, prefix, page, etag
+
+@async_login_required
+async def get_doctors_by_speciality(request):
+    """
+    Doctors of a speciality from the directory read model, filtered by name
+    prefix and paginated. Unchanged pages revalidate with a 304.
+    """
+    speciality, prefix, page, etag = await sync_to_async(_directory_request)(request)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    doctors, next_page = await asearch_doctors(speciality, prefix, page)
+    response = JsonResponse({'results': doctors, 'next_page': next_page})
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+@login_required
+def available_slots(request):
+    """
+    Free slots for every doctor of a speciality over a date range, optionally
+    narrowed to one doctor, for the booking page.
+    """
+    speciality = specialities.resolve(request.GET.get('speciality'))
+    try:
+        start = parse_date(request.GET.get('start', '')) or timezone.localdate()
+        end = parse_date(request.GET.get('end', '')) or start
+        doctor_id = int(request.GET['doctor']) if request.GET.get('doctor') else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date or doctor'}, status=400)
+    if speciality is None:
+        return JsonResponse({'error': 'Unknown speciality'}, status=400)
+    if end < start or (end - start).days >= settings.AVAILABILITY_MAX_DAYS:
+        return JsonResponse({'error': f'Date range must cover 1 to {settings.AVAILABILITY_MAX_DAYS} days'}, status=400)
+    return JsonResponse(find_free_slots(speciality, start, end, doctor_id=doctor_id), safe=False)
 
 @login_required
 def confirm_appointment(request, appointment_id):
     appointment = Appointment.objects.get(id=appointment_id)
     return render(request, 'users/confirm_appointment.html', {'appointment': appointment})
 
-class CalendarView(ProtectedResourceView):
-    @method_decorator(login_required)
-    def get(self, request, *args, **kwargs):
-        return HttpResponse("This is your calendar view")
-    
 @login_required
 def scheduled_calls(request):
     profile = request.user.profile
@@ -276,3 +448,93 @@ def upcoming_appointments(request):
         'appointments': appointments
     }
     return render(request, 'users/upcoming_appointments.html', context)
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE_MEDIA_PREFIX = 'renditions/'
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header into (start, end) inclusive offsets.
+    Returns None when the header should be ignored and raises ValueError
+    when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    else:
+        start, end = max(size - int(end), 0), size - 1
+    if start > end or start >= size:
+        raise ValueError('Unsatisfiable range')
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve uploaded media with ETag revalidation and byte ranges. Renditions
+    live under content-addressed paths and are cached as immutable.
+    """
+    try:
+        if not default_storage.exists(path):
+            raise Http404('Media file not found')
+        size = default_storage.size(path)
+        modified = default_storage.get_modified_time(path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('Media file not found')
+
+    if path.startswith(IMMUTABLE_MEDIA_PREFIX):
+        etag = quote_etag(path[len(IMMUTABLE_MEDIA_PREFIX):].replace('/', '-'))
+        cache_control = f'public, max-age={settings.MEDIA_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        etag = quote_etag(f'{int(modified.timestamp())}-{size}')
+        cache_control = 'public, max-age=0, must-revalidate'
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        return response
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if range_header and request.headers.get('If-Range', etag) == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range:
+        start, end = byte_range
+        with default_storage.open(path, 'rb') as fh:
+            fh.seek(start)
+            response = HttpResponse(fh.read(end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        response = FileResponse(default_storage.open(path, 'rb'), content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+
+@require_safe
+def metrics(request):
+    """
+    Request metrics in the Prometheus text format. Disabled unless
+    METRICS_ENABLED is set; requires a bearer token when METRICS_TOKEN is.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+        return HttpResponse(status=403)
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')